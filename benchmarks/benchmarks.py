@@ -0,0 +1,207 @@
+import importlib.util
+import json
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator
+
+from benchmarks.generators import (generate_fv_coverage, generate_land_use, generate_pv_installations,
+                                   generate_ree_data_payload, generate_ree_demanda_payload)
+from benchmarks.ree_server import REEStandInServer
+from benchmarks.suite import benchmark
+from pv_stats.analyze_pv_installation import analyze_pv_installation
+from pv_stats.config.config import settings
+from pv_stats.land_use import filter_and_group_land_use_per_id
+from pv_stats.map_electricity_coverage import process_fv_coverage
+from pv_stats.ree import ree_api, ree_demanda_api
+from pv_stats.ree.decoding import JSON_BACKENDS, decode_jsonp
+from pv_stats.ree.retrieval import retrieve_demand, retrieve_generation
+from pv_stats.ree.storage import HourlyStore
+from pv_stats.utils.io_utils import read_dataframe, read_geo_dataframe, save_dataframe, save_geo_dataframe
+
+
+@contextmanager
+def _changed_settings(changes: dict) -> Iterator[None]:
+    """ Change the settings of a benchmark and restore the previous values when it ends. """
+    previous = {key: settings.get(key) for key in changes}
+    for key, value in changes.items():
+        settings.set(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            settings.set(key, value)
+
+
+@benchmark('ree_data.parse_response')
+def ree_data_parse_response(sizes: dict, working_folder: Path) -> Callable:
+    payload = generate_ree_data_payload(sizes['ree_days'])
+    return lambda: ree_api.parse_response(payload)
+
+
+@benchmark('ree_demanda.decode_and_parse_response')
+def ree_demanda_parse_response(sizes: dict, working_folder: Path) -> Callable:
+    date = datetime(2023, 3, 1)
+    payload = generate_ree_demanda_payload(date).encode('utf-8')
+
+    def decode_and_parse():
+        # Same decoding of the raw JSONP response as `REEDemandaAPI.get_data`
+        return ree_demanda_api.parse_response(decode_jsonp(payload), date)
+
+    return decode_and_parse
+
+
+def _large_jsonp_payload(sizes: dict) -> bytes:
+    # Hourly values of many technologies, wrapped in the callback of the REE demand API
+    data = generate_ree_data_payload(sizes['ree_days'], n_series=24)
+    return f'angular.callbacks._0({json.dumps(data)});'.encode('utf-8')
+
+
+@benchmark('ree.decode_jsonp.text_slice')
+def ree_decode_jsonp_text_slice(sizes: dict, working_folder: Path) -> Callable:
+    payload = _large_jsonp_payload(sizes)
+
+    def decode():
+        # Decoding of the text of the response, sliced and parsed with the standard library
+        text = payload.decode('utf-8')
+        return json.loads(text[text.find('(') + 1:text.rfind(')')])
+
+    return decode
+
+
+def _register_decoding_benchmark(backend: str) -> None:
+
+    @benchmark(f'ree.decode_jsonp.{backend}')
+    def decode(sizes: dict, working_folder: Path) -> Callable:
+        payload = _large_jsonp_payload(sizes)
+        return lambda: decode_jsonp(payload, backend)
+
+
+@contextmanager
+def _ree_stand_in() -> Iterator[REEStandInServer]:
+    """ Serve the REE stand-in during a benchmark, with the clients pointed at it, and
+    restore the clients and stop it when the benchmark ends.
+    """
+    with REEStandInServer(latency=settings.benchmarks.ree_latency) as server:
+        previous = server.configure_clients()
+        try:
+            yield server
+        finally:
+            for key, value in previous.items():
+                settings.set(key, value)
+
+
+@benchmark('ree.ingest.demand')
+def ree_ingest_demand(sizes: dict, working_folder: Path) -> Iterator[Callable]:
+    end_date = (datetime(2023, 1, 1) + timedelta(days=sizes['ree_days'] - 1)).strftime('%Y-%m-%dT23:00')
+
+    def ingest():
+        # An empty store in each call, so all the hours are requested, parsed and written
+        store = HourlyStore(tempfile.mkdtemp(dir=working_folder))
+        return retrieve_demand(working_folder / 'demand.csv', '2023-01-01', end_date, store=store)
+
+    with _ree_stand_in():
+        yield ingest
+
+
+@benchmark('ree.ingest.generation')
+def ree_ingest_generation(sizes: dict, working_folder: Path) -> Iterator[Callable]:
+    # A request per day, so the range is shorter than the demand one
+    end_date = (datetime(2023, 1, 1) + timedelta(days=sizes['ree_days'] // 10)).strftime('%Y-%m-%d')
+
+    def ingest():
+        store = HourlyStore(tempfile.mkdtemp(dir=working_folder))
+        return retrieve_generation(working_folder / 'generation.csv', '2023-01-01', end_date, store=store)
+
+    with _ree_stand_in():
+        yield ingest
+
+
+@benchmark('land_use.filter_and_group_land_use_per_id')
+def land_use_filter_and_group(sizes: dict, working_folder: Path) -> Callable:
+    land_use_df = generate_land_use(sizes['land_use_polygons'], sizes['municipalities'])
+    return lambda: filter_and_group_land_use_per_id(land_use_df, settings.land_use.urbanized_zones)
+
+
+@benchmark('analyze_pv_installation')
+def pv_installation(sizes: dict, working_folder: Path) -> Callable:
+    pv_path = working_folder / 'pv_installations.gpkg'
+    generate_pv_installations(sizes['pv_perimeters'], sizes['pv_elements']).to_file(pv_path)
+    categories_mapping = {'EXT': 'Perimetro', **{category: f'{category.split("-")[0]} - {category}'
+                                                 for category in ['IND-SUR', 'IND-NORTE', 'IND-PLANA', 'IND-SUELO',
+                                                                  'URB-SUR', 'URB-PLANA', 'URB-SUELO']}}
+    return lambda: analyze_pv_installation([pv_path], categories_mapping, working_folder / 'pv_installations.geojson')
+
+
+@benchmark('process_fv_coverage')
+def fv_coverage(sizes: dict, working_folder: Path) -> Callable:
+    coverage_path = working_folder / 'fv_coverage.csv'
+    generate_fv_coverage(sizes['municipalities']).to_csv(coverage_path, index=False)
+    return lambda: process_fv_coverage(coverage_path)
+
+
+def _register_geo_io_benchmarks(saving_format: str) -> None:
+
+    @benchmark(f'io_utils.save_geo_dataframe.{saving_format}')
+    def save_geo(sizes: dict, working_folder: Path) -> Iterator[Callable]:
+        land_use_df = generate_land_use(sizes['land_use_polygons'], sizes['municipalities'])
+        with _changed_settings({'geodata.saving_format': saving_format}):
+            yield lambda: save_geo_dataframe('land_use', land_use_df, saving_folder=str(working_folder))
+
+    for cached in (False, True):
+        @benchmark(f'io_utils.read_geo_dataframe.{saving_format}{".arrow_cache" if cached else ""}')
+        def read_geo(sizes: dict, working_folder: Path, cached: bool = cached) -> Iterator[Callable]:
+            path = working_folder / f'land_use_read.{saving_format}'
+            land_use_df = generate_land_use(sizes['land_use_polygons'], sizes['municipalities'])
+            if saving_format == 'parquet':
+                land_use_df.to_parquet(path)
+            else:
+                land_use_df.to_file(path)
+
+            # The files are cached as processed outputs
+            with _changed_settings({'arrow_cache.enabled': cached, 'processed_data_folder': str(working_folder)}):
+                yield lambda: read_geo_dataframe(path)
+
+
+def _register_io_benchmarks(saving_format: str) -> None:
+
+    @benchmark(f'io_utils.save_dataframe.{saving_format}')
+    def save(sizes: dict, working_folder: Path) -> Iterator[Callable]:
+        df = generate_land_use(sizes['land_use_polygons'], sizes['municipalities']).drop(columns='geometry')
+        with _changed_settings({'data.saving_format': saving_format}):
+            yield lambda: save_dataframe('land_use_table', df, saving_folder=str(working_folder))
+
+    for cached in (False, True):
+        @benchmark(f'io_utils.read_dataframe.{saving_format}{".arrow_cache" if cached else ""}')
+        def read(sizes: dict, working_folder: Path, cached: bool = cached) -> Iterator[Callable]:
+            path = working_folder / f'land_use_table_read.{saving_format}'
+            df = generate_land_use(sizes['land_use_polygons'], sizes['municipalities']).drop(columns='geometry')
+            getattr(df, f'to_{saving_format}')(path)
+
+            # The files are cached as processed outputs
+            with _changed_settings({'arrow_cache.enabled': cached, 'processed_data_folder': str(working_folder)}):
+                yield lambda: read_dataframe(path)
+
+
+def _register_import_benchmark(module: str) -> None:
+
+    @benchmark(f'import.{module}')
+    def import_module(sizes: dict, working_folder: Path) -> Callable:
+        # A new interpreter for each import, as when a script or a worker of a pool starts
+        return lambda: subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+
+
+for json_backend in JSON_BACKENDS:
+    # The optional backends are only measured when they are installed
+    if json_backend == 'json' or importlib.util.find_spec(json_backend):
+        _register_decoding_benchmark(json_backend)
+for geo_format in ('parquet', 'geojson', 'gpkg'):
+    _register_geo_io_benchmarks(geo_format)
+for data_format in ('parquet', 'csv', 'json'):
+    _register_io_benchmarks(data_format)
+for imported_module in ('pv_stats.config.config', 'pv_stats.ree.ree_api', 'pv_stats.utils.io_utils',
+                        'pv_stats.land_use', 'pv_stats.map_electricity_coverage'):
+    _register_import_benchmark(imported_module)
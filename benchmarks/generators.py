@@ -0,0 +1,162 @@
+import json
+from datetime import datetime, timedelta
+from typing import Dict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# Land use classes of SIOSE used by the generators, urban and rural ones
+LAND_USE_IDS = [2110, 2120, 2310, 3110, 3120, 3210, 4112, 5000, 6100, 6200, 1100, 1210, 1310]
+# Categories of the PV installation layers
+PV_CATEGORIES = ['IND-SUR', 'IND-NORTE', 'IND-PLANA', 'IND-SUELO', 'URB-SUR', 'URB-PLANA', 'URB-SUELO']
+# Technologies of the REE demand API responses
+GENERATION_KEYS = ['dem', 'eol', 'nuc', 'car', 'cc', 'hid', 'inter', 'solFot', 'solTer', 'termRenov']
+# Origin of the synthetic layers, inside the Community of Madrid in EPSG:25830
+ORIGIN_X, ORIGIN_Y = 400000, 4440000
+
+
+def _grid_boxes(n_boxes: int, size: float, origin_x: float = ORIGIN_X, origin_y: float = ORIGIN_Y) -> np.ndarray:
+    """ Boxes of the given size in a square grid, in row order. """
+    n_cols = int(np.ceil(np.sqrt(n_boxes)))
+    index = np.arange(n_boxes)
+    min_x = origin_x + (index % n_cols) * size
+    min_y = origin_y + (index // n_cols) * size
+    return shapely.box(min_x, min_y, min_x + size, min_y + size)
+
+
+def generate_municipalities(n_municipalities: int, size: float = 5000) -> gpd.GeoDataFrame:
+    """ Municipal boundaries as a grid of squares, with the columns of the administrative
+    divisions and the cities info.
+
+    :param n_municipalities: number of municipalities.
+    :param size: side of each municipality in meters.
+    :return: GeoDataFrame in EPSG:25830.
+    """
+    codes = np.arange(1, n_municipalities + 1)
+    return gpd.GeoDataFrame({'CD_MUNICIPIO': codes,
+                             'CD_INE': 28000 + codes,
+                             'DS_NOMBRE': [f'Municipio {code}' for code in codes],
+                             'municipio_id': (28000 + codes).astype('int32'),
+                             'municipio_nombre': [f'Municipio {code}' for code in codes]},
+                            geometry=_grid_boxes(n_municipalities, size), crs='EPSG:25830')
+
+
+def generate_land_use(n_polygons: int, n_municipalities: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """ SIOSE like land use layer, with the polygons of a grid spread over the municipalities.
+
+    :param n_polygons: number of polygons.
+    :param n_municipalities: number of municipalities.
+    :param seed: seed of the random values.
+    :return: GeoDataFrame in EPSG:25830 with the `ID_USO_MAX`, `MUNICIPIO`,
+      `MUNICIPIO_NOMBRE` and `SUPERF_M2` columns and the `municipio_id` key, as the processed layer.
+    """
+    rng = np.random.default_rng(seed)
+    geometries = _grid_boxes(n_polygons, 100)
+    municipalities = 28001 + rng.integers(0, n_municipalities, n_polygons)
+    return gpd.GeoDataFrame({'ID_USO_MAX': rng.choice(LAND_USE_IDS, n_polygons),
+                             'MUNICIPIO': municipalities,
+                             'MUNICIPIO_NOMBRE': [f'Municipio {code - 28000}' for code in municipalities],
+                             'SUPERF_M2': shapely.area(geometries),
+                             'municipio_id': pd.array(municipalities, dtype='Int32')},
+                            geometry=geometries, crs='EPSG:25830')
+
+
+def generate_pv_installations(n_perimeters: int, elements_per_perimeter: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """ PV installation layer with `EXT` perimeters and the roofs and floors inside them.
+
+    :param n_perimeters: number of perimeters.
+    :param elements_per_perimeter: number of elements inside each perimeter.
+    :param seed: seed of the random values.
+    :return: GeoDataFrame in EPSG:25830 with the `categoria` column.
+    """
+    rng = np.random.default_rng(seed)
+    perimeters = _grid_boxes(n_perimeters, 1000)
+    min_x, min_y = shapely.bounds(perimeters)[:, :2].T
+    n_elements = n_perimeters * elements_per_perimeter
+    element_x = np.repeat(min_x, elements_per_perimeter) + rng.uniform(10, 900, n_elements)
+    element_y = np.repeat(min_y, elements_per_perimeter) + rng.uniform(10, 900, n_elements)
+    elements = shapely.box(element_x, element_y, element_x + rng.uniform(5, 80, n_elements),
+                           element_y + rng.uniform(5, 80, n_elements))
+    categories = ['EXT'] * n_perimeters + list(rng.choice(PV_CATEGORIES, n_elements))
+    return gpd.GeoDataFrame({'categoria': categories},
+                            geometry=np.concatenate([perimeters, elements]), crs='EPSG:25830')
+
+
+def generate_fv_coverage(n_municipalities: int, seed: int = 0) -> pd.DataFrame:
+    """ Table of the electricity coverage, with the first six columns of the excel file.
+
+    :param n_municipalities: number of municipalities.
+    :param seed: seed of the random values.
+    :return: DataFrame with the original column names.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'municipio': [f'Municipio {code}' for code in range(1, n_municipalities + 1)],
+                         'km2': rng.uniform(1, 600, n_municipalities),
+                         'nº habitantes': rng.integers(100, 3_000_000, n_municipalities),
+                         'Consumo anual electricidad - media 2014-2019 (MWh)': rng.uniform(100, 10 ** 7,
+                                                                                           n_municipalities),
+                         'Sup. urbana (Ha)': rng.uniform(1, 20000, n_municipalities),
+                         'Sup. rústica (Ha)': rng.uniform(1, 60000, n_municipalities)})
+
+
+def generate_ree_data_payload(n_days: int = None,
+                              n_series: int = 8,
+                              seed: int = 0,
+                              times: pd.DatetimeIndex = None,
+                              n_groups: int = None) -> Dict:
+    """ Response of the REE data API with hourly values.
+
+    :param n_days: number of days of the response, from 2023-01-01.
+    :param n_series: number of series, e.g. demand types or generation technologies.
+    :param seed: seed of the random values.
+    :param times: timezone aware hours of the response, instead of the days.
+    :param n_groups: number of groups of the series. If given, the series are nested in the
+      `content` of their group, as in the balance widgets, e.g. renewable and non-renewable.
+    :return: the decoded JSON response.
+    """
+    rng = np.random.default_rng(seed)
+    if times is None:
+        times = pd.date_range('2023-01-01', periods=n_days * 24, freq='h', tz='Europe/Madrid')
+    times = [time.isoformat(timespec='milliseconds') for time in times]
+    series = [{'type': f'Serie {serie}',
+               'attributes': {'title': f'Serie {serie}',
+                              'values': [{'value': float(value), 'percentage': 1.0, 'datetime': time}
+                                         for value, time in zip(rng.uniform(0, 40000, len(times)), times)]}}
+              for serie in range(n_series)]
+    if n_groups is None:
+        return {'included': series}
+    return {'included': [{'type': f'Grupo {group}',
+                          'attributes': {'title': f'Grupo {group}', 'content': series[group::n_groups]}}
+                         for group in range(n_groups)]}
+
+
+def generate_ree_demanda_payload(date: datetime, seed: int = 0, callback: str = 'angular.callbacks._0') -> str:
+    """ JSONP response of the REE demand API for a day, with the values every ten
+    minutes and some rows of the previous and next days.
+
+    As in the API, the day of the change to summer time has no values at 2:00 and the one
+    of the change to winter time labels the repeated hour as 2A and 2B.
+
+    :param date: day of the response.
+    :param seed: seed of the random values.
+    :param callback: name of the JSONP callback.
+    :return: the raw text of the response.
+    """
+    rng = np.random.default_rng(seed)
+    day = pd.Timestamp(date.year, date.month, date.day)
+    times = pd.date_range((day - timedelta(hours=1)).tz_localize('Europe/Madrid'),
+                          (day + timedelta(hours=25)).tz_localize('Europe/Madrid'),
+                          freq='10min', inclusive='left')
+    wall_times = times.tz_localize(None)
+    # The repeated wall times can not be localized without knowing the offset
+    repeated = wall_times.tz_localize('Europe/Madrid', ambiguous='NaT').isna()
+    labels = [f'{wall_time:%Y-%m-%d} {wall_time.hour}{"A" if time.dst() else "B"}:{wall_time:%M}' if is_repeated
+              else f'{wall_time:%Y-%m-%d %H:%M}'
+              for time, wall_time, is_repeated in zip(times, wall_times, repeated)]
+    values = [{'ts': label,
+               **{key: round(float(value), 1) for key, value in
+                  zip(GENERATION_KEYS, rng.uniform(0, 30000, len(GENERATION_KEYS)))}}
+              for label in labels]
+    return f'{callback}({json.dumps({"valoresHorariosGeneracion": values})});'
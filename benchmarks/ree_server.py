@@ -0,0 +1,212 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+from loguru import logger
+
+from benchmarks.generators import generate_ree_data_payload, generate_ree_demanda_payload
+from pv_stats.config.config import settings
+
+DATA_PATH = re.compile(r'^/(?:es|en)/datos/(?P<category>[^/]+)/(?P<widget>[^/]+)$')
+DEMANDA_PATH = re.compile(r'^/WSvisionaMovilesPeninsulaRest/resources/(?P<category>[^/]+)$')
+# Frequency of the values of each time truncation of the data API
+TIME_TRUNC_FREQS = {'hour': 'h', 'day': 'D', 'month': 'MS', 'year': 'YS'}
+
+
+class REEStandInServer:
+    """ Local stand-in of the REE data and demand APIs, to test and benchmark the clients
+    without network access.
+
+    `GET /{language}/datos/{category}/{widget}` answers with the JSON of the data API
+    between the `start_date` and `end_date` parameters, in local time, and
+    `GET /WSvisionaMovilesPeninsulaRest/resources/{category}` with the JSONP of the
+    demand API for the `fecha` parameter. The values are synthetic, but the days of the
+    time changes have 23 and 25 hours, as in the APIs.
+
+    The clients query it after `configure_clients`.
+    """
+
+    def __init__(self,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 retry_after: int = 1,
+                 n_series: int = 8,
+                 seed: int = 0,
+                 host: str = '127.0.0.1',
+                 port: int = 0):
+        """
+        :param latency: seconds before each answer.
+        :param error_rate: share of the requests answered with a 500 error.
+        :param throttle_rate: share of the requests answered with a 429 error.
+        :param retry_after: seconds of the `Retry-After` header of the 429 errors.
+        :param n_series: number of series of the data API responses.
+        :param seed: seed of the errors and the values.
+        :param host: host to listen.
+        :param port: port to listen. By default, a free one.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.n_series = n_series
+        self.seed = seed
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0, 'in_flight': 0, 'max_in_flight': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        """ Host and port of the server, as expected by the `url` settings of the clients. """
+        host, port = self._server.server_address[:2]
+        return f'{host}:{port}'
+
+    def _handler(self) -> type:
+        stand_in = self
+
+        class StandInHandler(BaseHTTPRequestHandler):
+
+            def _answer(self, status: int, body: bytes, content_type: str, headers: dict = None) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _answer_error(self, status: int, message: str, headers: dict = None) -> None:
+                self._answer(status, json.dumps({'errors': [{'detail': message}]}).encode('utf-8'),
+                             'application/json', headers)
+
+            def do_GET(self) -> None:
+                stand_in._enter()
+                try:
+                    self._route()
+                finally:
+                    stand_in._exit()
+
+            def _route(self) -> None:
+                url = urlsplit(self.path)
+                # The demand client joins its base URL and the category with a double slash
+                path = re.sub('/+', '/', url.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                time.sleep(stand_in.latency)
+                failure = stand_in._draw_failure()
+                if failure == 'throttled':
+                    self._answer_error(429, 'Too many requests.', {'Retry-After': str(stand_in.retry_after)})
+                    return
+                if failure == 'error':
+                    self._answer_error(500, 'Internal server error.')
+                    return
+
+                try:
+                    if data_path := DATA_PATH.match(path):
+                        body = stand_in.data_response(params, data_path['category'])
+                        self._answer(200, body, 'application/json')
+                    elif DEMANDA_PATH.match(path):
+                        body = stand_in.demanda_response(params)
+                        self._answer(200, body, 'application/javascript')
+                    else:
+                        self._answer_error(404, f'Unknown endpoint {path}.')
+                except (KeyError, ValueError) as error:
+                    self._answer_error(400, f'Invalid parameters: {error}.')
+
+            def log_message(self, format: str, *args) -> None:
+                logger.trace(format % args)
+
+        return StandInHandler
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['in_flight'] += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.stats['in_flight'] -= 1
+
+    def _draw_failure(self) -> str | None:
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.throttle_rate:
+                self.stats['throttled'] += 1
+                return 'throttled'
+            if draw < self.throttle_rate + self.error_rate:
+                self.stats['errors'] += 1
+                return 'error'
+        return None
+
+    def data_response(self, params: dict, category: str = None) -> bytes:
+        """ Body of the data API for the query parameters of a request. The series of the
+        `balance` category are nested in two groups, as in the API.
+        """
+        freq = TIME_TRUNC_FREQS[params['time_trunc']]
+        start = pd.Timestamp(params['start_date'])
+        if params['time_trunc'] != 'hour':
+            # The days, months and years are dated at their local start
+            start = start.to_period(freq.removesuffix('S')).start_time
+        # The dates are local times, as sent by the client
+        times = pd.date_range(start.tz_localize('Europe/Madrid', ambiguous=True),
+                              pd.Timestamp(params['end_date']).tz_localize('Europe/Madrid', ambiguous=False),
+                              freq=freq)
+        payload = generate_ree_data_payload(n_series=self.n_series, seed=self.seed, times=times,
+                                            n_groups=2 if category == 'balance' else None)
+        return json.dumps(payload).encode('utf-8')
+
+    def demanda_response(self, params: dict) -> bytes:
+        """ Body of the demand API for the query parameters of a request. """
+        payload = generate_ree_demanda_payload(datetime.fromisoformat(params['fecha']), self.seed,
+                                               params.get('callback', 'angular.callbacks._0'))
+        return payload.encode('utf-8')
+
+    def configure_clients(self, rate_limit: bool = False) -> dict:
+        """ Point the REE clients to the server through the settings.
+
+        :param rate_limit: keep the rate limits of the real hosts.
+        :return: previous values of the changed settings, to restore them.
+        """
+        changes = {'ree_data.url': self.address, 'ree_data.scheme': 'http',
+                   'ree_demanda.url': self.address, 'ree_demanda.scheme': 'http'}
+        if not rate_limit:
+            changes.update({'ree.rate_limit.data.rate': 0, 'ree.rate_limit.demanda.rate': 0})
+
+        previous = {key: settings.get(key) for key in changes}
+        for key, value in changes.items():
+            settings.set(key, value)
+        return previous
+
+    def start(self) -> str:
+        """ Serve the requests in a background thread.
+
+        :return: host and port of the server.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.debug('Serving the REE stand-in in http://{}.', self.address)
+        return self.address
+
+    def stop(self) -> None:
+        """ Stop serving and close the socket. """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self) -> 'REEStandInServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,47 @@
+import json
+import tempfile
+from pathlib import Path
+from typing import Annotated, List, Optional
+
+import typer
+from loguru import logger
+
+from benchmarks.suite import compare_results, latest_results, run_benchmarks, save_results
+from pv_stats.config.config import settings
+
+
+def main(
+        scale: Annotated[str, typer.Argument(help='Size of the synthetic data: small, medium or large.')] = 'small',
+        repeat: Annotated[int, typer.Option(help='Number of timed calls of each benchmark.')] = 5,
+        benchmark: Annotated[Optional[List[str]], typer.Option(help='Benchmarks to run. By default, all.')] = None,
+        baseline: Annotated[Optional[Path], typer.Option(help='Results to compare with. By default, the '
+                                                              'last saved ones of the same scale.')] = None,
+        threshold: Annotated[Optional[float], typer.Option(help='Ratio of the median time from which a '
+                                                                'benchmark is a regression.')] = None,
+        save: Annotated[bool, typer.Option(help='Save the results for later comparisons.')] = True
+) -> None:
+    results_folder = Path(settings.benchmarks.results_folder)
+    with tempfile.TemporaryDirectory() as working_folder:
+        results = run_benchmarks(scale, Path(working_folder), repeat, benchmark)
+
+    baseline = baseline or latest_results(results_folder, scale)
+    if save:
+        logger.info('Results saved in {}.', save_results(results, results_folder))
+
+    if baseline is None:
+        logger.info('No baseline results to compare with.')
+        return
+
+    comparison = compare_results(results, json.loads(Path(baseline).read_text()), threshold)
+    for row in comparison:
+        log = logger.warning if row['regression'] else logger.info
+        log('{}: {:.4f} s -> {:.4f} s ({:.2f}x)', row['benchmark'], row['baseline_s'], row['current_s'], row['ratio'])
+
+    regressions = [row['benchmark'] for row in comparison if row['regression']]
+    if regressions:
+        logger.error('Regressions against {}: {}', baseline, ', '.join(regressions))
+        raise typer.Exit(code=1)
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -0,0 +1,175 @@
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+from loguru import logger
+
+from pv_stats.config.config import settings
+
+# Size of the synthetic data of each scale
+SCALES = {
+    'small': {'land_use_polygons': 10_000, 'municipalities': 179, 'ree_days': 31,
+              'pv_perimeters': 10, 'pv_elements': 50},
+    'medium': {'land_use_polygons': 100_000, 'municipalities': 179, 'ree_days': 365,
+               'pv_perimeters': 50, 'pv_elements': 100},
+    'large': {'land_use_polygons': 1_000_000, 'municipalities': 8131, 'ree_days': 3650,
+              'pv_perimeters': 200, 'pv_elements': 200},
+}
+
+# Benchmarks registered with `benchmark`. Each one prepares its data and returns, or yields, the function to time.
+BENCHMARKS: Dict[str, Callable[[dict, Path], Callable[[], object] | Iterator[Callable[[], object]]]] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """ Register a benchmark. The decorated function receives the sizes of the scale and a
+    working folder, prepares the data and returns the function to time.
+
+    A benchmark that changes the settings or starts a server yields the function instead,
+    and undoes the changes after the yield, so they do not leak into the next benchmarks.
+
+    :param name: name of the benchmark in the results.
+    :return: the decorator.
+    """
+
+    def decorator(setup: Callable[[dict, Path], Callable[[], object]]) -> Callable:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+@contextmanager
+def prepare_benchmark(name: str, sizes: dict, working_folder: Path) -> Iterator[Callable[[], object]]:
+    """ Prepare a registered benchmark and, once its calls are timed, run its teardown.
+
+    :param name: name of the benchmark.
+    :param sizes: sizes of the scale.
+    :param working_folder: folder for the generated data.
+    :return: context with the function to time.
+    """
+    prepared = BENCHMARKS[name](sizes, working_folder)
+    if not inspect.isgenerator(prepared):
+        yield prepared
+        return
+
+    try:
+        yield next(prepared)
+    finally:
+        # The code after the yield of the benchmark
+        next(prepared, None)
+
+
+def time_function(function: Callable[[], object], repeat: int) -> dict:
+    """ Time the calls of a function, after an untimed call that warms up the caches.
+
+    :param function: function to time.
+    :param repeat: number of timed calls.
+    :return: dict with the minimum, median, mean and standard deviation in seconds.
+    """
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return {'min_s': min(timings),
+            'median_s': statistics.median(timings),
+            'mean_s': statistics.mean(timings),
+            'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            'repeat': repeat}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale: str,
+                   working_folder: Path,
+                   repeat: int = 5,
+                   names: List[str] = None) -> dict:
+    """ Run the registered benchmarks.
+
+    :param scale: name of the scale, one of `SCALES`.
+    :param working_folder: folder for the generated data.
+    :param repeat: number of timed calls of each benchmark.
+    :param names: benchmarks to run. By default, all of them.
+    :return: dict with the environment of the run and the timings per benchmark.
+    """
+    if scale not in SCALES:
+        raise ValueError(f'Scale `{scale}` not defined. Valid values are: {", ".join(SCALES)}.')
+
+    # The benchmarks module registers them when imported
+    import benchmarks.benchmarks  # noqa: F401
+
+    names = names or list(BENCHMARKS)
+    results = {}
+    for name in names:
+        with prepare_benchmark(name, SCALES[scale], working_folder) as function:
+            results[name] = time_function(function, repeat)
+        logger.info('{}: {:.4f} s of median in {} calls.', name, results[name]['median_s'], repeat)
+
+    return {'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'cpus': os.cpu_count(),
+            'scale': scale,
+            'results': results}
+
+
+def save_results(results: dict, results_folder: Path) -> Path:
+    """ Save the results of a run in a JSON file named after its date and scale.
+
+    :param results: results of `run_benchmarks`.
+    :param results_folder: folder of the results.
+    :return: path to the saved file.
+    """
+    os.makedirs(results_folder, exist_ok=True)
+    results_path = results_folder / f'{datetime.now():%Y%m%dT%H%M%S}_{results["scale"]}.json'
+    results_path.write_text(json.dumps(results, indent=2))
+    return results_path
+
+
+def latest_results(results_folder: Path, scale: str, exclude: Path = None) -> Path | None:
+    """ Path to the last saved results of a scale. """
+    paths = sorted(path for path in results_folder.glob(f'*_{scale}.json') if path != exclude)
+    return paths[-1] if paths else None
+
+
+def compare_results(current: dict,
+                    baseline: dict,
+                    threshold: float = None) -> List[dict]:
+    """ Compare the median timings of two runs.
+
+    :param current: results of the new run.
+    :param baseline: results of the run to compare with.
+    :param threshold: ratio of the medians from which a benchmark is a regression. By
+      default, the `benchmarks.regression_threshold` setting.
+    :return: list with the comparison of each benchmark present in both runs.
+    """
+    threshold = threshold or settings.benchmarks.regression_threshold
+    comparison = []
+    for name, timing in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = timing['median_s'] / baseline['results'][name]['median_s']
+        comparison.append({'benchmark': name,
+                           'baseline_s': baseline['results'][name]['median_s'],
+                           'current_s': timing['median_s'],
+                           'ratio': ratio,
+                           'regression': ratio > threshold})
+
+    return comparison
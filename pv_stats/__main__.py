@@ -0,0 +1,3 @@
+from pv_stats.cli import app
+
+app()
@@ -1,24 +1,86 @@
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from loguru import logger
 
+from pv_stats.config.config import settings
 from pv_stats.utils.df_processing import remap_column_categories
-from pv_stats.utils.io_utils import read_geo_dataframe
+from pv_stats.utils.geometry import compute_areas, resolve_overlaps
+from pv_stats.utils.io_utils import read_projected_geo_dataframe
+
+PRECEDENCE_RULES = ['source', 'category', 'largest']
+
+
+def read_pv_layers(pv_paths: list[str | Path]) -> pd.DataFrame:
+    """ Join the layers of PV installations, with the area in m2 of each polygon.
+
+    :param pv_paths: layers with the PV installations.
+    :return: GeoDataFrame with the polygons of all the layers and the position of their
+      layer in the `source` column.
+    """
+    return pd.concat([read_projected_geo_dataframe(pv_path, area_column='area_m2').assign(source=source)
+                      for source, pv_path in enumerate(pv_paths)], ignore_index=True)
+
+
+def get_overlap_rank(pv_df: pd.DataFrame,
+                     precedence: str = None,
+                     category_order: list[str] = None) -> np.ndarray:
+    """ Precedence of each PV polygon to keep the area it shares with others.
+
+    :param pv_df: PV installations with the `categoria`, `source` and `area_m2` columns.
+    :param precedence: `source`, the polygon of the first layer, `category`, the polygon whose
+      category comes first in `category_order`, or `largest`, the largest polygon. By default,
+      the `pv_installations.overlaps.precedence` setting.
+    :param category_order: categories from the first to the last. By default, the
+      `pv_installations.overlaps.category_order` setting or, if empty, the order of the
+      categories in `pv_installations.categories_mapping`.
+    :return: array with the rank of each polygon, lower first.
+    """
+    precedence = precedence or settings.pv_installations.overlaps.precedence
+    if precedence == 'source':
+        return pv_df['source'].to_numpy()
+    if precedence == 'largest':
+        return -pv_df['area_m2'].to_numpy()
+    if precedence == 'category':
+        category_order = (category_order or settings.pv_installations.overlaps.category_order
+                          or list(settings.pv_installations.categories_mapping))
+        # The categories that are not in the list go last
+        rank = pd.Series(range(len(category_order)), index=category_order)
+        return pv_df['categoria'].map(rank).fillna(len(category_order)).to_numpy()
+
+    raise ValueError(f'Precedence rule `{precedence}` not valid. Valid values are: {", ".join(PRECEDENCE_RULES)}.')
+
+
+def resolve_pv_overlaps(pv_df: pd.DataFrame,
+                        precedence: str = None,
+                        category_order: list[str] = None) -> pd.DataFrame:
+    """ Count once the area of the PV polygons that overlap, e.g. the same roof in two
+    surveys, assigning it to the polygon that comes first in the precedence rule. The
+    polygons of `pv_installations.excluded_categories`, such as the perimeters, enclose the
+    others and are kept as they are.
+
+    :param pv_df: PV installations from `read_pv_layers`.
+    :param precedence: rule of `get_overlap_rank`.
+    :param category_order: categories from the first to the last for the `category` rule.
+    :return: GeoDataFrame with the polygons that do not overlap and their `area_m2` updated.
+    """
+    excluded = pv_df['categoria'].isin(settings.pv_installations.excluded_categories)
+    usable_df = pv_df[~excluded]
+    resolved_df = resolve_overlaps(usable_df, get_overlap_rank(usable_df, precedence, category_order))
+    resolved_df['area_m2'] = compute_areas(resolved_df)
+
+    counted_twice = usable_df['area_m2'].sum() - resolved_df['area_m2'].sum()
+    logger.info('{:.2f} ha of overlapping PV polygons counted once, {:.2%} of the area.', counted_twice / 10 ** 4,
+                counted_twice / usable_df['area_m2'].sum() if len(usable_df) else 0)
+    return pd.concat([resolved_df, pv_df[excluded]]).sort_index()
 
 
 def analyze_pv_installation(pv_paths: list[str | Path],
                             categories_mapping: dict[str, str],
                             save_path: str | Path) -> None:
-    # Create an empty geodataframe and then join all the pv installations
-    global_gdf = None
-    for pv_path in pv_paths:
-        gdf = read_geo_dataframe(pv_path)
-        gdf['area_m2'] = gdf['geometry'].area
-        if global_gdf is None:
-            global_gdf = gdf
-        else:
-            global_gdf = pd.concat([global_gdf, gdf], ignore_index=True)
+    # Join all the pv installations, with the area shared by several polygons counted once
+    global_gdf = resolve_pv_overlaps(read_pv_layers(pv_paths))
 
     global_gdf.to_file(save_path, driver='GeoJSON')
 
@@ -45,31 +107,3 @@ def analyze_pv_installation(pv_paths: list[str | Path],
 
         # Print a table with the categories and the area of each of them, rounded to int
         logger.info(categories_area.round().astype(int))
-
-
-
-
-
-if __name__ == '__main__':
-    pv_files = [
-        '/data/poligonos/poligono alcorcón/polígono-alcorcon.shp',
-        '/data/poligonos/zonas Rodrigo/capa_superficie_utilizable_nuevo_esquema.shp'
-    ]
-    categories_map = {
-        "EXT": "Perimetro",
-        "IND-SUR": "Industrial - S (≤89°) inclinacion cubierta",
-        "IND-NORTE": "Industrial - N (90°) inclinacion cubierta",
-        "IND-NOR2": "Industrial - N (90°) inclinacion sur 5°",
-        "IND-PLANA": "Industrial - S/E/O/SE/SO Cubierta plana",
-        "IND-SUELO": "Industrial - S/E/O/SE/SO en suelo",
-        "IND-INFR": "Industrial - SE/S/SO en pérgola",
-        "URB-SUR": "Urbano - S (≤45°) inclinaciéon cubierta",
-        "URB-SE-SO": "Urbano - SE/SO (+75 a +45°) inclinacion cubierta",
-        "URB-E-O": "Urbano - E/O (≤90 a +45°) inclinacién cubierta",
-        "URB-PLANA": "Urbano - S/E/O/SE/SO Cubierta plana",
-        "URB-SUELO": "Urbano - S/E/O/SE/SO en suelo",
-        "URB-INFR": "Urbano - S/E/O/SE/SO en pérgola"
-    }
-    saving_path = '/data/poligonos/pv_installations.geojson'
-    analyze_pv_installation(pv_files, categories_map, saving_path)
-
@@ -0,0 +1,255 @@
+import json
+import os
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Annotated, Callable, Dict, List, Optional
+
+import typer
+from loguru import logger
+
+from pv_stats.config.config import configure_logs, settings
+
+# The modules of each command are imported inside it, so every invocation only loads
+# the dependencies it needs.
+app = typer.Typer(help='Photovoltaic statistics of the Community of Madrid.', no_args_is_help=True)
+
+
+@app.callback()
+def main() -> None:
+    configure_logs()
+
+
+@app.command('ree-demand')
+def ree_demand(
+        save_path: Annotated[str, typer.Argument(help='Folder where the data will be saved or full path to the file.')],
+        start_date: Annotated[str, typer.Argument(help='Start date in ISO 8601 format.')],
+        end_date: Annotated[str, typer.Argument(help='End date in ISO 8601 format.')],
+        time_trunc: Annotated[str, typer.Option(help='Time aggregation: hour, day, week, month or year.')] = 'hour'
+) -> None:
+    """ Retrieve the demand, from the local store or the REE data API. """
+    from pv_stats.ree.retrieval import retrieve_demand
+
+    retrieve_demand(save_path, start_date, end_date, time_trunc)
+
+
+@app.command('ree-generation')
+def ree_generation(
+        save_path: Annotated[str, typer.Argument(help='Folder where the data will be saved or full path to the file.')],
+        start_date: Annotated[str, typer.Argument(help='Start date in ISO 8601 format.')],
+        end_date: Annotated[Optional[str], typer.Argument(help='End date in ISO 8601 format.')] = None,
+        time_trunc: Annotated[str, typer.Option(help='Time aggregation: hour, day, week, month or year.')] = 'hour',
+        geo_limit: Annotated[Optional[str], typer.Option(help='Zone of the data.')] = None
+) -> None:
+    """ Retrieve the generation, from the local store or the REE demand API. """
+    from pv_stats.ree.retrieval import retrieve_generation
+
+    retrieve_generation(save_path, start_date, end_date, time_trunc, geo_limit)
+
+
+@app.command('ree-backfill')
+def ree_backfill(
+        dataset: Annotated[str, typer.Argument(help='Stored dataset: demand or generation_<zone>.')],
+        start_date: Annotated[Optional[str], typer.Option(help='First date to check. By default, the first '
+                                                               'stored hour.')] = None,
+        end_date: Annotated[Optional[str], typer.Option(help='Last date to check. By default, the last '
+                                                             'stored hour.')] = None
+) -> None:
+    """ Retrieve only the missing and duplicated hours of a stored REE dataset. """
+    from pv_stats.ree.retrieval import backfill_dataset
+
+    backfill_dataset(dataset, start_date, end_date)
+
+
+@app.command('ree-catalog-backfill')
+def ree_catalog_backfill(
+        catalog_path: Annotated[str, typer.Argument(help='TOML or JSON file with the jobs of the catalog, e.g. '
+                                                         'config/ree_catalog.toml.')],
+        concurrency: Annotated[Optional[int], typer.Option(help='Requests in flight. By default, the '
+                                                                '`ree.scheduler.concurrency` setting.')] = None
+) -> None:
+    """ Retrieve the REE data API series of a catalog, resuming from the windows already stored. """
+    from pv_stats.ree.scheduler import load_catalog, run_catalog_backfill
+
+    run_catalog_backfill(load_catalog(catalog_path), concurrency=concurrency)
+
+
+@app.command('ree-memory-report')
+def ree_memory_report(
+        dataset: Annotated[str, typer.Argument(help='Stored dataset: demand or generation_<zone>.')]
+) -> None:
+    """ Memory used by a stored REE dataset once loaded, per column. """
+    from pv_stats.ree.frames import memory_report
+    from pv_stats.ree.storage import HourlyStore
+
+    report = memory_report(HourlyStore().read_all(dataset))
+    logger.info('{}: {} rows in {:.1f} MB, {:.1f} bytes per row.', dataset, report['rows'], report['bytes'] / 2 ** 20,
+                report['bytes_per_row'])
+    for column, usage in report['columns'].items():
+        logger.info('{}: {} bytes as {}.', column, usage['bytes'], usage['dtype'])
+
+
+@app.command('land-use')
+def land_use(
+        land_use_path: Annotated[str, typer.Argument(help='Path to the processed land use layer.')],
+        partitioned: Annotated[Optional[bool], typer.Option(help='Process the layer by spatial partitions. '
+                                                                 'By default, the `partitioning.enabled` '
+                                                                 'setting.')] = None
+) -> None:
+    """ Area of the industrial, urban, service and urbanized zones per municipality. """
+    from pv_stats.land_use import filter_land_use
+
+    filter_land_use(land_use_path, partitioned)
+
+
+@app.command('fv-coverage')
+def fv_coverage(
+        fv_coverage_path: Annotated[str, typer.Argument(help='CSV file with the photovoltaic coverage per city.')],
+        administrative_divisions_path: Annotated[str, typer.Argument(help='Administrative divisions with the '
+                                                                          'cities info.')],
+        results_folder: Annotated[Optional[str], typer.Option(help='Folder of the results. By default, the '
+                                                                   '`results_folder` setting.')] = None,
+        pv_path: Annotated[Optional[List[str]], typer.Option(help='Layer with the photovoltaic installations, to '
+                                                                  'take the roof area of each city from them. '
+                                                                  'Can be repeated.')] = None,
+        demand_path: Annotated[Optional[str], typer.Option(help='Hourly demand saved by `ree-demand`, to match '
+                                                                'the coverage hour by hour.')] = None,
+        generation_path: Annotated[Optional[str], typer.Option(help='Hourly generation saved by '
+                                                                    '`ree-generation`, with the demand one.')] = None
+) -> None:
+    """ Photovoltaic coverage per city, with its map. """
+    from pv_stats.map_electricity_coverage import map_fv_coverage
+
+    map_fv_coverage(fv_coverage_path, administrative_divisions_path, results_folder, pv_paths=pv_path,
+                    demand_path=demand_path, generation_path=generation_path)
+
+
+@app.command('consumption-per-city')
+def consumption_per_city(
+        cities_info_path: Annotated[str, typer.Argument(help='CSV file with the info of the cities.')],
+        consumption_path: Annotated[str, typer.Argument(help='CSV file with the electricity consumption per city.')],
+        administrative_divisions_path: Annotated[str, typer.Argument(help='Administrative divisions layer.')],
+        resolution: Annotated[Optional[str], typer.Option(help='Resolution level of the geometries.')] = None,
+        save_path: Annotated[Optional[str], typer.Option(help='Path of the exported GeoJSON.')] = None
+) -> None:
+    """ Electricity consumption per capita and per km2 of each city. """
+    from pv_stats.enegy_per_city import draw_consumption_per_city
+
+    draw_consumption_per_city(cities_info_path, consumption_path, administrative_divisions_path, resolution,
+                              save_path)
+
+
+@app.command('pv-installations')
+def pv_installations(
+        pv_paths: Annotated[List[str], typer.Argument(help='Layers with the photovoltaic installations.')],
+        save_path: Annotated[str, typer.Option(help='Path of the GeoJSON with all the installations.')],
+        categories_path: Annotated[Optional[str], typer.Option(help='JSON file with the name of each category. '
+                                                                    'By default, the '
+                                                                    '`pv_installations.categories_mapping` '
+                                                                    'setting.')] = None
+) -> None:
+    """ Area of each category of the photovoltaic installations. """
+    from pv_stats.analyze_pv_installation import analyze_pv_installation
+
+    if categories_path:
+        categories_mapping = json.loads(Path(categories_path).read_text())
+    else:
+        categories_mapping = dict(settings.pv_installations.categories_mapping)
+    analyze_pv_installation(pv_paths, categories_mapping, save_path)
+
+
+@app.command('serve-spatial-lookup')
+def serve_spatial_lookup(
+        index_folder: Annotated[Optional[str], typer.Argument(help='Folder with the spatial indexes. They are '
+                                                                   'built if they do not exist.')] = None,
+        rebuild: Annotated[bool, typer.Option(help='Build the indexes again from the processed layers.')] = False
+) -> None:
+    """ Serve the municipality and land use lookups through a local HTTP endpoint. """
+    from pv_stats.utils import spatial_lookup
+
+    lookup = (spatial_lookup.SpatialLookup.build(index_folder) if rebuild
+              else spatial_lookup.SpatialLookup.load(index_folder))
+    spatial_lookup.serve_spatial_lookup(lookup)
+
+
+def get_job_commands() -> Dict[str, Callable]:
+    """ Commands that can be run as jobs of the batch mode, by name. """
+    return {command.name: command.callback for command in app.registered_commands
+            if command.name not in ('batch', 'serve-spatial-lookup')}
+
+
+def load_jobs(job_file: str | Path) -> List[dict]:
+    """ Read a job file, in TOML with a `[[jobs]]` table per job or in JSON with a list
+    of jobs. Each job has the `command` to run and its arguments, named as the parameters
+    of the command with `-` or `_`.
+
+    :param job_file: path to the job file.
+    :return: list of jobs.
+    """
+    job_file = Path(job_file)
+    if job_file.suffix == '.toml':
+        with open(job_file, 'rb') as toml_file:
+            content = tomllib.load(toml_file)
+    else:
+        content = json.loads(job_file.read_text())
+    jobs = content['jobs'] if isinstance(content, dict) else content
+
+    commands = get_job_commands()
+    for job in jobs:
+        if job.get('command') not in commands:
+            raise ValueError(f'Command `{job.get("command")}` of a job is not valid. '
+                             f'Valid values are: {", ".join(commands)}.')
+    return jobs
+
+
+def run_job(job: dict) -> dict:
+    """ Run a job in the current process. The errors are logged and reported in the
+    result, so a failed job does not stop the rest.
+
+    :param job: command and arguments of the job.
+    :return: dict with the command, status, error and duration of the job.
+    """
+    arguments = {key.replace('-', '_'): value for key, value in job.items() if key != 'command'}
+    start = time.perf_counter()
+    try:
+        get_job_commands()[job['command']](**arguments)
+        error = None
+    except Exception as exception:
+        logger.exception('Job {} failed.', job['command'])
+        error = repr(exception)
+
+    return {'command': job['command'],
+            'status': 'failed' if error else 'done',
+            'error': error,
+            'seconds': time.perf_counter() - start}
+
+
+def run_jobs(jobs: List[dict], workers: int = None) -> List[dict]:
+    """ Run the jobs in a pool of processes that live for the whole batch, so the imports,
+    settings and in-memory caches of each worker are loaded only once.
+
+    :param jobs: jobs from `load_jobs`.
+    :param workers: number of processes. By default, the `cli.workers` setting.
+    :return: results of `run_job`, in the order of the jobs.
+    """
+    workers = min(workers or settings.cli.workers or os.cpu_count(), max(len(jobs), 1))
+    logger.info('Running {} jobs with {} workers.', len(jobs), workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_logs) as executor:
+        return list(executor.map(run_job, jobs))
+
+
+@app.command('batch')
+def batch(
+        job_file: Annotated[str, typer.Argument(help='TOML or JSON file with the jobs to run.')],
+        workers: Annotated[Optional[int], typer.Option(help='Number of processes. By default, the '
+                                                            '`cli.workers` setting.')] = None
+) -> None:
+    """ Run the jobs of a job file in a pool of workers. """
+    results = run_jobs(load_jobs(job_file), workers)
+    failed = [result for result in results if result['status'] == 'failed']
+    for result in results:
+        logger.info('{}: {} in {:.2f} s.', result['command'], result['status'], result['seconds'])
+    if failed:
+        logger.error('{} of {} jobs failed.', len(failed), len(results))
+        raise typer.Exit(code=1)
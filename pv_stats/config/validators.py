@@ -14,6 +14,23 @@ def get_logging_validators() -> List[Validator]:
                   is_in=['TRACE', 'DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'CRITICAL']),
         Validator('logging.path',
                   default=None),
+        Validator('logging.metrics.enabled',
+                  default=False,
+                  is_type_of=bool),
+        Validator('logging.metrics.folder',
+                  default='/data/metrics',
+                  is_type_of=str),
+        Validator('logging.metrics.sampling_profiler',
+                  default='',
+                  is_in=['', 'pyinstrument', 'py-spy']),
+        Validator('logging.metrics.sampling_interval',
+                  default=0.001,
+                  is_type_of=(int, float),
+                  gt=0),
+        Validator('logging.metrics.rss_interval',
+                  default=0.01,
+                  is_type_of=(int, float),
+                  gt=0),
     ]
 
 
@@ -26,12 +43,242 @@ def get_config_validators() -> List[Validator]:
         Validator('geodata.saving_format',
                   default='parquet',
                   is_type_of=str),
+        Validator('geodata.coordinate_precision',
+                  default=1,
+                  is_type_of=(int, float),
+                  gte=0),
+        Validator('geodata.equal_area_crs',
+                  default='EPSG:3035',
+                  is_type_of=str),
+        Validator('geodata.resolution_levels',
+                  default={'high': 10, 'medium': 50, 'low': 200},
+                  is_type_of=dict),
         Validator('data.saving_format',
                   default='parquet',
                   is_type_of=str),
     ]
 
 
+def get_pv_coverage_validators() -> List[Validator]:
+    """ Photovoltaic coverage validators.
+
+    :return: list of photovoltaic coverage validators.
+    """
+    return [
+        Validator('pv_coverage.hourly.municipalities_per_chunk',
+                  default=64,
+                  is_type_of=int,
+                  gt=0),
+        Validator('pv_coverage.hourly.hours_per_chunk',
+                  default=8760,
+                  is_type_of=int,
+                  gt=0),
+        Validator('pv_coverage.hourly.demand_column',
+                  default='Demanda real',
+                  is_type_of=str),
+        Validator('pv_coverage.hourly.pv_column',
+                  default='Solar fotovoltaica',
+                  is_type_of=str),
+        Validator('pv_coverage.power_per_ha_pv_roof',
+                  default=1000,
+                  is_type_of=(int, float),
+                  gt=0),
+        Validator('pv_installations.categories_mapping',
+                  default={},
+                  is_type_of=dict),
+        Validator('pv_installations.excluded_categories',
+                  default=['EXT'],
+                  is_type_of=list),
+        Validator('pv_installations.floor_categories',
+                  default=['IND-SUELO', 'URB-SUELO'],
+                  is_type_of=list),
+        Validator('pv_installations.overlaps.precedence',
+                  default='source',
+                  is_in=['source', 'category', 'largest']),
+        Validator('pv_installations.overlaps.category_order',
+                  default=[],
+                  is_type_of=list),
+    ]
+
+
+def get_maps_validators() -> List[Validator]:
+    """ Maps rendering validators.
+
+    :return: list of maps rendering validators.
+    """
+    return [
+        Validator('maps.crs',
+                  default='EPSG:25830',
+                  is_type_of=str),
+        Validator('maps.simplify_tolerance',
+                  default=25,
+                  is_type_of=(int, float),
+                  gte=0),
+        Validator('maps.formats',
+                  default=['png'],
+                  is_type_of=list),
+        Validator('maps.figsize',
+                  default=[10, 10],
+                  is_type_of=list),
+        Validator('maps.dpi',
+                  default=100,
+                  is_type_of=int),
+        Validator('maps.workers',
+                  default=0,
+                  is_type_of=int,
+                  gte=0),
+    ]
+
+
+def get_vector_tiles_validators() -> List[Validator]:
+    """ Vector tiles validators.
+
+    :return: list of vector tiles validators.
+    """
+    return [
+        Validator('vector_tiles.min_zoom',
+                  default=6,
+                  is_type_of=int,
+                  gte=0),
+        Validator('vector_tiles.max_zoom',
+                  default=14,
+                  is_type_of=int,
+                  lte=22),
+        Validator('vector_tiles.extent',
+                  default=4096,
+                  is_type_of=int),
+        Validator('vector_tiles.buffer',
+                  default=64,
+                  is_type_of=int),
+        Validator('vector_tiles.simplify_pixels',
+                  default=1.0,
+                  is_type_of=(int, float),
+                  gte=0),
+        Validator('vector_tiles.workers',
+                  default=0,
+                  is_type_of=int,
+                  gte=0),
+    ]
+
+
+def get_spatial_lookup_validators() -> List[Validator]:
+    """ Spatial lookup validators.
+
+    :return: list of spatial lookup validators.
+    """
+    return [
+        Validator('spatial_lookup.index_folder',
+                  default='/data/processed/spatial_index',
+                  is_type_of=str),
+        Validator('spatial_lookup.municipality_columns',
+                  default=['municipio_id', 'municipio_nombre'],
+                  is_type_of=list),
+        Validator('spatial_lookup.land_use_columns',
+                  default=['ID_USO_MAX'],
+                  is_type_of=list),
+        Validator('spatial_lookup.host',
+                  default='127.0.0.1',
+                  is_type_of=str),
+        Validator('spatial_lookup.port',
+                  default=8765,
+                  is_type_of=int),
+    ]
+
+
+def get_benchmarks_validators() -> List[Validator]:
+    """ Benchmarks validators.
+
+    :return: list of benchmarks validators.
+    """
+    return [
+        Validator('benchmarks.results_folder',
+                  default='benchmarks/results',
+                  is_type_of=str),
+        Validator('benchmarks.regression_threshold',
+                  default=1.25,
+                  is_type_of=(int, float),
+                  gt=1),
+        Validator('benchmarks.ree_latency',
+                  default=0.05,
+                  is_type_of=(int, float),
+                  gte=0),
+    ]
+
+
+def get_arrow_cache_validators() -> List[Validator]:
+    """ Arrow cache validators.
+
+    :return: list of Arrow cache validators.
+    """
+    return [
+        Validator('arrow_cache.enabled',
+                  default=True,
+                  is_type_of=bool),
+        Validator('arrow_cache.folder_name',
+                  default='.arrow_cache',
+                  is_type_of=str),
+        Validator('arrow_cache.zero_copy',
+                  default=False,
+                  is_type_of=bool),
+    ]
+
+
+def get_partitioning_validators() -> List[Validator]:
+    """ Partitioned processing validators.
+
+    :return: list of partitioned processing validators.
+    """
+    return [
+        Validator('partitioning.enabled',
+                  default=False,
+                  is_type_of=bool),
+        Validator('partitioning.folder',
+                  default='/data/processed/partitions',
+                  is_type_of=str),
+        Validator('partitioning.batch_size',
+                  default=50000,
+                  is_type_of=int,
+                  gt=0),
+        Validator('partitioning.cells_per_axis',
+                  default=8,
+                  is_type_of=int,
+                  gt=0),
+        Validator('partitioning.workers',
+                  default=0,
+                  is_type_of=int,
+                  gte=0),
+    ]
+
+
+def get_land_use_validators() -> List[Validator]:
+    """ Land use validators.
+
+    :return: list of land use validators.
+    """
+    return [
+        Validator('land_use.raster_path',
+                  default='/data/processed/land_use_raster.grid',
+                  is_type_of=str),
+        Validator('land_use.raster_resolution',
+                  default=10,
+                  is_type_of=(int, float),
+                  gt=0),
+    ]
+
+
+def get_cli_validators() -> List[Validator]:
+    """ Command line interface validators.
+
+    :return: list of command line interface validators.
+    """
+    return [
+        Validator('cli.workers',
+                  default=0,
+                  is_type_of=int,
+                  gte=0),
+    ]
+
+
 def get_ree_api_validator() -> List[Validator]:
     """ REE API validator.
 
@@ -47,12 +294,72 @@ def get_ree_api_validator() -> List[Validator]:
         Validator('ree_demanda.url',
                   default='demanda.ree.es',
                   is_type_of=str),
+        # http only to query a local stand-in of the APIs
+        Validator('ree_data.scheme',
+                  'ree_demanda.scheme',
+                  default='https',
+                  is_in=['http', 'https']),
         Validator('ree.token',
                   must_exist=True,
                   is_type_of=str),
         Validator('ree.max_days_per_request',
                   default=31,
-                  is_type_of=int)
+                  is_type_of=int),
+        Validator('ree.timezone',
+                  default='Europe/Madrid',
+                  is_type_of=str),
+        Validator('ree.storage.folder',
+                  default='/data/processed/ree',
+                  is_type_of=str),
+        Validator('ree.pipeline.fetchers',
+                  default=4,
+                  is_type_of=int,
+                  gt=0),
+        Validator('ree.pipeline.queue_size',
+                  default=8,
+                  is_type_of=int,
+                  gt=0),
+        Validator('ree.rate_limit.folder',
+                  default='/tmp/pv_stats/rate_limits',
+                  is_type_of=str),
+        Validator('ree.rate_limit.data.rate',
+                  'ree.rate_limit.demanda.rate',
+                  default=1.0,
+                  is_type_of=(int, float),
+                  gte=0),
+        Validator('ree.rate_limit.data.burst',
+                  'ree.rate_limit.demanda.burst',
+                  default=1,
+                  is_type_of=int,
+                  gt=0),
+        Validator('ree.decoding.json_backend',
+                  default='auto',
+                  is_in=['auto', 'orjson', 'json']),
+        Validator('ree.frames.float32_atol',
+                  default=0.01,
+                  is_type_of=(int, float),
+                  gte=0),
+        Validator('ree.scheduler.state_path',
+                  default='/data/processed/ree/catalog_progress.json',
+                  is_type_of=str),
+        Validator('ree.scheduler.concurrency',
+                  default=4,
+                  is_type_of=int,
+                  gt=0),
+        Validator('ree.scheduler.window_freq.hour',
+                  default='SMS',
+                  is_type_of=str),
+        Validator('ree.scheduler.window_freq.day',
+                  'ree.scheduler.window_freq.month',
+                  default='YS',
+                  is_type_of=str),
+        Validator('ree.scheduler.window_freq.year',
+                  default='10YS',
+                  is_type_of=str),
+        Validator('ree.gaps.merge_hours',
+                  default=24,
+                  is_type_of=int,
+                  gte=0),
     ]
 
 
@@ -63,6 +370,15 @@ def get_validators() -> List[Validator]:
     """
     validators = get_logging_validators()
     validators += get_config_validators()
+    validators += get_pv_coverage_validators()
+    validators += get_maps_validators()
+    validators += get_vector_tiles_validators()
+    validators += get_spatial_lookup_validators()
+    validators += get_benchmarks_validators()
+    validators += get_arrow_cache_validators()
+    validators += get_partitioning_validators()
+    validators += get_land_use_validators()
+    validators += get_cli_validators()
     validators += get_ree_api_validator()
 
     return validators
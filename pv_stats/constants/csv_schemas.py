@@ -0,0 +1,33 @@
+# Schemas of the CSV sources, applied when the file is parsed. The keys are:
+# - delimiter, encoding and decimal_point: format of the file.
+# - thousands: optional thousands separator of the numeric columns.
+# - column_types: arrow type of each column.
+# - default_type: optional arrow type of the columns not in `column_types`.
+CITIES_INFO_SCHEMA = {
+    'delimiter': ';',
+    'encoding': 'ISO-8859-1',
+    'decimal_point': '.',
+    'thousands': None,
+    'column_types': {
+        'municipio_codigo': 'int32',
+        'municipio_codigo_ine': 'int32',
+        'municipio_nombre': 'string',
+        'nuts4_codigo': 'int32',
+        'nuts4_nombre': 'string',
+        'superficie_km2': 'float64',
+        'densidad_por_km2': 'float64',
+    },
+    'default_type': None,
+}
+
+# Consumption in MWh per year, with points as thousands separator
+CONSUMPTION_PER_CITY_SCHEMA = {
+    'delimiter': ',',
+    'encoding': 'ISO-8859-1',
+    'decimal_point': ',',
+    'thousands': '.',
+    'column_types': {
+        'Nombre': 'string',
+    },
+    'default_type': 'int64',
+}
@@ -1,34 +1,43 @@
-from pathlib import Path
+from __future__ import annotations
 
-import geopandas as gpd
+from pathlib import Path
 
+from pv_stats.config.config import settings
 from pv_stats.utils.df_processing import (process_administrative_divisions_df,
                                           process_cities_info_df,
                                           process_consumption_per_city_df)
+from pv_stats.utils.geometry import get_resolution_tolerance, simplify_coverage
+from pv_stats.utils.lazy_imports import lazy_import
+from pv_stats.utils.municipality_registry import merge_municipalities
+
+gpd = lazy_import('geopandas')
 
 
 def draw_consumption_per_city(cities_info: str | Path,
                               consumption_per_city: str | Path,
-                              administrative_divisions: str | Path) -> None:
+                              administrative_divisions: str | Path,
+                              resolution: str = None,
+                              save_path: str | Path = None) -> None:
     """
 
     :param cities_info:
     :param administrative_divisions:
     :param consumption_per_city:
+    :param resolution: optional resolution level to simplify the exported geometries.
+    :param save_path: path of the exported GeoJSON. By default, `cities_info_and_consumption.geojson`
+      in the `results_folder` setting.
     :return:
     """
     cities_info_df = process_cities_info_df(cities_info)
     consumption_per_city_df = process_consumption_per_city_df(consumption_per_city)
 
-    administrative_divisions_df = process_administrative_divisions_df(administrative_divisions)
+    administrative_divisions_df = process_administrative_divisions_df(administrative_divisions, cities_info)
 
     # Match city per administrative division
-    cities_info_geo = cities_info_df.merge(administrative_divisions_df,
-                                           left_index=True, right_index=True)
+    cities_info_geo = merge_municipalities(cities_info_df, administrative_divisions_df,
+                                           suffixes=('', '_divisions'))
     # Match city with consumption
-    cities_info_and_consumption_df = cities_info_geo.merge(consumption_per_city_df,
-                                                           left_on='municipio_nombre',
-                                                           right_on='Nombre')
+    cities_info_and_consumption_df = merge_municipalities(cities_info_geo, consumption_per_city_df)
 
     # Calculate interesting things
     cities_info_and_consumption_df['consumption_per_capita'] = (cities_info_and_consumption_df['2021'] /
@@ -37,12 +46,9 @@ def draw_consumption_per_city(cities_info: str | Path,
                                                              cities_info_and_consumption_df['superficie_km2'])
 
     cities_info_and_consumption_geo = gpd.GeoDataFrame(cities_info_and_consumption_df, geometry='geometry')
-    cities_info_and_consumption_geo.to_file('/data/cities_info_and_consumption.geojson', driver='GeoJSON')
-
-
-if __name__ == '__main__':
-    cities_data = '/data/municipio_comunidad_madrid.csv'
-    elec_per_city = '/data/electricidad_municipios.csv'
-    ad_divisions = '/data/DIVISIONES_ADMINISTRATIVAS_CM.gpkg'
+    if resolution:
+        cities_info_and_consumption_geo = simplify_coverage(cities_info_and_consumption_geo,
+                                                            get_resolution_tolerance(resolution))
+    save_path = save_path or Path(settings.results_folder) / 'cities_info_and_consumption.geojson'
+    cities_info_and_consumption_geo.to_file(save_path, driver='GeoJSON')
 
-    draw_consumption_per_city(cities_data, elec_per_city, ad_divisions)
@@ -0,0 +1,178 @@
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+from pv_stats.config.config import settings
+from pv_stats.utils.instrumentation import instrument
+
+HOURS_PER_YEAR = 8760
+
+
+def build_hourly_profile(ree_df: pd.DataFrame,
+                         column: str,
+                         time_column: str = None) -> pd.Series:
+    """ Build a normalized hourly profile from a REE frame.
+
+    The values are averaged per hour, which turns the 10 minutes power values of the
+    `REEDemandaAPI` into hourly energy, and normalized so each year of data sums one.
+    Multiplying the profile by an annual value distributes it over the hours.
+
+    :param ree_df: frame returned by `REEDataAPI.get_demand` or `REEDemandaAPI.get_generation`.
+    :param column: column with the values to use, e.g. `Demanda real`, `Demanda` or `Solar fotovoltaica`.
+    :param time_column: column with the timestamps. If not given, the index is used.
+    :return: float32 series indexed by the hour in UTC.
+    """
+    times = ree_df[time_column] if time_column else ree_df.index
+    values = pd.Series(pd.to_numeric(ree_df[column], errors='coerce').to_numpy(),
+                       index=pd.to_datetime(times, utc=True))
+
+    hourly = values.resample('h').mean().interpolate(limit_direction='both')
+    if hourly.sum() <= 0:
+        raise ValueError(f'The column `{column}` does not have positive values to build a profile.')
+
+    years = len(hourly) / HOURS_PER_YEAR
+    profile = hourly / hourly.sum() * years
+    return profile.astype(np.float32)
+
+
+def read_hourly_profile(ree_path: str | Path,
+                        column: str) -> pd.Series:
+    """ Build the hourly profile of a file saved by `retrieve_demand` or `retrieve_generation`.
+
+    :param ree_path: CSV file indexed by the time.
+    :param column: column with the values to use, e.g. `Demanda real` or `Solar fotovoltaica`.
+    :return: profile from `build_hourly_profile`.
+    """
+    return build_hourly_profile(pd.read_csv(ree_path, index_col=0), column)
+
+
+def align_profiles(demand_profile: pd.Series,
+                   pv_profile: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """ Keep only the hours shared by both profiles.
+
+    :param demand_profile: hourly demand profile.
+    :param pv_profile: hourly photovoltaic generation profile.
+    :return: both profiles restricted to the common hours.
+    """
+    common_hours = demand_profile.index.intersection(pv_profile.index)
+    if common_hours.empty:
+        raise ValueError('The demand and photovoltaic profiles do not share any hour.')
+
+    return demand_profile.loc[common_hours], pv_profile.loc[common_hours]
+
+
+def iter_hourly_balance(annual_consumption: np.ndarray,
+                        annual_generation: np.ndarray,
+                        demand_profile: np.ndarray,
+                        pv_profile: np.ndarray,
+                        municipalities_per_chunk: int = None,
+                        hours_per_chunk: int = None
+                        ) -> Iterator[Tuple[slice, slice, np.ndarray, np.ndarray, np.ndarray]]:
+    """ Compute the hourly self-consumption, surplus and deficit by chunks of
+    municipalities and hours, so the full matrix never lives in memory.
+
+    :param annual_consumption: annual consumption per municipality in MWh.
+    :param annual_generation: annual photovoltaic generation per municipality in MWh.
+    :param demand_profile: normalized hourly demand profile.
+    :param pv_profile: normalized hourly photovoltaic profile, same length as the demand one.
+    :param municipalities_per_chunk: number of municipalities evaluated at once.
+    :param hours_per_chunk: number of hours evaluated at once.
+    :return: iterator with the municipalities slice, the hours slice and the float32
+      self-consumption, surplus and deficit arrays in MWh of the chunk.
+    """
+    municipalities_per_chunk = municipalities_per_chunk or settings.pv_coverage.hourly.municipalities_per_chunk
+    hours_per_chunk = hours_per_chunk or settings.pv_coverage.hourly.hours_per_chunk
+
+    annual_consumption = np.asarray(annual_consumption, dtype=np.float32)
+    annual_generation = np.asarray(annual_generation, dtype=np.float32)
+    demand_profile = np.asarray(demand_profile, dtype=np.float32)
+    pv_profile = np.asarray(pv_profile, dtype=np.float32)
+    if demand_profile.shape != pv_profile.shape:
+        raise ValueError('The demand and photovoltaic profiles must have the same length.')
+
+    n_municipalities = annual_consumption.shape[0]
+    n_hours = demand_profile.shape[0]
+    for m_start in range(0, n_municipalities, municipalities_per_chunk):
+        m_slice = slice(m_start, min(m_start + municipalities_per_chunk, n_municipalities))
+        for h_start in range(0, n_hours, hours_per_chunk):
+            h_slice = slice(h_start, min(h_start + hours_per_chunk, n_hours))
+
+            demand = np.multiply.outer(annual_consumption[m_slice], demand_profile[h_slice])
+            generation = np.multiply.outer(annual_generation[m_slice], pv_profile[h_slice])
+            self_consumption = np.minimum(demand, generation)
+            # Reuse the buffers to keep only three arrays per chunk
+            surplus = np.subtract(generation, self_consumption, out=generation)
+            deficit = np.subtract(demand, self_consumption, out=demand)
+
+            yield m_slice, h_slice, self_consumption, surplus, deficit
+
+
+def match_hourly_coverage(annual_consumption: np.ndarray,
+                          annual_generation: np.ndarray,
+                          demand_profile: np.ndarray,
+                          pv_profile: np.ndarray,
+                          municipalities_per_chunk: int = None,
+                          hours_per_chunk: int = None) -> pd.DataFrame:
+    """ Match the hourly demand and photovoltaic generation of each municipality and
+    aggregate the balance over the whole period.
+
+    :param annual_consumption: annual consumption per municipality in MWh.
+    :param annual_generation: annual photovoltaic generation per municipality in MWh.
+    :param demand_profile: normalized hourly demand profile.
+    :param pv_profile: normalized hourly photovoltaic profile, same length as the demand one.
+    :param municipalities_per_chunk: number of municipalities evaluated at once.
+    :param hours_per_chunk: number of hours evaluated at once.
+    :return: DataFrame with the self-consumption, surplus and deficit in MWh per municipality.
+    """
+    n_municipalities = len(annual_consumption)
+    # Accumulate in float64 so the sum of many float32 hours does not lose precision
+    totals = np.zeros((3, n_municipalities), dtype=np.float64)
+    for m_slice, _, self_consumption, surplus, deficit in iter_hourly_balance(annual_consumption,
+                                                                              annual_generation,
+                                                                              demand_profile,
+                                                                              pv_profile,
+                                                                              municipalities_per_chunk,
+                                                                              hours_per_chunk):
+        totals[0, m_slice] += self_consumption.sum(axis=1, dtype=np.float64)
+        totals[1, m_slice] += surplus.sum(axis=1, dtype=np.float64)
+        totals[2, m_slice] += deficit.sum(axis=1, dtype=np.float64)
+
+    return pd.DataFrame({'self_consumption': totals[0],
+                         'surplus': totals[1],
+                         'deficit': totals[2]})
+
+
+@instrument('process')
+def process_hourly_fv_coverage(fv_coverage_df: pd.DataFrame,
+                               demand_profile: pd.Series,
+                               pv_profile: pd.Series) -> pd.DataFrame:
+    """ Add the hourly matched coverage to the output of `process_fv_coverage`.
+
+    The annual consumption and generation of each municipality are distributed over the
+    hours with the profiles, so the generation that exceeds the demand of a given hour
+    is not counted as covered.
+
+    :param fv_coverage_df: photovoltaic coverage data per city.
+    :param demand_profile: normalized hourly demand profile, see `build_hourly_profile`.
+    :param pv_profile: normalized hourly photovoltaic profile, see `build_hourly_profile`.
+    :return: copy of the coverage data with the hourly self-consumption, surplus and deficit columns.
+    """
+    fv_coverage_df = fv_coverage_df.copy()
+    demand_profile, pv_profile = align_profiles(demand_profile, pv_profile)
+    years = len(demand_profile) / HOURS_PER_YEAR
+
+    balance = match_hourly_coverage(fv_coverage_df['mean_electricity_consumption'].to_numpy(),
+                                    fv_coverage_df['electricity_generated_annually'].to_numpy(),
+                                    demand_profile.to_numpy(),
+                                    pv_profile.to_numpy())
+
+    # Report the values per year to compare them with the annual columns
+    fv_coverage_df['hourly_self_consumption'] = balance['self_consumption'].to_numpy() / years
+    fv_coverage_df['hourly_surplus'] = balance['surplus'].to_numpy() / years
+    fv_coverage_df['hourly_deficit'] = balance['deficit'].to_numpy() / years
+    fv_coverage_df['hourly_covered_percentage'] = (fv_coverage_df['hourly_self_consumption'] /
+                                                   fv_coverage_df['mean_electricity_consumption'])
+
+    return fv_coverage_df
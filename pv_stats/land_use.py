@@ -1,19 +1,29 @@
+from __future__ import annotations
+
 from pathlib import Path
 from typing import List
 
-import geopandas as gpd
 import pandas as pd
 
 from pv_stats.config.config import settings
 from pv_stats.utils.df_processing import process_land_use_df, join_administrative_divisions_dfs
 from pv_stats.utils.io_utils import read_geo_dataframe, save_dataframe
+from pv_stats.utils.land_use_raster import LandUseRaster
+from pv_stats.utils.lazy_imports import lazy_import
+from pv_stats.utils.municipality_registry import attach_municipality_key, merge_municipalities
+from pv_stats.utils.partitioning import ROW_COLUMN, map_geo_files
+
+gpd = lazy_import('geopandas')
+
+# Columns of SIOSE with the INE code and the name of the municipality
+MUNICIPALITY_COLUMNS = ['MUNICIPIO', 'MUNICIPIO_NOMBRE']
 
 
 def filter_and_group_land_use_per_id(land_use_df: gpd.GeoDataFrame,
                                      ids: int | List[int]) -> gpd.GeoDataFrame:
     """ Filter the land use by category and group it per city.
 
-    :param land_use_df: land use GeoDataFrame.
+    :param land_use_df: land use GeoDataFrame with the `municipio_id` key.
     :param ids: id or list of ids from SIOSE with the land use categories to filter.
     :return: filtered and grouped per city GeoDataFrame.
     """
@@ -21,24 +31,65 @@ def filter_and_group_land_use_per_id(land_use_df: gpd.GeoDataFrame,
         ids = [ids]
 
     filtered_land_use = land_use_df.loc[land_use_df['ID_USO_MAX'].isin(ids)]
-    filtered_land_use = filtered_land_use.groupby(
-        ['MUNICIPIO', 'MUNICIPIO_NOMBRE'],
-        as_index=False
-    )['SUPERF_M2'].sum()
-    filtered_land_use['superficie_km2'] = filtered_land_use['SUPERF_M2'] / 10 ** 6
-    filtered_land_use['superficie_m2'] = filtered_land_use['SUPERF_M2']
-    filtered_land_use.drop(columns=['SUPERF_M2'], inplace=True)
+    # The rows without key were reported when it was attached
+    filtered_land_use = filtered_land_use.groupby('municipio_id', as_index=False).agg(
+        MUNICIPIO=('MUNICIPIO', 'first'),
+        MUNICIPIO_NOMBRE=('MUNICIPIO_NOMBRE', 'first'),
+        superficie_m2=('SUPERF_M2', 'sum'))
+    filtered_land_use.insert(3, 'superficie_km2', filtered_land_use['superficie_m2'] / 10 ** 6)
+
+    return filtered_land_use
+
+
+def group_raster_land_use_per_id(raster: LandUseRaster,
+                                 administrative_divisions_df: gpd.GeoDataFrame,
+                                 ids: int | List[int]) -> pd.DataFrame:
+    """ Approximate version of `filter_and_group_land_use_per_id` that computes the
+    areas from the rasterized land use instead of the SIOSE polygons.
+
+    :param raster: land use raster built with `rasterize_land_use`.
+    :param administrative_divisions_df: municipalities GeoDataFrame with the `municipio_id` column.
+    :param ids: id or list of ids from SIOSE with the land use categories to filter.
+    :return: DataFrame with the area per city.
+    """
+    if isinstance(ids, int):
+        ids = [ids]
+
+    areas = raster.zonal_areas(administrative_divisions_df, 'municipio_id')
+    areas_per_city = areas.reindex(columns=ids, fill_value=0).sum(axis=1)
+    filtered_land_use = pd.DataFrame({'municipio_id': areas_per_city.index,
+                                      'superficie_m2': areas_per_city.to_numpy()})
+    filtered_land_use['superficie_km2'] = filtered_land_use['superficie_m2'] / 10 ** 6
 
     return filtered_land_use
 
 
-def filter_land_use(land_use_path: str | Path) -> pd.DataFrame:
+def _land_use_zones_attributes(land_use_df: gpd.GeoDataFrame) -> pd.DataFrame:
+    """ Attributes of the polygons of the filtered zones, without the geometries. """
+    zone_ids = (settings.land_use.industrial_zones + settings.land_use.urban_zones
+                + settings.land_use.service_zones + settings.land_use.urbanized_zones)
+    land_use_df = land_use_df.loc[land_use_df['ID_USO_MAX'].isin(zone_ids)]
+    columns = ['municipio_id', *MUNICIPALITY_COLUMNS, 'ID_USO_MAX', 'SUPERF_M2', ROW_COLUMN]
+    return pd.DataFrame(land_use_df[[column for column in columns if column in land_use_df.columns]])
+
+
+def filter_land_use(land_use_path: str | Path,
+                    partitioned: bool = None) -> pd.DataFrame:
     """
 
     :param land_use_path: path to the land use file.
+    :param partitioned: read the file by spatial partitions in all the cores, keeping
+      only the attributes of the zones in memory. By default, the `partitioning.enabled` setting.
     :return:
     """
-    land_use_df = read_geo_dataframe(land_use_path)
+    partitioned = settings.partitioning.enabled if partitioned is None else partitioned
+    if partitioned:
+        land_use_df = map_geo_files(land_use_path, _land_use_zones_attributes)
+    else:
+        land_use_df = read_geo_dataframe(land_use_path)
+    if 'municipio_id' not in land_use_df.columns:
+        # SIOSE identifies the municipalities with the INE code
+        attach_municipality_key(land_use_df, 'MUNICIPIO', 'municipio_codigo_ine')
 
     # Filter industrial zones
     industrial_zones_df = filter_and_group_land_use_per_id(land_use_df, settings.land_use.industrial_zones)
@@ -56,20 +107,20 @@ def filter_land_use(land_use_path: str | Path) -> pd.DataFrame:
     urbanized_zones_df = filter_and_group_land_use_per_id(land_use_df, settings.land_use.urbanized_zones)
     save_dataframe('urbanized_zones', urbanized_zones_df, saving_folder=settings.results_folder)
 
-    # Join all to create a CSV
-    merge_industrial = urbanized_zones_df.merge(industrial_zones_df,
-                                                how='outer',
-                                                on=['MUNICIPIO', 'MUNICIPIO_NOMBRE'],
-                                                suffixes=('_urbanized', '_industrial'))
+    # Join all to create a CSV, on the municipality key. The names are added at the end, as
+    # a municipality may only have some of the zones
+    zones_dfs = [urbanized_zones_df, industrial_zones_df, urban_zones_df, service_zones_df]
+    names_df = pd.concat([zones_df[['municipio_id', *MUNICIPALITY_COLUMNS]] for zones_df in zones_dfs])
+    names_df = names_df.drop_duplicates('municipio_id')
+    urbanized_df, industrial_df, urban_df, service_df = [zones_df.drop(columns=MUNICIPALITY_COLUMNS)
+                                                         for zones_df in zones_dfs]
+    merge_industrial = merge_municipalities(urbanized_df, industrial_df, how='outer',
+                                            suffixes=('_urbanized', '_industrial'))
     # This one does not need suffixes because no column name is shared.
-    merge_urban = merge_industrial.merge(urban_zones_df,
-                                         how='outer',
-                                         on=['MUNICIPIO', 'MUNICIPIO_NOMBRE'])
+    merge_urban = merge_municipalities(merge_industrial, urban_df, how='outer')
     # This one needs suffixes as previous and new column share name. First urban, then service
-    final_df = merge_urban.merge(service_zones_df,
-                                 how='outer',
-                                 on=['MUNICIPIO', 'MUNICIPIO_NOMBRE'],
-                                 suffixes=('_urban', '_service'))
+    merge_service = merge_municipalities(merge_urban, service_df, how='outer', suffixes=('_urban', '_service'))
+    final_df = merge_municipalities(names_df, merge_service, how='right')
 
     save_dataframe('superficie_por_municipio', final_df, saving_folder=settings.results_folder)
     return final_df
@@ -94,11 +145,3 @@ def calculate_urban_zone_per_city(administrative_divisions_path: str | Path,
 
     pass
 
-
-if __name__ == '__main__':
-    land_use_full = '/data/processed/land_use_full.parquet'
-    land_use_filtered = '/data/processed/land_use.parquet'
-    administrative_divisions = '/data/processed/administrative_divisions_with_info.geojson'
-
-    # calculate_urban_zone_per_city(administrative_divisions, land_use_geo)
-    filter_land_use(land_use_full)
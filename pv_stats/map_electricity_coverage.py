@@ -1,19 +1,27 @@
+from __future__ import annotations
+
 from pathlib import Path
+from typing import List
 
-import geopandas as gpd
 import pandas as pd
-from matplotlib import pyplot as plt
 
 from pv_stats.config.config import settings
-from pv_stats.utils.io_utils import read_dataframe, read_geo_dataframe
+from pv_stats.hourly_coverage import process_hourly_fv_coverage, read_hourly_profile
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.io_utils import read_dataframe, read_geo_dataframe, save_geo_dataframe
+from pv_stats.utils.lazy_imports import lazy_import
+from pv_stats.utils.municipality_registry import attach_municipality_key, merge_municipalities
 
+gpd = lazy_import('geopandas')
+plt = lazy_import('matplotlib.pyplot')
 
-def process_fv_coverage(file_path: str | Path) -> gpd.GeoDataFrame:
+
+def read_fv_coverage(file_path: str | Path) -> pd.DataFrame:
     """
-    Process the excel file with the cities data to get the electricity coverage.
+    Read the file with the cities data, keeping the columns with data.
 
-    :param file_path: The path to the excel file.
-    :return: None
+    :param file_path: The path to the file.
+    :return: DataFrame with the columns renamed with the `pv_coverage.column_rename` setting.
     """
     df = read_dataframe(file_path)
 
@@ -22,12 +30,27 @@ def process_fv_coverage(file_path: str | Path) -> gpd.GeoDataFrame:
     # Cogemos de las columnas A:F, que son las que tienen datos definidos.
     df = df.iloc[:, :6]
     column_rename = settings.pv_coverage.column_rename
-    df.rename(columns=column_rename, inplace=True)
+    return df.rename(columns=column_rename)
 
+
+def calculate_fv_coverage(df: pd.DataFrame,
+                          roof_ha_column: str = 'urban_ha',
+                          power_per_ha_roof: float = None) -> pd.DataFrame:
+    """
+    Calculate the electricity coverage of each city with photovoltaic panels on roofs and
+    the floor required to reach the `pv_coverage.consumption_to_cover` setting.
+
+    :param df: DataFrame with the roof area in ha and the `mean_electricity_consumption`
+      and `rural_ha` columns.
+    :param roof_ha_column: column with the roof area where the panels are installed.
+    :param power_per_ha_roof: power in kW per ha of that area. By default, the
+      `pv_coverage.power_per_ha_roof` setting.
+    :return: the DataFrame with the coverage columns.
+    """
     # Creamos una nueva columna con la potencia en cubierta en MW, que es la potencia que se puede instalar
     # en la superficie urbana. Requiere del parámetro potencia por hectárea.
-    power_per_ha_roof = settings.pv_coverage.power_per_ha_roof
-    df['power_in_roof'] = df['urban_ha'] * power_per_ha_roof / 1000
+    power_per_ha_roof = power_per_ha_roof or settings.pv_coverage.power_per_ha_roof
+    df['power_in_roof'] = df[roof_ha_column] * power_per_ha_roof / 1000
 
     # Creamos otra columna con la demanda de electricidad anual cubierta en MWh por lo
     # instalado en cubiertas. Requiera las horas estimadas de funcionamiento al año.
@@ -51,14 +74,8 @@ def process_fv_coverage(file_path: str | Path) -> gpd.GeoDataFrame:
     # lo que ya se cubre con las cubiertas.
     # La fórmula en excel es =IF(covered_percentage<consumption_to_cover;
     # (consumption_to_cover*mean_electricity_consumption-electricity_covered_annually); 0)
-    df['electricity_required_in_floor'] = df.apply(
-        lambda x: (
-                consumption_to_cover *
-                x['mean_electricity_consumption'] -
-                x['electricity_covered_annually']
-        ) if x['covered_percentage'] < consumption_to_cover else 0,
-        axis=1
-    )
+    required = consumption_to_cover * df['mean_electricity_consumption'] - df['electricity_covered_annually']
+    df['electricity_required_in_floor'] = required.where(df['covered_percentage'] < consumption_to_cover, 0)
 
     # La potencia en suelo necesaria para cubrir la demanda.
     hef_floor = settings.pv_coverage.hef_floor
@@ -75,6 +92,36 @@ def process_fv_coverage(file_path: str | Path) -> gpd.GeoDataFrame:
     return df
 
 
+@instrument('process')
+def process_fv_coverage(file_path: str | Path) -> gpd.GeoDataFrame:
+    """
+    Process the excel file with the cities data to get the electricity coverage.
+
+    :param file_path: The path to the excel file.
+    :return: None
+    """
+    return calculate_fv_coverage(read_fv_coverage(file_path))
+
+
+@instrument('process')
+def process_fv_coverage_from_geometry(file_path: str | Path,
+                                      pv_area_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Electricity coverage of each city with the roof area of its PV polygons, instead of the
+    urban surface of the cities data.
+
+    :param file_path: The path to the file with the cities data.
+    :param pv_area_df: area per municipality from `calculate_pv_area_per_city`.
+    :return: DataFrame with the `municipio_id` key and the coverage columns.
+    """
+    df = read_fv_coverage(file_path)
+    attach_municipality_key(df, 'municipio', 'nombre')
+    roof_ha = pv_area_df.groupby(level='municipio_id')['roof_ha'].sum()
+    # The municipalities without PV polygons do not have usable roofs
+    df['roof_ha'] = df['municipio_id'].map(roof_ha).fillna(0).astype(float)
+    return calculate_fv_coverage(df, 'roof_ha', settings.pv_coverage.power_per_ha_pv_roof)
+
+
 def relate_fv_location_df(df: pd.DataFrame, geo_df: str | Path) -> gpd.GeoDataFrame | pd.DataFrame:
     """
     Relate the electricity coverage data with the localization data.
@@ -84,22 +131,25 @@ def relate_fv_location_df(df: pd.DataFrame, geo_df: str | Path) -> gpd.GeoDataFr
     :return: gpd.GeoDataFrame
     """
     geo_df = read_geo_dataframe(geo_df)
-    df['municipio'] = df['municipio'].str.strip()
-    # Join the dataframes by the 'municipio_nombre' column in the geo_df and the
-    # 'municipio' column in the df
-    join_df = geo_df.merge(df, left_on='municipio_nombre', right_on='municipio')
+    if 'municipio_id' not in geo_df.columns:
+        attach_municipality_key(geo_df, 'municipio_codigo', 'municipio_codigo')
+    # The coverage data only has the name of the municipality
+    attach_municipality_key(df, 'municipio', 'nombre')
+    join_df = merge_municipalities(geo_df, df)
 
     return join_df
 
 
 def plot_geo_fv_coverage(geo_fv_coverage_df: gpd.GeoDataFrame,
-                         save_path: str | Path) -> None:
+                         save_path: str | Path,
+                         show: bool = True) -> None:
     """
     Plots the percentage of coverage that can be achieved with the data extracted
     per city, whose limits are defined in the geometry column.
 
     :param geo_fv_coverage_df: photovoltaic coverage data per city.
     :param save_path: path to save the plot.
+    :param show: whether to show the plot. Use `render_scenario_maps` to draw batches of maps.
     """
     # The coverage percentage goes from 0 to 1, where 0 is that no demand is covered
     # and 1 is that all the demand is covered. We will group in 5 categories.
@@ -125,18 +175,21 @@ def plot_geo_fv_coverage(geo_fv_coverage_df: gpd.GeoDataFrame,
                  fontsize=30)
     ax.set_axis_off()
     plt.savefig(save_path)
-    plt.show()
+    if show:
+        plt.show()
     plt.close()
 
 
 def plot_rural_floor_ha_required(geo_fv_coverage_df: gpd.GeoDataFrame,
-                                 save_path: str | Path) -> None:
+                                 save_path: str | Path,
+                                 show: bool = True) -> None:
     """
     Plots the percentage over the rural floor required to cover the demand established
     per city, whose limits are defined in the geometry column.
 
     :param geo_fv_coverage_df: photovoltaic coverage data per city.
     :param save_path: path to save the plot.
+    :param show: whether to show the plot. Use `render_scenario_maps` to draw batches of maps.
     """
     # Plot the data
     fig, ax = plt.subplots(1, 1, figsize=(10, 10))
@@ -156,15 +209,51 @@ def plot_rural_floor_ha_required(geo_fv_coverage_df: gpd.GeoDataFrame,
 
     ax.set_axis_off()
     plt.savefig(save_path)
-    plt.show()
+    if show:
+        plt.show()
     plt.close()
 
 
-if __name__ == '__main__':
-    fv_coverage_path = '/data/resumen_fv_municipios.csv'
-    administrative_divisions_path = '/data/processed/administrative_divisions_with_info.geojson'
-    fv_coverage_df = process_fv_coverage(fv_coverage_path)
+def map_fv_coverage(fv_coverage_path: str | Path,
+                    administrative_divisions_path: str | Path,
+                    results_folder: str | Path = None,
+                    show: bool = False,
+                    pv_paths: List[str | Path] = None,
+                    demand_path: str | Path = None,
+                    generation_path: str | Path = None) -> gpd.GeoDataFrame:
+    """
+    Relate the photovoltaic coverage per city with its limits, saving the results and the
+    map of the rural floor required.
+
+    :param fv_coverage_path: path to the CSV file with the photovoltaic coverage per city.
+    :param administrative_divisions_path: path to the administrative divisions with the cities info.
+    :param results_folder: folder of the results. By default, the `results_folder` setting.
+    :param show: whether to show the map.
+    :param pv_paths: layers with the PV installations. If given, the roof area of each city is
+      the one of its installations, instead of its urban surface.
+    :param demand_path: hourly demand saved by `retrieve_demand`. Together with `generation_path`,
+      the coverage is also matched hour by hour, adding the `hourly_*` columns.
+    :param generation_path: hourly generation saved by `retrieve_generation`.
+    :return: photovoltaic coverage per city with the geometries.
+    """
+    if (demand_path is None) != (generation_path is None):
+        raise ValueError('The hourly coverage needs both the demand and the generation files.')
+
+    results_folder = Path(results_folder or settings.results_folder)
+    if pv_paths:
+        from pv_stats.pv_area_per_city import calculate_pv_area_per_city
+
+        fv_coverage_df = process_fv_coverage_from_geometry(fv_coverage_path, calculate_pv_area_per_city(pv_paths))
+    else:
+        fv_coverage_df = process_fv_coverage(fv_coverage_path)
+    if demand_path is not None:
+        fv_coverage_df = process_hourly_fv_coverage(
+            fv_coverage_df,
+            read_hourly_profile(demand_path, settings.pv_coverage.hourly.demand_column),
+            read_hourly_profile(generation_path, settings.pv_coverage.hourly.pv_column))
     fv_coverage_geo_df = relate_fv_location_df(fv_coverage_df, administrative_divisions_path)
-    fv_coverage_geo_df.to_file('/data/results/fv_coverage.geojson', driver='GeoJSON')
-    # plot_geo_fv_coverage(fv_coverage_geo_df, '/data/results/fv_coverage.png')
-    plot_rural_floor_ha_required(fv_coverage_geo_df, '/data/results/fv_coverage_rural.png')
+    fv_coverage_geo_df.to_file(results_folder / 'fv_coverage.geojson', driver='GeoJSON')
+    # Lighter version of the results for the maps
+    save_geo_dataframe('fv_coverage', fv_coverage_geo_df, saving_folder=str(results_folder), resolution='medium')
+    plot_rural_floor_ha_required(fv_coverage_geo_df, results_folder / 'fv_coverage_rural.png', show=show)
+    return fv_coverage_geo_df
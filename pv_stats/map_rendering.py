@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.geometry import get_resolution_tolerance, simplify_coverage
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+
+# Geometry paths loaded once per worker process, see `_init_worker`
+_GEOMETRY_PATHS = None
+
+
+def _as_multipolygon(geometry: shapely.Geometry) -> shapely.MultiPolygon:
+    """ Promote the geometry to a multipolygon, dropping the non polygonal parts, so the
+    offsets of the ragged array are the same for all the rows. """
+    parts = shapely.get_parts(geometry)
+    parts = parts[shapely.get_type_id(parts) == 3]
+    return shapely.multipolygons(parts)
+
+
+def _geometry_fingerprint(geo_df: gpd.GeoDataFrame,
+                          simplify_tolerance: float = None,
+                          resolution: str = None) -> str:
+    """ Key of the geometries of a cache: the rows, their index and bounds, and how they are
+    simplified, so a cache built for other polygons is never reused. """
+    simplify_tolerance = settings.maps.simplify_tolerance if simplify_tolerance is None else simplify_tolerance
+    signature = hashlib.sha1()
+    signature.update(pd.util.hash_pandas_object(geo_df.index, index=False).to_numpy().tobytes())
+    signature.update(np.ascontiguousarray(shapely.bounds(np.asarray(geo_df.geometry.values))).tobytes())
+    signature.update(repr((len(geo_df), str(geo_df.crs), settings.maps.crs, resolution,
+                           0 if resolution else simplify_tolerance)).encode('utf-8'))
+    return signature.hexdigest()
+
+
+def _cached_fingerprint(cache_path: Path) -> str | None:
+    """ Fingerprint of the geometries of a cache, None if it does not exist. """
+    if not cache_path.exists():
+        return None
+    with np.load(cache_path) as cache:
+        return str(cache['fingerprint']) if 'fingerprint' in cache.files else None
+
+
+def build_geometry_cache(geo_df: gpd.GeoDataFrame,
+                         cache_path: str | Path,
+                         simplify_tolerance: float = None,
+                         resolution: str = None) -> Path:
+    """ Project and simplify the geometries once and store them as the vertices and codes
+    of the matplotlib paths, so every figure reuses them instead of rebuilding the polygons.
+
+    :param geo_df: GeoDataFrame with the polygons to draw.
+    :param cache_path: path to the `.npz` file where the paths are stored.
+    :param simplify_tolerance: tolerance in the units of the maps CRS to simplify the polygons.
+    :param resolution: optional resolution level. If given, the polygons are simplified keeping
+      the borders shared between neighbours and `simplify_tolerance` is ignored.
+    :return: path to the cache.
+    """
+    from matplotlib.path import Path as MplPath
+
+    simplify_tolerance = settings.maps.simplify_tolerance if simplify_tolerance is None else simplify_tolerance
+    fingerprint = _geometry_fingerprint(geo_df, simplify_tolerance, resolution)
+    geo_df = geo_df.to_crs(settings.maps.crs)
+    if resolution:
+        geo_df = simplify_coverage(geo_df, get_resolution_tolerance(resolution))
+        simplify_tolerance = 0
+    geometries = geo_df.geometry.values
+    geometries = shapely.make_valid(np.asarray(geometries))
+    if simplify_tolerance:
+        geometries = shapely.simplify(geometries, simplify_tolerance, preserve_topology=True)
+    geometries = np.array([_as_multipolygon(geometry) for geometry in geometries], dtype=object)
+
+    _, coords, (ring_offsets, polygon_offsets, geometry_offsets) = shapely.to_ragged_array(geometries)
+
+    # Each ring is closed, so it is drawn as a move, n - 2 lines and a close
+    codes = np.full(len(coords), MplPath.LINETO, dtype=np.uint8)
+    codes[ring_offsets[:-1]] = MplPath.MOVETO
+    codes[ring_offsets[1:] - 1] = MplPath.CLOSEPOLY
+    vertex_offsets = ring_offsets[polygon_offsets[geometry_offsets]]
+
+    cache_path = Path(cache_path)
+    os.makedirs(cache_path.parent, exist_ok=True)
+    np.savez(cache_path,
+             coords=coords,
+             codes=codes,
+             vertex_offsets=vertex_offsets,
+             bounds=shapely.total_bounds(geometries),
+             fingerprint=np.array(fingerprint))
+    logger.debug('Geometry paths of {} polygons cached in {}.', len(geometries), cache_path)
+    return cache_path
+
+
+def load_geometry_paths(cache_path: str | Path) -> Dict:
+    """ Load the geometry paths cached with `build_geometry_cache`.
+
+    :param cache_path: path to the `.npz` cache.
+    :return: dictionary with the list of paths and the bounds of the map.
+    """
+    from matplotlib.path import Path as MplPath
+
+    with np.load(cache_path) as cache:
+        coords = cache['coords']
+        codes = cache['codes']
+        offsets = cache['vertex_offsets']
+        bounds = cache['bounds']
+
+    paths = [MplPath(coords[start:end], codes[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+    return {'paths': paths, 'bounds': bounds}
+
+
+def _init_worker(cache_path: str | Path) -> None:
+    """ Configure the headless backend and load the geometry paths in the worker. """
+    global _GEOMETRY_PATHS
+    import matplotlib
+    matplotlib.use('Agg')
+    _GEOMETRY_PATHS = load_geometry_paths(cache_path)
+
+
+def _render_map(name: str,
+                values: np.ndarray,
+                title: str,
+                output_folder: str,
+                formats: Sequence[str],
+                bins: Optional[Sequence[float]],
+                labels: Optional[Sequence[str]],
+                cmap: str,
+                figsize: Sequence[float],
+                dpi: int) -> List[str]:
+    """ Render one map with the geometry paths loaded in the worker.
+
+    :return: list with the paths of the written files.
+    """
+    from matplotlib import colormaps
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.collections import PathCollection
+    from matplotlib.colors import Normalize
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Patch
+
+    paths = _GEOMETRY_PATHS['paths']
+    min_x, min_y, max_x, max_y = _GEOMETRY_PATHS['bounds']
+    colormap = colormaps[cmap]
+
+    # The figure is not registered in pyplot, so nothing is kept between maps
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+
+    missing_color = (0.85, 0.85, 0.85, 1.0)
+    if bins is not None:
+        categories = pd.cut(values, bins=bins, labels=labels)
+        category_colors = colormap(np.linspace(0, 1, len(categories.categories)))
+        facecolors = np.array([category_colors[code] if code >= 0 else missing_color
+                               for code in categories.codes])
+        handles = [Patch(facecolor=color, edgecolor='black', label=label)
+                   for color, label in zip(category_colors, categories.categories)]
+        ax.legend(handles=handles, loc='upper left')
+    else:
+        norm = Normalize(vmin=np.nanmin(values), vmax=np.nanmax(values))
+        facecolors = colormap(norm(values))
+        facecolors[np.isnan(values)] = missing_color
+        fig.colorbar(ScalarMappable(norm=norm, cmap=colormap), ax=ax,
+                     location='bottom', orientation='horizontal', pad=0, shrink=0.75)
+
+    ax.add_collection(PathCollection(paths, facecolors=facecolors, edgecolors='black', linewidths=0.2))
+    ax.set_xlim(min_x, max_x)
+    ax.set_ylim(min_y, max_y)
+    ax.set_aspect('equal')
+    ax.set_axis_off()
+    ax.set_title(title)
+
+    saved_paths = list()
+    for saving_format in formats:
+        saving_path = f'{output_folder}/{name}.{saving_format}'
+        fig.savefig(saving_path, dpi=dpi)
+        saved_paths.append(saving_path)
+
+    return saved_paths
+
+
+def render_scenario_maps(geo_df: gpd.GeoDataFrame,
+                         scenarios: pd.DataFrame,
+                         output_folder: str | Path,
+                         titles: Dict[str, str] = None,
+                         bins: Sequence[float] = None,
+                         labels: Sequence[str] = None,
+                         cmap: str = 'summer_r',
+                         formats: Sequence[str] = None,
+                         workers: int = None,
+                         cache_path: str | Path = None,
+                         resolution: str = None) -> List[str]:
+    """ Render one map per column of the scenario table in a pool of headless workers.
+
+    The geometries are projected, simplified and converted to paths once, and every
+    worker loads them a single time to draw all the maps it receives.
+
+    :param geo_df: GeoDataFrame with the polygons of the municipalities.
+    :param scenarios: table aligned with the index of `geo_df`, with one column per map.
+    :param output_folder: folder where the maps are saved, named after each column.
+    :param titles: optional titles of the maps per column.
+    :param bins: optional bins to draw the values as categories, e.g. the coverage percentage.
+    :param labels: labels of the bins.
+    :param cmap: name of the matplotlib colormap.
+    :param formats: output formats, such as png or svg.
+    :param workers: number of processes. By default, the `maps.workers` setting.
+    :param cache_path: path to the geometry cache. It is built if it does not exist or if it
+      was built for other geometries or another resolution.
+    :param resolution: optional resolution level used to simplify the polygons.
+    :return: list with the paths of the written files.
+    """
+    if not len(scenarios.columns):
+        logger.warning('There are no scenarios to render.')
+        return []
+
+    scenarios = scenarios.reindex(geo_df.index)
+    titles = titles or dict()
+    formats = formats or settings.maps.formats
+    workers = min(workers or settings.maps.workers or os.cpu_count(), len(scenarios.columns))
+    output_folder = Path(output_folder)
+    os.makedirs(output_folder, exist_ok=True)
+
+    cache_path = Path(cache_path) if cache_path else output_folder / 'geometry_paths.npz'
+    if _cached_fingerprint(cache_path) != _geometry_fingerprint(geo_df, resolution=resolution):
+        build_geometry_cache(geo_df, cache_path, resolution=resolution)
+
+    logger.info('Rendering {} maps with {} workers.', len(scenarios.columns), workers)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(str(cache_path),)) as executor:
+        futures = [
+            executor.submit(_render_map,
+                            str(column),
+                            scenarios[column].to_numpy(dtype=np.float64),
+                            titles.get(column, str(column)),
+                            str(output_folder),
+                            formats,
+                            bins,
+                            labels,
+                            cmap,
+                            settings.maps.figsize,
+                            settings.maps.dpi)
+            for column in scenarios.columns
+        ]
+        saved_paths = [saving_path for future in futures for saving_path in future.result()]
+
+    return saved_paths
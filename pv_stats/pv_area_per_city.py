@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.analyze_pv_installation import read_pv_layers, resolve_pv_overlaps
+from pv_stats.config.config import settings
+from pv_stats.utils.geometry import compute_areas
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.lazy_imports import lazy_import
+from pv_stats.utils.spatial_lookup import SpatialIndex, SpatialLookup
+
+gpd = lazy_import('geopandas')
+
+
+@instrument('process')
+def split_pv_polygons(pv_df: gpd.GeoDataFrame,
+                      municipalities: SpatialIndex,
+                      land_use: SpatialIndex = None) -> gpd.GeoDataFrame:
+    """ Assign every PV polygon to its municipality and, optionally, its SIOSE land use,
+    splitting the polygons that cross their boundaries, so each piece is counted once in
+    the zone that contains it.
+
+    :param pv_df: PV installations with the `categoria` column.
+    :param municipalities: index of the municipalities.
+    :param land_use: index of the land use. If not given, the polygons are only split by municipality.
+    :return: GeoDataFrame with a row per piece, its category, the attributes of its zones and
+      its `area_m2`, in the CRS of the municipalities index.
+    """
+    # The perimeters enclose the installations, they are not a usable surface
+    pv_df = pv_df[~pv_df['categoria'].isin(settings.pv_installations.excluded_categories)]
+    pv_df = pv_df[pv_df.geometry.notna() & ~pv_df.geometry.is_empty]
+    crs = pv_df.crs.to_string() if pv_df.crs is not None else None
+
+    pieces = municipalities.overlay_geometries(pv_df.geometry.values, crs)
+    pieces.insert(1, 'categoria', pv_df['categoria'].to_numpy()[pieces['query_idx'].to_numpy()])
+    if land_use is not None:
+        land_use_pieces = land_use.overlay_geometries(pieces['geometry'].to_numpy(), municipalities.crs)
+        pieces = pieces.drop(columns='geometry').iloc[land_use_pieces['query_idx'].to_numpy()].reset_index(drop=True)
+        pieces = pd.concat([pieces, land_use_pieces.drop(columns='query_idx')], axis=1)
+
+    pieces = gpd.GeoDataFrame(pieces.rename(columns={'query_idx': 'pv_idx'}), geometry='geometry',
+                              crs=municipalities.crs)
+    pieces['area_m2'] = compute_areas(pieces)
+
+    lost = 1 - pieces['area_m2'].sum() / compute_areas(pv_df).sum() if len(pv_df) else 0
+    logger.debug('{} PV polygons split in {} pieces, {:.2%} of the area outside the zones.', len(pv_df),
+                 len(pieces), lost)
+    return pieces
+
+
+def aggregate_pv_area(pieces: pd.DataFrame,
+                      by: str | Sequence[str] = 'municipio_id') -> pd.DataFrame:
+    """ Area of the PV pieces per zone and category, with the total on roofs and on the floor.
+
+    :param pieces: pieces from `split_pv_polygons`.
+    :param by: columns of the zones, e.g. `municipio_id` or `['municipio_id', 'ID_USO_MAX']`.
+    :return: DataFrame indexed by the zones with the area in ha of each category and the
+      `roof_ha` and `floor_ha` totals.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    area_df = pieces.pivot_table(index=by, columns='categoria', values='area_m2', aggfunc='sum',
+                                 fill_value=0, observed=True) / 10 ** 4
+    area_df.columns = list(area_df.columns)
+
+    floor = np.isin(area_df.columns, settings.pv_installations.floor_categories)
+    roof_ha, floor_ha = area_df.loc[:, ~floor].sum(axis=1), area_df.loc[:, floor].sum(axis=1)
+    area_df['roof_ha'] = roof_ha
+    area_df['floor_ha'] = floor_ha
+    return area_df
+
+
+def calculate_pv_area_per_city(pv_paths: List[str | Path],
+                               lookup: SpatialLookup = None,
+                               by_land_use: bool = False) -> pd.DataFrame:
+    """ Usable PV area of each municipality from the layers of PV installations.
+
+    :param pv_paths: layers with the PV installations. Their overlapping polygons are counted once.
+    :param lookup: indexes of the municipalities and the land use. By default, the saved ones.
+    :param by_land_use: also split the area by the SIOSE land use of the pieces.
+    :return: DataFrame from `aggregate_pv_area`, indexed by `municipio_id` and, if
+      requested, by the land use columns of the `spatial_lookup.land_use_columns` setting.
+    """
+    lookup = lookup or SpatialLookup.load()
+    # The polygons of several layers can cover the same surface
+    pv_df = resolve_pv_overlaps(read_pv_layers(pv_paths))
+    pieces = split_pv_polygons(pv_df, lookup.municipalities, lookup.land_use if by_land_use else None)
+
+    by = ['municipio_id', *(settings.spatial_lookup.land_use_columns if by_land_use else [])]
+    return aggregate_pv_area(pieces, by)
@@ -0,0 +1,84 @@
+import functools
+import json
+from typing import Any, Callable, Dict
+
+from loguru import logger
+
+from pv_stats.config.config import settings
+
+
+def _stdlib_loads(content: bytes | memoryview) -> Any:
+    # The standard library does not read buffers, so the views are copied
+    return json.loads(bytes(content) if isinstance(content, memoryview) else content)
+
+
+def _orjson_loads(content: bytes | memoryview) -> Any:
+    import orjson
+
+    return orjson.loads(content)
+
+
+# JSON decoders of the raw bytes of a response, by name
+JSON_BACKENDS: Dict[str, Callable[[bytes | memoryview], Any]] = {
+    'orjson': _orjson_loads,
+    'json': _stdlib_loads,
+}
+
+
+@functools.cache
+def _resolve_backend(name: str) -> Callable[[bytes | memoryview], Any]:
+    if name == 'auto':
+        try:
+            import orjson  # noqa: F401
+            name = 'orjson'
+        except ImportError:
+            name = 'json'
+    if name not in JSON_BACKENDS:
+        raise ValueError(f'JSON backend `{name}` not supported. Valid values are: auto, {", ".join(JSON_BACKENDS)}.')
+
+    logger.debug('Decoding the REE responses with {}.', name)
+    return JSON_BACKENDS[name]
+
+
+def get_json_backend(name: str = None) -> Callable[[bytes | memoryview], Any]:
+    """ JSON decoder of the `ree.decoding.json_backend` setting. With `auto`, orjson when it
+    is installed and the standard library otherwise.
+
+    :param name: name of a backend of `JSON_BACKENDS` or `auto`. By default, the setting.
+    :return: function that decodes bytes or a memoryview.
+    """
+    return _resolve_backend(name or settings.ree.decoding.json_backend)
+
+
+def strip_jsonp(content: bytes) -> memoryview:
+    """ JSON inside the callback of a JSONP response, e.g. `angular.callbacks._0({...});`,
+    as a view of the response bytes, so the payload is not copied.
+
+    :param content: raw bytes of the response.
+    :return: view of the JSON.
+    """
+    start = content.find(b'(')
+    end = content.rfind(b')')
+    if start == -1 or end < start:
+        raise ValueError('The response is not wrapped in a JSONP callback.')
+    return memoryview(content)[start + 1:end]
+
+
+def decode_json(content: bytes | memoryview, backend: str = None) -> Any:
+    """ Decode the raw bytes of a JSON response.
+
+    :param content: raw bytes of the response, or a view of them.
+    :param backend: JSON backend. By default, the `ree.decoding.json_backend` setting.
+    :return: decoded JSON.
+    """
+    return get_json_backend(backend)(content)
+
+
+def decode_jsonp(content: bytes, backend: str = None) -> Any:
+    """ Decode the raw bytes of a JSONP response without copying the JSON out of the callback.
+
+    :param content: raw bytes of the response.
+    :param backend: JSON backend. By default, the `ree.decoding.json_backend` setting.
+    :return: decoded JSON.
+    """
+    return decode_json(strip_jsonp(content), backend)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import Dict
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+def _fits_float32(values: np.ndarray, atol: float) -> bool:
+    """ Whether the values keep their precision as float32, up to an absolute tolerance. """
+    with np.errstate(over='ignore'):
+        compact = values.astype(np.float32)
+    return bool(np.allclose(compact, values, rtol=0, atol=atol, equal_nan=True))
+
+
+def compact_frame(df: pd.DataFrame, float32_atol: float = None) -> pd.DataFrame:
+    """ Frame of the REE APIs with the smallest types that keep its values: float32 for
+    the numeric columns that fit, categories for the repeated labels, e.g. regions or
+    series, and a timezone aware index.
+
+    :param df: parsed frame, indexed by time.
+    :param float32_atol: maximum absolute error of the values converted to float32. By
+      default, the `ree.frames.float32_atol` setting.
+    :return: the compacted frame.
+    """
+    float32_atol = settings.ree.frames.float32_atol if float32_atol is None else float32_atol
+    columns = {}
+    for column, values in df.items():
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.astype(np.float64)
+            if _fits_float32(values.to_numpy(), float32_atol):
+                values = values.astype(np.float32)
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            # Labels repeated in many rows take an integer code per row
+            if values.nunique(dropna=True) <= len(values) // 2:
+                values = values.astype('category')
+        columns[column] = values
+
+    compact_df = pd.DataFrame(columns, index=df.index)
+    if not isinstance(compact_df.index, pd.DatetimeIndex) or compact_df.index.tz is None:
+        compact_df.index = pd.DatetimeIndex(pd.to_datetime(compact_df.index, utc=True)).tz_convert(
+            settings.ree.timezone)
+    return compact_df
+
+
+def memory_report(df: pd.DataFrame) -> Dict:
+    """ Memory used by a frame, including the content of the object columns.
+
+    :param df: any frame.
+    :return: dict with the number of rows, the total bytes, the bytes per row and the
+      bytes and type of the index and of each column.
+    """
+    usage = df.memory_usage(deep=True)
+    total = int(usage.sum())
+    return {'rows': len(df),
+            'bytes': total,
+            'bytes_per_row': total / len(df) if len(df) else 0.0,
+            'index': {'bytes': int(usage['Index']), 'dtype': str(df.index.dtype)},
+            'columns': {column: {'bytes': int(usage[column]), 'dtype': str(df[column].dtype)}
+                        for column in df.columns}}
@@ -0,0 +1,137 @@
+from typing import Dict, List
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.ree.pipeline import HourlySource, ingest
+from pv_stats.ree.storage import HourlyStore, Window
+
+
+def scan_gaps(index: pd.DatetimeIndex,
+              start: pd.Timestamp,
+              end: pd.Timestamp) -> Dict[str, pd.DatetimeIndex]:
+    """ Compare the timestamps of an hourly series with the expected hourly grid.
+
+    :param index: timezone aware index of the series.
+    :param start: first expected hour.
+    :param end: last expected hour.
+    :return: dict with the `missing` and `duplicated` hours, in local time.
+    """
+    # The grid is built in UTC, where all the hours exist and are unique
+    expected = pd.date_range(start.tz_convert('UTC').floor('h'), end.tz_convert('UTC').floor('h'), freq='h')
+    index = index.tz_convert('UTC')
+    index = index[(index >= expected[0]) & (index <= expected[-1])] if len(expected) else index[:0]
+    return {'missing': expected.difference(index).tz_convert(settings.ree.timezone),
+            'duplicated': index[index.duplicated()].unique().tz_convert(settings.ree.timezone)}
+
+
+def scan_store(store: HourlyStore,
+               dataset: str,
+               start: pd.Timestamp = None,
+               end: pd.Timestamp = None) -> Dict[str, pd.DatetimeIndex]:
+    """ Missing and duplicated hours of a stored dataset.
+
+    :param store: store of the hourly series.
+    :param dataset: name of the dataset, e.g. `demand`.
+    :param start: first expected hour. By default, the first stored one.
+    :param end: last expected hour. By default, the last stored one.
+    :return: dict with the `missing` and `duplicated` hours, in local time.
+    """
+    index = store.read_all(dataset).index
+    if index.empty and (start is None or end is None):
+        return {'missing': index, 'duplicated': index}
+    return scan_gaps(index, start if start is not None else index.min(), end if end is not None else index.max())
+
+
+def request_windows(hours: pd.DatetimeIndex,
+                    merge_hours: int = None,
+                    max_hours: int = None,
+                    whole_days: bool = False) -> List[Window]:
+    """ Smallest set of request windows that cover a set of hours.
+
+    Consecutive hours go in the same window, and windows separated by a few hours are
+    merged, as asking again for some stored hours is cheaper than another request.
+
+    :param hours: hours to request, e.g. the missing and duplicated ones.
+    :param merge_hours: maximum number of hours between two windows to merge them. By
+      default, the `ree.gaps.merge_hours` setting.
+    :param max_hours: maximum length of a window. By default, the `ree.max_days_per_request` setting.
+    :param whole_days: expand the windows to whole local days, for the APIs that return
+      the data of a day at once. The maximum length is then taken in days, of 23 to 25 hours.
+    :return: list with the first and last local hour of each window.
+    """
+    merge_hours = settings.ree.gaps.merge_hours if merge_hours is None else merge_hours
+    max_hours = max_hours or settings.ree.max_days_per_request * 24
+    if hours.empty:
+        return []
+
+    hours = hours.tz_convert(settings.ree.timezone).unique().sort_values()
+    if whole_days:
+        days = hours.tz_localize(None).normalize().unique().tz_localize(settings.ree.timezone)
+        day_hours = [pd.date_range(day, day + pd.DateOffset(days=1), freq='h', inclusive='left') for day in days]
+        hours = day_hours[0].append(day_hours[1:])
+
+    # Position of each hour and of its local day, counted in hours
+    positions = ((hours - hours[0]) / pd.Timedelta(hours=1)).to_numpy()
+    day_positions = ((hours.tz_localize(None).normalize() - hours[0].tz_localize(None).normalize())
+                     / pd.Timedelta(hours=1)).to_numpy()
+    lengths = day_positions if whole_days else positions
+    windows = []
+    window_start = window_end = 0
+    for hour in range(1, len(hours)):
+        gap_hours = positions[hour] - positions[window_end] - 1
+        if gap_hours <= merge_hours and lengths[hour] - lengths[window_start] < max_hours:
+            window_end = hour
+        else:
+            windows.append((window_start, window_end))
+            window_start = window_end = hour
+    windows.append((window_start, window_end))
+
+    return [(hours[start], hours[end]) for start, end in windows]
+
+
+def get_hourly(store: HourlyStore,
+               dataset: str,
+               start: pd.Timestamp,
+               end: pd.Timestamp,
+               source: HourlySource) -> pd.DataFrame:
+    """ Hourly series of a dataset, retrieving and storing first the hours not stored.
+
+    :param store: store of the hourly series.
+    :param dataset: name of the dataset, e.g. `demand`.
+    :param start: first hour.
+    :param end: last hour.
+    :param source: source of the dataset.
+    :return: hourly series with the index in the `ree.timezone` setting.
+    """
+    missing = scan_gaps(store.read(dataset, start, end).index, start, end)['missing']
+    windows = request_windows(missing, max_hours=source.max_hours, whole_days=source.whole_days)
+    if windows:
+        logger.info('Retrieving {} hours of the {} not stored locally in {} requests.', len(missing), dataset,
+                    len(windows))
+        ingest(store, dataset, windows, source)
+    return store.read(dataset, start, end)
+
+
+def backfill(store: HourlyStore,
+             dataset: str,
+             source: HourlySource,
+             start: pd.Timestamp = None,
+             end: pd.Timestamp = None) -> List[Window]:
+    """ Retrieve only the missing and duplicated hours of a stored dataset.
+
+    :param store: store of the hourly series.
+    :param dataset: name of the dataset, e.g. `demand`.
+    :param source: source of the dataset.
+    :param start: first expected hour. By default, the first stored one.
+    :param end: last expected hour. By default, the last stored one.
+    :return: the requested windows.
+    """
+    gaps = scan_store(store, dataset, start, end)
+    windows = request_windows(gaps['missing'].union(gaps['duplicated']), max_hours=source.max_hours,
+                              whole_days=source.whole_days)
+    logger.info('{} has {} missing and {} duplicated hours, retrieved in {} requests.', dataset,
+                len(gaps['missing']), len(gaps['duplicated']), len(windows))
+    ingest(store, dataset, windows, source)
+    return windows
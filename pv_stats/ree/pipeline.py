@@ -0,0 +1,160 @@
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, List
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.ree.storage import HourlyStore, Window
+
+# Marks the end of the items of a stage
+_DONE = object()
+# Seconds between the checks of the stop event while a queue is full or empty
+_POLL_INTERVAL = 0.1
+
+
+class HourlySource(ABC):
+    """ Retrieval of an hourly dataset split in the request of a window, which waits on the
+    network, and the parse of its payload, which uses the CPU, so they run in different
+    stages of the ingestion pipeline. """
+
+    # Longest window of a request in hours. By default, the `ree.max_days_per_request` setting
+    max_hours: int = None
+    # Whether the API returns the data of whole local days
+    whole_days: bool = False
+
+    @abstractmethod
+    def request(self, window: Window):
+        """ Raw payload of the hours of a window. """
+
+    @abstractmethod
+    def parse(self, payload, window: Window) -> pd.DataFrame:
+        """ Hourly frame with timezone aware index from the payload of a window. """
+
+
+def _put(stage_queue: queue.Queue, value, stop: threading.Event) -> None:
+    # Waits while the queue is full, unless another stage failed
+    while not stop.is_set():
+        try:
+            stage_queue.put(value, timeout=_POLL_INTERVAL)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(stage_queue: queue.Queue, stop: threading.Event):
+    # Waits while the queue is empty, unless another stage failed
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(items: Iterable,
+                 request: Callable,
+                 parse: Callable,
+                 write: Callable,
+                 fetchers: int = None,
+                 queue_size: int = None) -> int:
+    """ Run a request, parse and write pipeline, where each stage works while the others
+    wait, so the throughput is the one of the slowest stage.
+
+    Several threads request the items, as they mostly wait on the network, one thread
+    parses the payloads and the calling thread writes the frames. The stages are connected
+    by bounded queues, so at most `queue_size` payloads and frames are held in memory. If
+    a stage fails, the rest stop and the error is raised.
+
+    :param items: items to request, e.g. windows of hours. They are consumed lazily.
+    :param request: function that returns the payload of an item.
+    :param parse: function that receives the payload and the item and returns the frame to write.
+    :param write: function that writes a frame.
+    :param fetchers: number of request threads. By default, the `ree.pipeline.fetchers` setting.
+    :param queue_size: size of the queues. By default, the `ree.pipeline.queue_size` setting.
+    :return: number of written frames.
+    """
+    fetchers = fetchers or settings.ree.pipeline.fetchers
+    queue_size = queue_size or settings.ree.pipeline.queue_size
+    payloads = queue.Queue(maxsize=queue_size)
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    items = iter(items)
+    items_lock = threading.Lock()
+
+    def next_item():
+        with items_lock:
+            return next(items, _DONE)
+
+    def guarded(stage: Callable) -> Callable:
+        def run() -> None:
+            try:
+                stage()
+            except BaseException as error:
+                errors.append(error)
+                stop.set()
+        return run
+
+    def request_stage() -> None:
+        while not stop.is_set() and (item := next_item()) is not _DONE:
+            _put(payloads, (item, request(item)), stop)
+
+    def parse_stage() -> None:
+        while (entry := _get(payloads, stop)) is not _DONE:
+            _put(frames, parse(entry[1], entry[0]), stop)
+        _put(frames, _DONE, stop)
+
+    request_threads = [threading.Thread(target=guarded(request_stage), daemon=True) for _ in range(fetchers)]
+    parse_thread = threading.Thread(target=guarded(parse_stage), daemon=True)
+
+    def close_requests() -> None:
+        for thread in request_threads:
+            thread.join()
+        _put(payloads, _DONE, stop)
+
+    closing_thread = threading.Thread(target=close_requests, daemon=True)
+    for thread in [*request_threads, parse_thread, closing_thread]:
+        thread.start()
+
+    start = time.perf_counter()
+    written = 0
+    try:
+        while (frame := _get(frames, stop)) is not _DONE:
+            write(frame)
+            written += 1
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        closing_thread.join()
+        parse_thread.join()
+
+    if errors:
+        raise errors[0]
+    logger.debug('Pipeline wrote {} frames in {:.2f} s.', written, time.perf_counter() - start)
+    return written
+
+
+def ingest(store: HourlyStore,
+           dataset: str,
+           windows: List[Window],
+           source: HourlySource,
+           fetchers: int = None,
+           queue_size: int = None) -> int:
+    """ Retrieve windows of hours from a source and store them, overlapping the requests,
+    the parsing and the writing.
+
+    :param store: store of the hourly series.
+    :param dataset: name of the dataset, e.g. `demand`.
+    :param windows: windows of hours to retrieve, from `request_windows`.
+    :param source: source of the dataset.
+    :param fetchers: number of request threads. By default, the `ree.pipeline.fetchers` setting.
+    :param queue_size: size of the queues. By default, the `ree.pipeline.queue_size` setting.
+    :return: number of stored windows.
+    """
+    return run_pipeline(windows, source.request, source.parse, lambda frame: store.write(dataset, frame),
+                        fetchers, queue_size)
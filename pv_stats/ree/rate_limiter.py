@@ -0,0 +1,89 @@
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict
+
+from loguru import logger
+
+from pv_stats.config.config import settings
+
+
+class RateLimiter:
+    """ Token bucket of a host, shared by all the processes of the machine through a state
+    file locked while it is updated, so concurrent jobs stay under the same aggregate rate.
+
+    Each request takes a token, even if the bucket is empty. The tokens below zero are the
+    requests queued by any process, so each caller waits for its own turn without polling.
+    """
+
+    def __init__(self,
+                 host: str,
+                 rate: float,
+                 burst: int,
+                 folder: str | Path = None):
+        """
+        :param host: host of the API, which names the bucket.
+        :param rate: requests per second. A rate of 0 disables the limit.
+        :param burst: maximum number of requests done at once after an idle period.
+        :param folder: folder of the state files. By default, the `ree.rate_limit.folder` setting.
+        """
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.path = Path(folder or settings.ree.rate_limit.folder) / f'{host}.bucket'
+
+    def _take(self, tokens: float) -> float:
+        """ Take tokens from the bucket and return the seconds until they are available. """
+        os.makedirs(self.path.parent, exist_ok=True)
+        with open(self.path, 'a+') as bucket_file:
+            fcntl.flock(bucket_file, fcntl.LOCK_EX)
+            try:
+                bucket_file.seek(0)
+                content = bucket_file.read()
+                now = time.time()
+                state = json.loads(content) if content else {'tokens': self.burst, 'updated': now}
+
+                # Refill since the last update, the clock may go back after a reboot
+                elapsed = max(now - state['updated'], 0)
+                available = min(state['tokens'] + elapsed * self.rate, self.burst) - tokens
+
+                bucket_file.seek(0)
+                bucket_file.truncate()
+                bucket_file.write(json.dumps({'tokens': available, 'updated': now}))
+                bucket_file.flush()
+            finally:
+                fcntl.flock(bucket_file, fcntl.LOCK_UN)
+
+        return max(-available / self.rate, 0)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """ Wait until a request can be done.
+
+        :param tokens: tokens taken by the request.
+        :return: seconds waited.
+        """
+        if not self.rate:
+            return 0
+        wait = self._take(tokens)
+        if wait:
+            logger.debug('Waiting {:.2f} s for the rate limit of {}.', wait, self.host)
+            time.sleep(wait)
+        return wait
+
+
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(host: str, api: str) -> RateLimiter:
+    """ Rate limiter of a host with the limits of its API, shared by the clients of the process.
+
+    :param host: host of the API.
+    :param api: key of the API limits in the `ree.rate_limit` settings, e.g. `data` or `demanda`.
+    :return: the rate limiter.
+    """
+    if host not in _limiters:
+        limits = settings.ree.rate_limit[api]
+        _limiters[host] = RateLimiter(host, limits.rate, limits.burst)
+    return _limiters[host]
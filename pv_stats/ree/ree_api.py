@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 from datetime import datetime, timedelta
 from typing import Dict, Optional, Tuple, List
 
-import requests
 from dateutil.parser import isoparse
 from loguru import logger
-from pandas import DataFrame
 
 from pv_stats.config.config import settings
+from pv_stats.ree.decoding import decode_json
+from pv_stats.ree.frames import compact_frame
+from pv_stats.ree.rate_limiter import get_rate_limiter
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
 
 
 def parse_date(date: str | datetime) -> str:
@@ -30,16 +38,20 @@ def parse_date(date: str | datetime) -> str:
     return final_date
 
 
-def parse_response(data: Dict) -> DataFrame:
+def parse_response(data: Dict) -> pd.DataFrame:
     """
     Parse the response from the REE API to generate a pandas dataframe.
 
+    The balance widgets nest the series in the `content` of their group, e.g. renewable
+    and non-renewable, instead of listing them in `included`.
+
     :param data: Data from the REE API.
-    :return: Parsed data.
+    :return: Parsed data, with a column per series and indexed by the local time.
     """
     parsed_data = dict()
+    series = [serie for group in data['included'] for serie in group['attributes'].get('content', [group])]
 
-    for demand_type in data['included']:
+    for demand_type in series:
         demand_name = demand_type['attributes']['title']
         for value_in_time in demand_type['attributes']['values']:
             demand_time = value_in_time['datetime']
@@ -52,8 +64,9 @@ def parse_response(data: Dict) -> DataFrame:
             # Update the dict with the new demand data, as the get returns a copy and it is not updated in place
             parsed_data[demand_time] = demand_for_time
 
-    df = DataFrame.from_dict(parsed_data, orient='index')
-    return df
+    df = pd.DataFrame.from_dict(parsed_data, orient='index')
+    # The ISO 8601 times with offset become a timezone aware index and the values float32
+    return compact_frame(df).sort_index()
 
 
 def throttle_request_dates(start_date: str | datetime,
@@ -118,13 +131,16 @@ class REEDataAPI:
             'Content-Type': 'application/json',
             'Host': self.host
         }
+        # Shared with the rest of the processes that query the same host
+        self.rate_limiter = get_rate_limiter(self.host, 'data')
 
         if language not in ['es', 'en']:
             language = 'es'
             logger.warning('Language `{}` not supported. Using Spanish as default.', language)
 
-        self.url = f'https://{self.host}/{language}/datos'
+        self.url = f'{settings.ree_data.scheme}://{self.host}/{language}/datos'
 
+    @instrument('ree')
     def get_data(self,
                  category: str,
                  widget: str,
@@ -182,13 +198,15 @@ class REEDataAPI:
             params['geo_limit'] = geo_limit
             params['geo_ids'] = geo_ids
 
+        self.rate_limiter.acquire()
         res = requests.get(endpoint,
                            headers=self.headers,
                            params=params)
         logger.info('Request status code: {}', res.status_code)
         res.raise_for_status()
 
-        data = res.json()
+        # Decoded from the raw bytes, without building the text of the response
+        data = decode_json(res.content)
         return data
 
     def get_demand(self,
@@ -197,7 +215,7 @@ class REEDataAPI:
                    time_trunc: str,
                    geo_trunc: Optional[str],
                    geo_limit: Optional[str],
-                   geo_ids: Optional[int]) -> DataFrame:
+                   geo_ids: Optional[int]) -> pd.DataFrame:
         """ Get the demand data from the REE API.
 
         :param start_date: Defines the starting date in ISO 8601 format. Example: 2021-01-01T00:00.
@@ -228,7 +246,7 @@ class REEDataAPI:
                                   time_trunc: str,
                                   geo_trunc: Optional[str],
                                   geo_limit: Optional[str],
-                                  geo_ids: Optional[int]) -> DataFrame:
+                                  geo_ids: Optional[int]) -> pd.DataFrame:
         """ Get the demand data from the REE API.
 
         :param start_date: Defines the starting date in ISO 8601 format. Example: 2021-01-01T00:00.
@@ -1,13 +1,20 @@
-import json
+from __future__ import annotations
+
 from datetime import datetime
 from typing import Dict
 
-import requests
 from dateutil.parser import isoparse
 from loguru import logger
-from pandas import DataFrame
 
 from pv_stats.config.config import settings
+from pv_stats.ree.decoding import decode_jsonp
+from pv_stats.ree.frames import compact_frame
+from pv_stats.ree.rate_limiter import get_rate_limiter
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+requests = lazy_import('requests')
 
 
 def parse_timestamp(timestamp: str) -> datetime:
@@ -31,26 +38,33 @@ def parse_timestamp(timestamp: str) -> datetime:
     return time
 
 def parse_response(data: Dict,
-                   desired_date: datetime) -> DataFrame:
+                   desired_date: datetime) -> pd.DataFrame:
     """
     Parse the response from the REE API to generate a pandas dataframe.
 
     :param data: Data from the REE API.
     :param desired_date: Date to filter the data.
-    :return: Parsed data.
+    :return: Parsed data, with a column per technology of the `ree.generation_mapping`
+      setting and indexed by the local time.
     """
-    generation_data = DataFrame(data['valoresHorariosGeneracion'])
+    generation_data = pd.DataFrame(data['valoresHorariosGeneracion'])
     # The time is in the 'ts' column, so we need to parse it to datetime, check if it can be parsed
-    generation_data['Fecha'] = generation_data['ts'].apply(lambda x: parse_timestamp(x))
+    fecha = pd.DatetimeIndex(generation_data['ts'].apply(lambda x: parse_timestamp(x)), name='Fecha')
 
     # The data includes some rows of the previous and next day, so we filter them
-    generation_data = generation_data[generation_data['Fecha'].dt.date == desired_date.date()]
+    in_day = fecha.date == desired_date.date()
 
-    # Rename the columns to have a more descriptive name
+    # The first repeated hour of the change to winter time, 2A, is still in summer time
+    summer_time = ~generation_data['ts'].str.contains(' 2B:', regex=False).to_numpy()
+    fecha = fecha[in_day].tz_localize(settings.ree.timezone, ambiguous=summer_time[in_day],
+                                      nonexistent='shift_forward')
+
+    # Rename the columns to have a more descriptive name, the raw ones are dropped
     column_mapping = settings.ree.generation_mapping
-    generation_data = generation_data.rename(columns=column_mapping)
+    columns = [column for column in column_mapping if column in generation_data.columns]
+    generation_data = generation_data.loc[in_day, columns].rename(columns=column_mapping).set_axis(fecha)
 
-    return generation_data
+    return compact_frame(generation_data)
 
 
 class REEDemandaAPI:
@@ -62,9 +76,12 @@ class REEDemandaAPI:
             'Content-Type': 'application/json',
             'Host': self.host
         }
+        # Shared with the rest of the processes that query the same host
+        self.rate_limiter = get_rate_limiter(self.host, 'demanda')
 
-        self.url = f'https://{self.host}/WSvisionaMovilesPeninsulaRest/resources/'
+        self.url = f'{settings.ree_demanda.scheme}://{self.host}/WSvisionaMovilesPeninsulaRest/resources/'
 
+    @instrument('ree')
     def get_data(self,
                  category: str,
                  date: str | datetime,
@@ -96,23 +113,22 @@ class REEDemandaAPI:
             'curva': geo_limit,
         }
 
+        self.rate_limiter.acquire()
         res = requests.get(endpoint,
                            headers=self.headers,
                            params=params)
         logger.info('Request status code: {}', res.status_code)
         res.raise_for_status()
 
-        data = res.text
-
-        # The desired JSON is inside the callback function, so we need to remove the function call
-        data = data[data.find('(') + 1:data.rfind(')')]
-        data = json.loads(data)
+        # The desired JSON is inside the callback function, so it is decoded from a view of
+        # the raw bytes between the parentheses
+        data = decode_jsonp(res.content)
 
         return data
 
     def get_generation(self,
                        date: str | datetime,
-                       geo_limit: str) -> DataFrame:
+                       geo_limit: str) -> pd.DataFrame:
         """ Get the demand data from the REE API.
 
         :param date: Defines the date to retrieve the data in ISO 8601 format. Example: 2021-01-01.
@@ -0,0 +1,187 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+from dateutil.parser import isoparse
+from loguru import logger
+
+from pv_stats.ree import ree_api, ree_demanda_api
+from pv_stats.ree.gaps import backfill, get_hourly
+from pv_stats.ree.pipeline import HourlySource
+from pv_stats.ree.rollups import get_rollup, period_bounds
+from pv_stats.ree.storage import HourlyStore, Window, to_hourly, to_local_timestamp
+
+
+def _get_save_path(save_path: str | Path,
+                   prefix: str,
+                   start_date: str,
+                   end_date: str) -> Path:
+    """ Path of the CSV file of a retrieval. If the given path is a folder, the file is
+    named after the prefix and the dates. """
+    save_path = Path(save_path)
+    if save_path.is_dir():
+        start_str = isoparse(start_date).strftime('%Y%m%d')
+        end_str = isoparse(end_date).strftime('%Y%m%d')
+        save_path = save_path / f'{prefix}_{start_str}_{end_str}.csv'
+
+    os.makedirs(save_path.parent, exist_ok=True)
+    return save_path
+
+
+class WidgetSource(HourlySource):
+    """ Any widget of the REE data API, e.g. the prices, balances or installed capacity. """
+
+    def __init__(self,
+                 category: str,
+                 widget: str,
+                 time_trunc: str = 'hour',
+                 geo_trunc: Optional[str] = None,
+                 geo_limit: Optional[str] = None,
+                 geo_ids: Optional[int] = None):
+        self.category = category
+        self.widget = widget
+        self.time_trunc = time_trunc
+        self.geo_trunc = geo_trunc
+        self.geo_limit = geo_limit
+        self.geo_ids = geo_ids
+        self.ree_api = ree_api.REEDataAPI()
+
+    def request(self, window: Window) -> Dict:
+        # The API expects the local time
+        return self.ree_api.get_data(category=self.category,
+                                     widget=self.widget,
+                                     start_date=window[0].tz_localize(None),
+                                     end_date=window[1].tz_localize(None),
+                                     time_trunc=self.time_trunc,
+                                     geo_trunc=self.geo_trunc,
+                                     geo_limit=self.geo_limit,
+                                     geo_ids=self.geo_ids)
+
+    def parse(self, payload: Dict, window: Window) -> pd.DataFrame:
+        df = ree_api.parse_response(payload)
+        # The days, months and years are stored at the local start of each period
+        return to_hourly(df) if self.time_trunc == 'hour' else df
+
+
+class DemandSource(WidgetSource):
+    """ Hourly demand from the REE data API. """
+
+    def __init__(self):
+        super().__init__('demanda', 'demanda-tiempo-real')
+
+
+class GenerationSource(HourlySource):
+    """ Hourly generation from the REE demand API, which returns the values every ten
+    minutes of a single day. """
+
+    max_hours = 24
+    whole_days = True
+
+    def __init__(self, geo_limit: str = 'NACIONAL'):
+        self.geo_limit = geo_limit
+        self.ree_api = ree_demanda_api.REEDemandaAPI()
+
+    def request(self, window: Window) -> Dict:
+        return self.ree_api.get_data(category='demandaGeneracionPeninsula',
+                                     date=window[0].tz_localize(None),
+                                     geo_limit=self.geo_limit)
+
+    def parse(self, payload: Dict, window: Window) -> pd.DataFrame:
+        return to_hourly(ree_demanda_api.parse_response(payload, window[0].tz_localize(None)))
+
+
+def get_source(dataset: str) -> HourlySource:
+    """ Source of a stored dataset.
+
+    :param dataset: `demand` or `generation_<zone>`, e.g. `generation_nacional`.
+    :return: the source.
+    """
+    if dataset == 'demand':
+        return DemandSource()
+    if dataset.startswith('generation_'):
+        return GenerationSource(dataset.removeprefix('generation_').upper())
+    raise ValueError(f'Dataset `{dataset}` not supported. Valid values are: demand, generation_<zone>.')
+
+
+def retrieve_demand(save_path: str | Path,
+                    start_date: str,
+                    end_date: str,
+                    time_trunc: str = 'hour',
+                    store: HourlyStore = None) -> Path:
+    """ Retrieve the demand and save it as CSV. The hours are read from the local store and
+    only the ones not stored are retrieved from the REE data API. The days, weeks, months
+    and years are aggregated from them.
+
+    :param save_path: path to a folder where the data will be saved or full path to the file.
+    :param start_date: start date in ISO 8601 format.
+    :param end_date: end date in ISO 8601 format.
+    :param time_trunc: time aggregation of the data: hour, day, week, month or year.
+    :param store: store of the hourly series. By default, the one of the `ree.storage.folder` setting.
+    :return: path to the saved file.
+    """
+    store = store or HourlyStore()
+    logger.info('Retrieving demand data from {} to {}.', start_date, end_date)
+    if time_trunc == 'hour':
+        demand_df = get_hourly(store, 'demand', to_local_timestamp(start_date), to_local_timestamp(end_date),
+                               DemandSource())
+    else:
+        demand_df = get_rollup(store, 'demand', start_date, end_date, time_trunc, DemandSource())
+
+    save_path = _get_save_path(save_path, 'ree_demand', start_date, end_date)
+    demand_df.to_csv(save_path)
+    return save_path
+
+
+def retrieve_generation(save_path: str | Path,
+                        start_date: str,
+                        end_date: Optional[str] = None,
+                        time_trunc: str = 'hour',
+                        geo_limit: Optional[str] = None,
+                        store: HourlyStore = None) -> Path:
+    """ Retrieve the generation and save it as CSV. The hours are read from the local store
+    and only the days not stored are retrieved from the REE demand API. The days, weeks,
+    months and years are aggregated from them.
+
+    :param save_path: path to a folder where the data will be saved or full path to the file.
+    :param start_date: start date in ISO 8601 format.
+    :param end_date: end date in ISO 8601 format. By default, the start date.
+    :param time_trunc: time aggregation of the data: hour, day, week, month or year.
+    :param geo_limit: zone of the data. By default, the national one.
+    :param store: store of the hourly series. By default, the one of the `ree.storage.folder` setting.
+    :return: path to the saved file.
+    """
+    store = store or HourlyStore()
+    end_date = end_date or start_date
+    geo_limit = geo_limit or 'NACIONAL'
+    logger.info('Retrieving generation data from {} to {} in {}.', start_date, end_date, geo_limit)
+
+    dataset = f'generation_{geo_limit.lower()}'
+    source = GenerationSource(geo_limit)
+    if time_trunc == 'hour':
+        # Whole days, as the API returns them
+        generation_df = get_hourly(store, dataset, *period_bounds(start_date, end_date, 'day'), source)
+    else:
+        generation_df = get_rollup(store, dataset, start_date, end_date, time_trunc, source)
+
+    save_path = _get_save_path(save_path, f'ree_generation_{time_trunc}', start_date, end_date)
+    generation_df.to_csv(save_path)
+    return save_path
+
+
+def backfill_dataset(dataset: str,
+                     start_date: Optional[str] = None,
+                     end_date: Optional[str] = None,
+                     store: HourlyStore = None) -> List[Window]:
+    """ Repair a stored dataset, retrieving only the windows with missing or duplicated hours.
+
+    :param dataset: `demand` or `generation_<zone>`, e.g. `generation_nacional`.
+    :param start_date: first date to check. By default, the first stored hour.
+    :param end_date: last date to check. By default, the last stored hour.
+    :param store: store of the hourly series. By default, the one of the `ree.storage.folder` setting.
+    :return: the requested windows.
+    """
+    store = store or HourlyStore()
+    start = to_local_timestamp(start_date) if start_date else None
+    end = period_bounds(end_date, end_date, 'day')[1] if end_date else None
+    return backfill(store, dataset, get_source(dataset), start, end)
@@ -0,0 +1,99 @@
+from typing import Tuple
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.ree.gaps import get_hourly
+from pv_stats.ree.pipeline import HourlySource
+from pv_stats.ree.storage import HourlyStore, to_local_timestamp
+
+# Calendar period of each time truncation, the weeks go from Monday to Sunday
+TIME_TRUNCS = {'day': 'D', 'week': 'W-SUN', 'month': 'M', 'year': 'Y'}
+
+
+def _check_time_trunc(time_trunc: str) -> str:
+    if time_trunc not in TIME_TRUNCS:
+        raise ValueError(f'Time trunc `{time_trunc}` not supported. Valid values are: {", ".join(TIME_TRUNCS)}.')
+    return TIME_TRUNCS[time_trunc]
+
+
+def period_bounds(start: str | pd.Timestamp,
+                  end: str | pd.Timestamp,
+                  time_trunc: str) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """ First and last hour of the whole periods that contain two dates, in local time.
+
+    :param start: first date.
+    :param end: last date.
+    :param time_trunc: day, week, month or year.
+    :return: first hour of the period of the start and last hour of the period of the end.
+    """
+    freq = _check_time_trunc(time_trunc)
+    start_period = to_local_timestamp(start).tz_localize(None).to_period(freq)
+    end_period = to_local_timestamp(end).tz_localize(None).to_period(freq)
+    # The periods start and end at midnight, which is never ambiguous in local time
+    first_hour = start_period.start_time.tz_localize(settings.ree.timezone)
+    last_hour = (end_period + 1).start_time.tz_localize(settings.ree.timezone) - pd.Timedelta(hours=1)
+    return first_hour, last_hour
+
+
+def rollup(hourly_df: pd.DataFrame,
+           time_trunc: str,
+           how: str = 'sum') -> pd.DataFrame:
+    """ Aggregate an hourly series in calendar periods of the local time, so the days of the
+    changes of hour have 23 or 25 hours.
+
+    :param hourly_df: hourly series with timezone aware index.
+    :param time_trunc: day, week, month or year.
+    :param how: aggregation of the hours, `sum` for the energies or `mean` for the powers.
+    :return: series indexed by the local start of each period.
+    """
+    freq = _check_time_trunc(time_trunc)
+    local_index = hourly_df.index.tz_convert(settings.ree.timezone)
+    # The periods are taken from the wall time, where the repeated hour belongs to the same day
+    periods = local_index.tz_localize(None).to_period(freq)
+    # Aggregated in float64, as the sums of many float32 hours lose precision
+    rollup_df = hourly_df.astype('float64').groupby(periods).agg(how)
+    rollup_df.index = rollup_df.index.start_time.tz_localize(settings.ree.timezone)
+    return rollup_df
+
+
+def get_rollup(store: HourlyStore,
+               dataset: str,
+               start: str | pd.Timestamp,
+               end: str | pd.Timestamp,
+               time_trunc: str,
+               source: HourlySource,
+               how: str = 'sum') -> pd.DataFrame:
+    """ Aggregates of a dataset derived from the locally stored hourly series. Only the
+    hours that are not stored are retrieved from the API.
+
+    The aggregates of the whole dataset are cached next to it and computed again when
+    the stored hours change.
+
+    :param store: store of the hourly series.
+    :param dataset: name of the dataset, e.g. `demand`.
+    :param start: first date. The whole period that contains it is included.
+    :param end: last date. The whole period that contains it is included.
+    :param time_trunc: day, week, month or year.
+    :param source: source of the dataset, for the hours that are not stored.
+    :param how: aggregation of the hours, `sum` or `mean`.
+    :return: aggregated series indexed by the local start of each period.
+    """
+    first_hour, last_hour = period_bounds(start, end, time_trunc)
+    get_hourly(store, dataset, first_hour, last_hour, source)
+
+    rollups_folder = store.folder / dataset / 'rollups'
+    cache_path = rollups_folder / f'{time_trunc}_{how}_{store.version(dataset)}.parquet'
+    if cache_path.exists():
+        rollup_df = pd.read_parquet(cache_path)
+    else:
+        logger.debug('Computing the {} {} of the {} from the stored hours.', time_trunc, how, dataset)
+        rollup_df = rollup(store.read_all(dataset), time_trunc, how)
+        rollups_folder.mkdir(exist_ok=True)
+        # Previous versions are outdated
+        for outdated_path in rollups_folder.glob(f'{time_trunc}_{how}_*.parquet'):
+            outdated_path.unlink()
+        rollup_df.to_parquet(cache_path)
+
+    return rollup_df.loc[first_hour:last_hour]
@@ -0,0 +1,183 @@
+import itertools
+import json
+import os
+import tomllib
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.ree.pipeline import run_pipeline
+from pv_stats.ree.retrieval import WidgetSource
+from pv_stats.ree.rollups import period_bounds
+from pv_stats.ree.storage import HourlyStore, Window
+
+# Keys of a job of the catalog and their default values, None for the required ones
+JOB_KEYS = {'category': None, 'widget': None, 'start_date': None, 'end_date': '', 'time_trunc': 'hour',
+            'geo_trunc': '', 'geo_limit': '', 'geo_ids': 0, 'priority': 0, 'name': ''}
+
+
+def job_name(job: dict) -> str:
+    """ Name of the dataset of a job in the store, from its widget, truncation and region. """
+    if job.get('name'):
+        return job['name']
+    parts = [job['category'], job['widget'], job['time_trunc'], job.get('geo_limit'), job.get('geo_ids')]
+    return '_'.join(str(part) for part in parts if part).lower()
+
+
+def load_catalog(catalog_path: str | Path) -> List[dict]:
+    """ Read a catalog of REE data API jobs, in TOML with a `[[jobs]]` table per job or in
+    JSON with a list of jobs. Each job has the `category`, `widget` and `start_date` of the
+    data and optionally the `end_date`, by default today, the `time_trunc`, the `geo_trunc`,
+    `geo_limit` and `geo_ids` of the region, the `priority`, higher first, and the `name`
+    of its dataset.
+
+    :param catalog_path: path to the catalog.
+    :return: list of jobs with all the keys.
+    """
+    catalog_path = Path(catalog_path)
+    if catalog_path.suffix == '.toml':
+        with open(catalog_path, 'rb') as toml_file:
+            content = tomllib.load(toml_file)
+    else:
+        content = json.loads(catalog_path.read_text())
+    jobs = content['jobs'] if isinstance(content, dict) else content
+
+    catalog = []
+    for job in jobs:
+        missing = [key for key, default in JOB_KEYS.items() if default is None and key not in job]
+        unknown = set(job) - set(JOB_KEYS)
+        if missing or unknown:
+            raise ValueError(f'Job {job} of the catalog is not valid. Missing keys: {", ".join(missing) or "none"}. '
+                             f'Unknown keys: {", ".join(sorted(unknown)) or "none"}.')
+        job = {**JOB_KEYS, **job}
+        job['end_date'] = job['end_date'] or date.today().isoformat()
+        job['name'] = job_name(job)
+        catalog.append(job)
+
+    names = [job['name'] for job in catalog]
+    if len(set(names)) < len(names):
+        raise ValueError('Several jobs of the catalog store the same dataset, give them a different `name`.')
+    return catalog
+
+
+def plan_windows(start_date: str,
+                 end_date: str,
+                 time_trunc: str,
+                 freq: str = None) -> List[Window]:
+    """ Request windows of a job, split at calendar boundaries so no day, month or year is
+    divided between requests.
+
+    :param start_date: first date. The whole day, month or year that contains it is included.
+    :param end_date: last date. The whole day, month or year that contains it is included.
+    :param time_trunc: hour, day, month or year.
+    :param freq: pandas frequency of the starts of the windows. By default, the one of the
+      truncation in the `ree.scheduler.window_freq` setting.
+    :return: list with the first and last local hour of each window.
+    """
+    freq = freq or settings.ree.scheduler.window_freq[time_trunc]
+    first_hour, last_hour = period_bounds(start_date, end_date, 'day' if time_trunc == 'hour' else time_trunc)
+    starts = pd.date_range(first_hour.tz_localize(None), last_hour.tz_localize(None), freq=freq)
+    # The starts are midnights, which are never ambiguous in local time
+    starts = starts[starts > first_hour.tz_localize(None)].tz_localize(settings.ree.timezone)
+    ends = [start - pd.Timedelta(hours=1) for start in starts]
+    return list(zip([first_hour, *starts], [*ends, last_hour]))
+
+
+def _window_key(window: Window) -> str:
+    return f'{window[0].isoformat()}/{window[1].isoformat()}'
+
+
+def interleave(planned: List[Tuple[dict, List[Window]]]) -> Iterator[Tuple[dict, Window]]:
+    """ Order of the requests of several jobs: the jobs with a higher priority first and
+    the jobs of the same priority taking turns, so all of them progress at once.
+
+    :param planned: jobs with their pending windows.
+    :return: iterator of the job and window of each request.
+    """
+    for _, group in itertools.groupby(sorted(planned, key=lambda entry: -entry[0]['priority']),
+                                      key=lambda entry: entry[0]['priority']):
+        turns = itertools.zip_longest(*[[(job, window) for window in windows] for job, windows in group])
+        yield from (request for turn in turns for request in turn if request is not None)
+
+
+class BackfillProgress:
+    """ Windows already stored of each job, persisted in a JSON file after each window, so
+    an interrupted backfill resumes where it stopped. """
+
+    def __init__(self, state_path: str | Path = None):
+        self.state_path = Path(state_path or settings.ree.scheduler.state_path)
+        self.state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+
+    def pending(self, job: dict, windows: List[Window]) -> List[Window]:
+        """ Windows of a job that are not stored yet. """
+        done = set(self.state.get(job['name'], []))
+        return [window for window in windows if _window_key(window) not in done]
+
+    def mark_done(self, job: dict, window: Window) -> None:
+        """ Record a stored window of a job. """
+        self.state.setdefault(job['name'], []).append(_window_key(window))
+        os.makedirs(self.state_path.parent, exist_ok=True)
+        # Replaced at once, so an interruption never leaves a partial file
+        temporary_path = self.state_path.with_suffix('.tmp')
+        temporary_path.write_text(json.dumps(self.state))
+        os.replace(temporary_path, self.state_path)
+
+
+def run_catalog_backfill(catalog: List[dict],
+                         store: HourlyStore = None,
+                         progress: BackfillProgress = None,
+                         concurrency: int = None) -> Dict[str, dict]:
+    """ Retrieve and store the windows of the catalog jobs that are not stored yet.
+
+    The requests of all the jobs share a pipeline with `concurrency` requests in flight,
+    so the limit is global instead of per job. If a request fails, the backfill stops and
+    the error is raised, the next run continues with the pending windows.
+
+    :param catalog: jobs from `load_catalog`.
+    :param store: store of the series. By default, the one of the `ree.storage.folder` setting.
+    :param progress: progress of the jobs. By default, the one of the `ree.scheduler.state_path` setting.
+    :param concurrency: number of requests in flight. By default, the `ree.scheduler.concurrency` setting.
+    :return: dict with the number of `windows`, the ones `stored_before` and the `retrieved` ones per job.
+    """
+    store = store or HourlyStore()
+    progress = progress or BackfillProgress()
+    concurrency = concurrency or settings.ree.scheduler.concurrency
+
+    planned = []
+    summary = {}
+    for job in catalog:
+        windows = plan_windows(job['start_date'], job['end_date'], job['time_trunc'])
+        pending = progress.pending(job, windows)
+        planned.append((job, pending))
+        summary[job['name']] = {'windows': len(windows), 'stored_before': len(windows) - len(pending), 'retrieved': 0}
+        logger.info('{}: {} of {} windows pending.', job['name'], len(pending), len(windows))
+
+    sources = {job['name']: WidgetSource(job['category'], job['widget'], job['time_trunc'], job['geo_trunc'] or None,
+                                         job['geo_limit'] or None, job['geo_ids'] or None)
+               for job, _ in planned}
+
+    def request(item: Tuple[dict, Window]):
+        job, window = item
+        return sources[job['name']].request(window)
+
+    def parse(payload, item: Tuple[dict, Window]) -> Tuple[dict, Window, pd.DataFrame]:
+        job, window = item
+        return job, window, sources[job['name']].parse(payload, window)
+
+    def write(parsed: Tuple[dict, Window, pd.DataFrame]) -> None:
+        job, window, df = parsed
+        store.write(job['name'], df)
+        progress.mark_done(job, window)
+        summary[job['name']]['retrieved'] += 1
+
+    try:
+        run_pipeline(interleave(planned), request, parse, write, fetchers=concurrency)
+    finally:
+        for name, job_summary in summary.items():
+            logger.info('{}: {} windows retrieved, {} of {} stored.', name, job_summary['retrieved'],
+                        job_summary['stored_before'] + job_summary['retrieved'], job_summary['windows'])
+    return summary
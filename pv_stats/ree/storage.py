@@ -0,0 +1,104 @@
+import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+import pandas as pd
+
+from pv_stats.config.config import settings
+
+# First and last local hour of a range, both included
+Window = Tuple[pd.Timestamp, pd.Timestamp]
+
+
+def to_local_timestamp(date: str | datetime | pd.Timestamp) -> pd.Timestamp:
+    """ Timestamp in the `ree.timezone` setting. Dates without timezone are local times.
+
+    :param date: date in ISO 8601 format or datetime.
+    :return: timezone aware timestamp.
+    """
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize(settings.ree.timezone, ambiguous=True, nonexistent='shift_forward')
+    return timestamp.tz_convert(settings.ree.timezone)
+
+
+def to_hourly(df: pd.DataFrame) -> pd.DataFrame:
+    """ Hourly series with a UTC index from the frames parsed from the REE APIs.
+
+    The frames of the REE demand API have values every ten minutes, so the values of
+    each hour are averaged and the powers in MW become energies in MWh.
+
+    :param df: frame parsed from any of the REE APIs, indexed by timezone aware times.
+    :return: numeric columns resampled per hour.
+    """
+    df = df.set_axis(pd.to_datetime(df.index, utc=True)).select_dtypes('number')
+    return df.resample('h').mean().dropna(how='all')
+
+
+class HourlyStore:
+    """ Local store of the hourly REE series, in a parquet file per dataset and UTC month,
+    so the API is only queried for the hours not retrieved before. """
+
+    def __init__(self, folder: str | Path = None):
+        self.folder = Path(folder or settings.ree.storage.folder)
+
+    def _month_path(self, dataset: str, month: pd.Period) -> Path:
+        return self.folder / dataset / f'{month}.parquet'
+
+    def _month_paths(self, dataset: str) -> List[Path]:
+        return sorted((self.folder / dataset).glob('*.parquet'))
+
+    def version(self, dataset: str) -> str:
+        """ Key that changes whenever the stored data of a dataset changes. """
+        signature = [(path.name, path.stat().st_mtime_ns, path.stat().st_size) for path in self._month_paths(dataset)]
+        return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:12]
+
+    def write(self, dataset: str, hourly_df: pd.DataFrame) -> None:
+        """ Add hourly data to a dataset. The new values replace the stored ones of the same hours.
+
+        :param dataset: name of the dataset, e.g. `demand`.
+        :param hourly_df: hourly series with timezone aware index, from `to_hourly`.
+        """
+        if hourly_df.empty:
+            return
+
+        hourly_df = hourly_df.tz_convert('UTC')
+        os.makedirs(self.folder / dataset, exist_ok=True)
+        for month, month_df in hourly_df.groupby(hourly_df.index.tz_localize(None).to_period('M')):
+            month_path = self._month_path(dataset, month)
+            if month_path.exists():
+                stored_df = pd.read_parquet(month_path)
+                # Duplicated hours, e.g. written by older versions, are replaced too
+                stored_df = stored_df[~stored_df.index.duplicated(keep='last')]
+                month_df = month_df.combine_first(stored_df)
+            month_df.sort_index().to_parquet(month_path)
+
+    def read_all(self, dataset: str) -> pd.DataFrame:
+        """ All the stored hours of a dataset, with the index in the `ree.timezone` setting. """
+        month_dfs = [pd.read_parquet(path) for path in self._month_paths(dataset)]
+        if not month_dfs:
+            return pd.DataFrame(index=pd.DatetimeIndex([], tz=settings.ree.timezone))
+        return pd.concat(month_dfs).sort_index().tz_convert(settings.ree.timezone)
+
+    def read(self,
+             dataset: str,
+             start: pd.Timestamp,
+             end: pd.Timestamp) -> pd.DataFrame:
+        """ Stored hours of a dataset between two timestamps, both included.
+
+        :param dataset: name of the dataset.
+        :param start: first hour.
+        :param end: last hour.
+        :return: hourly series with the index in the `ree.timezone` setting.
+        """
+        start, end = start.tz_convert('UTC'), end.tz_convert('UTC')
+        months = pd.period_range(start.tz_localize(None), end.tz_localize(None), freq='M')
+        month_paths = [self._month_path(dataset, month) for month in months]
+        month_dfs = [pd.read_parquet(path) for path in month_paths if path.exists()]
+        if not month_dfs:
+            return pd.DataFrame(index=pd.DatetimeIndex([], tz=settings.ree.timezone))
+
+        hourly_df = pd.concat(month_dfs).sort_index()
+        return hourly_df.loc[start:end].tz_convert(settings.ree.timezone)
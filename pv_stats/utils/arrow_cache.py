@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+pa = lazy_import('pyarrow')
+feather = lazy_import('pyarrow.feather')
+shapely = lazy_import('shapely')
+
+# Key of the schema metadata with the source of the cache and its geometry columns
+METADATA_KEY = b'pv_stats'
+
+
+def get_arrow_cache_path(source_path: str | Path,
+                         variant: str = None) -> Path:
+    """ Path of the Arrow cache of a file. It is stored in the `arrow_cache.folder_name`
+    folder of the processed data, with a hash of the absolute path of the file and the
+    variant, such as the layer, in the name.
+
+    :param source_path: path to the cached file.
+    :param variant: layer or sheet read from the file.
+    :return: path to the cache.
+    """
+    source_path = Path(source_path).resolve()
+    key = hashlib.sha1(f'{source_path}:{variant or ""}'.encode('utf-8')).hexdigest()[:12]
+    return Path(settings.processed_data_folder) / settings.arrow_cache.folder_name / f'{source_path.stem}_{key}.arrow'
+
+
+def is_processed_output(path: str | Path) -> bool:
+    """ Whether a file is in the `processed_data_folder`, so it is read through the cache.
+    The raw inputs are read once to be processed and are not cached.
+
+    :param path: path to the file.
+    :return: True if the file is a processed output.
+    """
+    return Path(path).resolve().is_relative_to(Path(settings.processed_data_folder).resolve())
+
+
+def _source_signature(source_path: Path) -> dict:
+    stat = source_path.stat()
+    return {'source': str(source_path.resolve()), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _cache_metadata(cache_path: Path) -> dict | None:
+    """ Metadata of a cache, reading only its schema. """
+    with pa.memory_map(str(cache_path)) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return json.loads(metadata[METADATA_KEY]) if METADATA_KEY in metadata else None
+
+
+def is_arrow_cache_valid(cache_path: str | Path,
+                         source_path: str | Path) -> bool:
+    """ Whether the cache exists and was written from the current version of the file.
+
+    :param cache_path: path to the cache.
+    :param source_path: path to the cached file.
+    :return: True if the cache can be used.
+    """
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        return False
+
+    try:
+        metadata = _cache_metadata(cache_path)
+    except pa.ArrowInvalid:
+        return False
+    return metadata is not None and metadata['signature'] == _source_signature(Path(source_path))
+
+
+def write_arrow_cache(df: pd.DataFrame,
+                      cache_path: str | Path,
+                      source_path: str | Path) -> None:
+    """ Write a DataFrame, or GeoDataFrame with the geometries as WKB, to an uncompressed
+    Arrow IPC file, so it can be memory mapped.
+
+    The file is written under a temporary name and renamed, so the processes reading the
+    cache never see a partial file.
+
+    :param df: DataFrame to cache.
+    :param cache_path: path to the cache.
+    :param source_path: path to the cached file, to detect when the cache is outdated.
+    """
+    cache_path = Path(cache_path)
+    geometry_columns = {}
+    active_geometry = None
+    if isinstance(df, gpd.GeoDataFrame):
+        geometry_columns = {column: df[column].crs.to_wkt() if df[column].crs else None
+                            for column in df.columns if isinstance(df[column], gpd.GeoSeries)}
+        active_geometry = df.geometry.name
+        df = pd.DataFrame(df).assign(**{column: shapely.to_wkb(df[column].values) for column in geometry_columns})
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = {'signature': _source_signature(Path(source_path)),
+                'geometry_columns': geometry_columns,
+                'active_geometry': active_geometry}
+    table = table.replace_schema_metadata({**table.schema.metadata, METADATA_KEY: json.dumps(metadata)})
+
+    os.makedirs(cache_path.parent, exist_ok=True)
+    temporary_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    feather.write_feather(table, temporary_path, compression='uncompressed')
+    os.replace(temporary_path, cache_path)
+
+
+def open_arrow_table(cache_path: str | Path) -> pa.Table:
+    """ Open a cache as an Arrow table backed by the memory mapped file. The pages are
+    shared by all the processes that open the same cache.
+
+    :param cache_path: path to the cache.
+    :return: Arrow table, with the geometries as WKB.
+    """
+    with pa.memory_map(str(cache_path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def read_arrow_cache(cache_path: str | Path,
+                     zero_copy: bool = None) -> pd.DataFrame:
+    """ Read a cache written with `write_arrow_cache`.
+
+    :param cache_path: path to the cache.
+    :param zero_copy: keep the numeric columns without nulls as read only views of the
+      memory mapped file instead of copying them. By default, the `arrow_cache.zero_copy` setting.
+    :return: DataFrame, or GeoDataFrame if the cached frame had geometries.
+    """
+    zero_copy = settings.arrow_cache.zero_copy if zero_copy is None else zero_copy
+    table = open_arrow_table(cache_path)
+    metadata = json.loads(table.schema.metadata[METADATA_KEY])
+    geometry_columns = metadata['geometry_columns']
+    df = table.to_pandas(split_blocks=zero_copy)
+
+    if not geometry_columns:
+        return df
+
+    for column, crs in geometry_columns.items():
+        df[column] = gpd.GeoSeries(shapely.from_wkb(df[column].to_numpy()), index=df.index, crs=crs)
+    return gpd.GeoDataFrame(df, geometry=metadata['active_geometry'])
+
+
+def read_with_arrow_cache(source_path: str | Path,
+                          reader: Callable[[], pd.DataFrame],
+                          variant: str = None) -> pd.DataFrame:
+    """ Read a file through its Arrow cache, reading it with `reader` and writing the
+    cache when it does not exist or the file changed.
+
+    :param source_path: path to the file.
+    :param reader: function that reads the file.
+    :param variant: layer or sheet read from the file.
+    :return: DataFrame or GeoDataFrame with the content of the file.
+    """
+    cache_path = get_arrow_cache_path(source_path, variant)
+    if is_arrow_cache_valid(cache_path, source_path):
+        logger.debug('Reading {} from the Arrow cache {}.', source_path, cache_path)
+        return read_arrow_cache(cache_path)
+
+    df = reader()
+    try:
+        write_arrow_cache(df, cache_path, source_path)
+    except (OSError, pa.ArrowException) as error:
+        # The data can still be used, e.g. from a read only folder or with mixed types
+        logger.warning('Arrow cache of {} not written: {}', source_path, error)
+    return df
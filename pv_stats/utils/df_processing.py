@@ -1,10 +1,26 @@
+from __future__ import annotations
+
+import re
 from pathlib import Path
+from typing import Sequence
 
-import geopandas as gpd
 import pandas as pd
 
 from pv_stats.config.config import settings
-from pv_stats.utils.io_utils import save_geo_dataframe, save_dataframe, read_geo_dataframe, read_dataframe
+from pv_stats.constants.csv_schemas import CITIES_INFO_SCHEMA, CONSUMPTION_PER_CITY_SCHEMA
+from pv_stats.utils.geometry import add_equal_area, compute_areas, simplify_coverage
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.lazy_imports import lazy_import
+from pv_stats.utils.municipality_registry import (add_municipality_aliases, attach_municipality_key,
+                                                  build_municipality_registry, load_municipality_registry,
+                                                  merge_municipalities, municipality_registry_exists,
+                                                  update_municipality_registry)
+from pv_stats.utils.io_utils import (save_geo_dataframe, save_dataframe, read_geo_dataframe, read_dataframe,
+                                     read_csv_with_schema, read_projected_geo_dataframe)
+from pv_stats.utils.partitioning import map_geo_files
+
+fiona = lazy_import('fiona')
+gpd = lazy_import('geopandas')
 
 
 def merge_geometries(geodataframe: gpd.GeoDataFrame,
@@ -24,10 +40,16 @@ def merge_geometries(geodataframe: gpd.GeoDataFrame,
     geodataframe.drop(geodataframe[geodataframe[column_name] == row_to_remove].index, inplace=True)
 
 
-def process_administrative_divisions_df(administrative_divisions_path: str | Path) -> gpd.GeoDataFrame:
+@instrument('process')
+def process_administrative_divisions_df(administrative_divisions_path: str | Path,
+                                        cities_info_path: str | Path = None) -> gpd.GeoDataFrame:
     """ Process administrative divisions data to convert to numbers and set a common index.
 
+    The `municipio_id` key comes from the municipality registry, which is built with the
+    cities info. If it is not saved yet, the cities info is processed first.
+
     :param administrative_divisions_path: path to the administrative divisions file.
+    :param cities_info_path: path to the cities info file, required if the registry is not saved.
     :return: GeoDataFrame with the administrative divisions.
     """
     administrative_divisions_path = Path(administrative_divisions_path)
@@ -56,14 +78,27 @@ def process_administrative_divisions_df(administrative_divisions_path: str | Pat
                      row_to_keep='Navacerrada',
                      row_to_remove='Los Baldios')
 
-    # Calculate the square meters
-    administrative_divisions_df['superficie_km2'] = administrative_divisions_df['geometry'].area / 10 ** 6
+    # Calculate the square kilometers
+    administrative_divisions_df['superficie_km2'] = compute_areas(administrative_divisions_df) / 10 ** 6
+
+    # CD_MUNICIPIO is the municipio_codigo of the cities info, then register the other codes and names
+    if not municipality_registry_exists():
+        if cities_info_path is None:
+            raise ValueError('The municipality registry is not saved yet, the path to the cities info is '
+                             'required to build it.')
+        process_cities_info_df(cities_info_path)
+    registry = load_municipality_registry()
+    attach_municipality_key(administrative_divisions_df, 'CD_MUNICIPIO', 'municipio_codigo', registry)
+    registry = add_municipality_aliases(registry, administrative_divisions_df, 'CD_INE', 'CD_INE')
+    registry = add_municipality_aliases(registry, administrative_divisions_df, 'DS_NOMBRE', 'nombre')
+    update_municipality_registry(registry)
 
     # Save
     save_geo_dataframe('administrative_divisions', administrative_divisions_df)
     return administrative_divisions_df
 
 
+@instrument('process')
 def process_cities_info_df(cities_info_path: str | Path) -> pd.DataFrame:
     """ Process administrative divisions data to convert to numbers, sanitize the names and
     set a common index.
@@ -72,31 +107,24 @@ def process_cities_info_df(cities_info_path: str | Path) -> pd.DataFrame:
     :return: GeoDataFrame with the administrative divisions.
     """
     cities_info_path = Path(cities_info_path)
-    cities_info_df = pd.read_csv(cities_info_path,
-                                 sep=';', encoding='ISO-8859-1')
-
-    # Convert to numbers, CD_MUNICIPIO is the most important as it will be used as key
-    cities_info_df['municipio_codigo'] = pd.to_numeric(cities_info_df['municipio_codigo'],
-                                                       downcast='integer')
-    cities_info_df['municipio_codigo_ine'] = pd.to_numeric(cities_info_df['municipio_codigo_ine'],
-                                                           downcast='integer')
-    cities_info_df['nuts4_codigo'] = pd.to_numeric(cities_info_df['nuts4_codigo'],
-                                                   downcast='integer')
-    cities_info_df['superficie_km2'] = pd.to_numeric(cities_info_df['superficie_km2'])
-    cities_info_df['densidad_por_km2'] = pd.to_numeric(cities_info_df['densidad_por_km2'])
-
-    # Sanitize names
-    cities_info_df['municipio_nombre'] = cities_info_df['municipio_nombre'].str.strip()
+    # The schema converts the codes and surfaces to numbers and sanitizes the names while parsing
+    cities_info_df = read_csv_with_schema(cities_info_path, CITIES_INFO_SCHEMA)
 
     # Estimate the population
     cities_info_df['population'] = cities_info_df['superficie_km2'] * cities_info_df['densidad_por_km2']
     cities_info_df['population'] = cities_info_df['population'].round().astype(int)
 
+    # The cities info is the reference list of municipalities, its aliases are merged into the
+    # registry, keeping the ones added by the administrative divisions
+    registry = update_municipality_registry(build_municipality_registry(cities_info_df))
+    attach_municipality_key(cities_info_df, 'municipio_codigo_ine', 'municipio_codigo_ine', registry)
+
     # Save
     save_dataframe('cities_info', cities_info_df)
     return cities_info_df
 
 
+@instrument('process')
 def process_consumption_per_city_df(consumption_per_city_path: str | Path) -> pd.DataFrame:
     """ Process consumption per city data to convert to numbers and sanitize the names.
 
@@ -104,56 +132,84 @@ def process_consumption_per_city_df(consumption_per_city_path: str | Path) -> pd
     :return:
     """
     consumption_per_city_path = Path(consumption_per_city_path)
-    consumption_per_city_df = pd.read_csv(consumption_per_city_path, encoding='ISO-8859-1')
-
-    # Sanitize names
-    consumption_per_city_df['Nombre'] = consumption_per_city_df['Nombre'].str.strip()
-
-    # Remove points from the MWh columns, so they can be converted to numeric
-    consumption_per_city_df.iloc[:, 1:] = consumption_per_city_df.iloc[:, 1:].map(lambda x: x.replace('.', ''))
-    consumption_per_city_df.iloc[:, 1:] = consumption_per_city_df.iloc[:, 1:].apply(pd.to_numeric,
-                                                                                    args=('coerce', 'integer'))
+    # The schema removes the thousands separator of the MWh columns, converts them to numbers
+    # and sanitizes the names while parsing
+    consumption_per_city_df = read_csv_with_schema(consumption_per_city_path, CONSUMPTION_PER_CITY_SCHEMA)
+    attach_municipality_key(consumption_per_city_df, 'Nombre', 'nombre')
 
     # Save
     save_dataframe('consumption_per_city', consumption_per_city_df)
     return consumption_per_city_df
 
 
-def process_urban_zones_df(urban_zones_path: str | Path) -> gpd.GeoDataFrame:
-    """ Process urban zones data to a UTM projection and calculate the area in m2.
+@instrument('process')
+def process_urban_zones_df(urban_zones_path: str | Path,
+                           partitioned: bool = None) -> gpd.GeoDataFrame:
+    """ Process urban zones data to the equal area projection and calculate the area in m2.
 
     :param urban_zones_path: path to the urban zones file.
+    :param partitioned: process the file by spatial partitions in all the cores, without
+      loading it in memory. By default, the `partitioning.enabled` setting.
     :return: processed GeoDataFrame.
     """
+    partitioned = settings.partitioning.enabled if partitioned is None else partitioned
     urban_zones_path = Path(urban_zones_path)
-    urban_zones_df = gpd.read_file(urban_zones_path)
-
-    # Move to UTM zone 30, to calculate the areas
-    urban_zones_df.to_crs('EPSG:23030', inplace=True)
-
-    # Add the area of the polygons in m2
-    urban_zones_df['superficie_m2'] = urban_zones_df['geometry'].area
+    if partitioned:
+        urban_zones_df = map_geo_files(urban_zones_path, add_equal_area)
+    else:
+        urban_zones_df = read_projected_geo_dataframe(urban_zones_path)
 
     # Save
     save_geo_dataframe('urban_zones', urban_zones_df)
     return urban_zones_df
 
 
-def process_land_use_df(land_use_path: str | Path) -> gpd.GeoDataFrame:
+def get_land_use_layer(land_use_path: str | Path) -> str:
+    """ Name of the land use layer of a SIOSE file, `SAR_<province>_T_USOS`.
+
+    :param land_use_path: path to the SIOSE GeoPackage.
+    :return: name of the layer.
+    """
+    for layer in fiona.listlayers(land_use_path):
+        if re.fullmatch(r'SAR_\d+_T_USOS', layer):
+            return layer
+
+    raise ValueError(f'Land use layer not found in {land_use_path}.')
+
+
+def _filter_urban_land_use(land_use_df: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    return land_use_df.loc[land_use_df['ID_USO_MAX'].isin(settings.land_use.urban_zones)].copy()
+
+
+@instrument('process')
+def process_land_use_df(land_use_path: str | Path | Sequence[str | Path],
+                        partitioned: bool = None) -> gpd.GeoDataFrame:
     """ Process land use data to filter those urban zones and calculate the area in m2.
 
-    :param land_use_path: path to the land use file.
+    :param land_use_path: path to the land use file, or list of paths to process several
+      provinces at once.
+    :param partitioned: process the files by spatial partitions in all the cores, without
+      loading them in memory. By default, the `partitioning.enabled` setting.
     :return: filtered GeoDataFrame.
     """
-    land_use_path = Path(land_use_path)
-    land_use_df = gpd.read_file(land_use_path, layer='SAR_28_T_USOS')
-    land_use_df = land_use_df.loc[land_use_df['ID_USO_MAX'].isin(settings.land_use.urban_zones)]
+    partitioned = settings.partitioning.enabled if partitioned is None else partitioned
+    land_use_paths = [land_use_path] if isinstance(land_use_path, (str, Path)) else land_use_path
+    land_use_paths = [Path(path) for path in land_use_paths]
+    if partitioned:
+        land_use_df = map_geo_files(land_use_paths, _filter_urban_land_use, layer=get_land_use_layer)
+    else:
+        land_use_df = pd.concat([gpd.read_file(path, layer=get_land_use_layer(path)) for path in land_use_paths],
+                                ignore_index=True)
+        land_use_df = _filter_urban_land_use(land_use_df)
+    # SIOSE identifies the municipalities with the INE code
+    attach_municipality_key(land_use_df, 'MUNICIPIO', 'municipio_codigo_ine')
 
     # Save
     save_geo_dataframe('land_use', land_use_df)
     return land_use_df
 
 
+@instrument('process')
 def join_administrative_divisions_dfs(administrative_divisions_path: str | Path,
                                       cities_info_path: str | Path) -> gpd.GeoDataFrame:
     """
@@ -162,22 +218,21 @@ def join_administrative_divisions_dfs(administrative_divisions_path: str | Path,
     :param cities_info_path:
     :return:
     """
-    administrative_divisions_path = Path(administrative_divisions_path)
-    if administrative_divisions_path.exists():
-        administrative_divisions_df = read_geo_dataframe(administrative_divisions_path)
-    else:
-        administrative_divisions_df = process_administrative_divisions_df('/data/DIVISIONES_ADMINISTRATIVAS_CM.gpkg')
-
+    # The cities info goes first, as it builds the municipality registry
     cities_info_path = Path(cities_info_path)
     if cities_info_path.exists():
         administrative_divisions_info_df = read_dataframe(cities_info_path)
     else:
         administrative_divisions_info_df = process_cities_info_df('/data/cities_info.csv')
 
+    administrative_divisions_path = Path(administrative_divisions_path)
+    if administrative_divisions_path.exists():
+        administrative_divisions_df = read_geo_dataframe(administrative_divisions_path)
+    else:
+        administrative_divisions_df = process_administrative_divisions_df('/data/DIVISIONES_ADMINISTRATIVAS_CM.gpkg')
+
     # Match city per administrative division
-    cities_info_geo = administrative_divisions_df.merge(administrative_divisions_info_df,
-                                                        left_on='CD_MUNICIPIO',
-                                                        right_on='municipio_codigo')
+    cities_info_geo = merge_municipalities(administrative_divisions_df, administrative_divisions_info_df)
 
     # Remove redundant columns
     cities_info_geo.drop(['CD_MUNICIPIO', 'CD_INE_1', 'superficie_km2_x'], axis=1, inplace=True)
@@ -185,7 +240,8 @@ def join_administrative_divisions_dfs(administrative_divisions_path: str | Path,
     cities_info_geo.drop(['superficie_km2_y'], axis=1, inplace=True)
 
     # Reorder columns
-    cities_info_geo = cities_info_geo[['municipio_codigo',
+    cities_info_geo = cities_info_geo[['municipio_id',
+                                       'municipio_codigo',
                                        'municipio_nombre',
                                        'DS_NOMBRE',
                                        'DS_DESCRIPCION',
@@ -201,9 +257,27 @@ def join_administrative_divisions_dfs(administrative_divisions_path: str | Path,
                                        'geometry']]
 
     save_geo_dataframe('administrative_divisions_with_info', cities_info_geo)
+    build_resolution_levels('administrative_divisions_with_info', cities_info_geo)
     return cities_info_geo
 
 
+def build_resolution_levels(name: str,
+                            geo_df: gpd.GeoDataFrame) -> dict[str, gpd.GeoDataFrame]:
+    """ Build and save the simplified versions of a GeoDataFrame for every resolution level,
+    so exports and maps can read the coarse shapes directly with `read_geo_dataframe_level`.
+
+    :param name: name of the processed GeoDataFrame.
+    :param geo_df: GeoDataFrame with polygons that do not overlap, such as the municipalities.
+    :return: dictionary with the simplified GeoDataFrame per resolution level.
+    """
+    levels = dict()
+    for resolution, tolerance in settings.geodata.resolution_levels.items():
+        levels[resolution] = simplify_coverage(geo_df, tolerance)
+        save_geo_dataframe(f'{name}_{resolution}', levels[resolution])
+
+    return levels
+
+
 def remap_column_categories(gdf_path: str | Path,
                             column_name: str,
                             categories_mapping: dict[str, str],
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import numpy as np
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+pyproj = lazy_import('pyproj')
+
+
+def get_resolution_tolerance(resolution: str) -> float:
+    """ Get the simplification tolerance of a resolution level.
+
+    :param resolution: name of the level, defined in `geodata.resolution_levels`.
+    :return: tolerance in meters.
+    """
+    resolution_levels = settings.geodata.resolution_levels
+    if resolution not in resolution_levels:
+        raise ValueError(f'Resolution `{resolution}` not defined. '
+                         f'Valid values are: {", ".join(resolution_levels)}.')
+
+    return resolution_levels[resolution]
+
+
+def _simplify_shared_arcs(geometries: np.ndarray, tolerance: float) -> np.ndarray:
+    """ Simplify a polygon coverage keeping the shared boundaries identical.
+
+    The boundaries are noded and merged into the arcs between junctions, each arc is
+    simplified once and the faces rebuilt from them are assigned back to the polygon
+    that contains them, so neighbours never get gaps or overlaps between them.
+
+    :param geometries: array of polygons that do not overlap.
+    :param tolerance: simplification tolerance in the units of the CRS.
+    :return: array with the simplified polygons.
+    """
+    arcs = shapely.line_merge(shapely.union_all(shapely.boundary(geometries)))
+    arcs = shapely.get_parts(arcs)
+    arcs = shapely.simplify(arcs, tolerance, preserve_topology=True)
+
+    noded_arcs = shapely.get_parts(shapely.node(shapely.union_all(arcs)))
+    faces = shapely.get_parts(shapely.polygonize(noded_arcs))
+    faces = faces[~shapely.is_empty(faces)]
+
+    # Each face belongs to the polygon where its interior point falls
+    tree = shapely.STRtree(geometries)
+    face_idx, geometry_idx = tree.query(shapely.point_on_surface(faces), predicate='within')
+
+    simplified = np.empty(len(geometries), dtype=object)
+    order = np.argsort(geometry_idx, kind='stable')
+    face_idx, geometry_idx = face_idx[order], geometry_idx[order]
+    splits = np.flatnonzero(np.diff(geometry_idx)) + 1
+    for faces_of_geometry, index in zip(np.split(face_idx, splits), geometry_idx[np.r_[0, splits]]):
+        simplified[index] = shapely.union_all(faces[faces_of_geometry])
+
+    # Polygons smaller than the tolerance can collapse, keep their simplified shape
+    missing = np.flatnonzero(simplified == None)  # noqa: E711
+    simplified[missing] = shapely.simplify(geometries[missing], tolerance, preserve_topology=True)
+    return simplified
+
+
+def simplify_coverage(geo_df: gpd.GeoDataFrame,
+                      tolerance: float,
+                      precision: float = None) -> gpd.GeoDataFrame:
+    """ Simplify the polygons of a coverage, such as the municipalities, preserving the
+    topology between neighbours and reducing the precision of the coordinates.
+
+    The simplification is done in meters, so geographic data is moved to `maps.crs` and
+    the simplified polygons are moved back to the CRS of the GeoDataFrame.
+
+    :param geo_df: GeoDataFrame whose polygons do not overlap.
+    :param tolerance: simplification tolerance in meters.
+    :param precision: grid size, in meters, to round the coordinates. By default, the
+      `geodata.coordinate_precision` setting.
+    :return: copy of the GeoDataFrame with the simplified geometries, in its CRS.
+    """
+    precision = settings.geodata.coordinate_precision if precision is None else precision
+    simplified_df = geo_df.copy()
+    geographic = simplified_df.crs is not None and simplified_df.crs.is_geographic
+    if geographic:
+        simplified_df = simplified_df.to_crs(settings.maps.crs)
+
+    geometries = shapely.make_valid(np.asarray(simplified_df.geometry.values))
+    if tolerance:
+        if hasattr(shapely, 'coverage_simplify'):
+            geometries = shapely.coverage_simplify(geometries, tolerance)
+        else:
+            geometries = _simplify_shared_arcs(geometries, tolerance)
+    if precision:
+        geometries = shapely.set_precision(geometries, precision)
+
+    simplified_df[simplified_df.geometry.name] = gpd.GeoSeries(geometries,
+                                                               index=simplified_df.index,
+                                                               crs=simplified_df.crs)
+    if geographic:
+        simplified_df = simplified_df.to_crs(geo_df.crs)
+    logger.debug('Coverage simplified with a tolerance of {} and a precision of {}.', tolerance, precision)
+    return simplified_df
+
+
+def to_equal_area(geo_df: gpd.GeoDataFrame | gpd.GeoSeries,
+                  crs: str = None) -> gpd.GeoDataFrame | gpd.GeoSeries:
+    """ Reproject the geometries to the equal area CRS, where the areas are computed.
+    Nothing is done if they already are in that CRS.
+
+    :param geo_df: GeoDataFrame or GeoSeries with the CRS defined.
+    :param crs: equal area CRS. By default, the `geodata.equal_area_crs` setting.
+    :return: reprojected GeoDataFrame or GeoSeries.
+    """
+    crs = pyproj.CRS.from_user_input(crs or settings.geodata.equal_area_crs)
+    if geo_df.crs is None:
+        raise ValueError('The CRS of the geometries is not defined, they cannot be moved to an equal area CRS.')
+    if geo_df.crs == crs:
+        return geo_df
+
+    return geo_df.to_crs(crs)
+
+
+def compute_areas(geo_df: gpd.GeoDataFrame | gpd.GeoSeries,
+                  crs: str = None) -> np.ndarray:
+    """ Area in m2 of every geometry, computed in the equal area CRS whatever the CRS
+    of the source is.
+
+    :param geo_df: GeoDataFrame or GeoSeries with the CRS defined.
+    :param crs: equal area CRS. By default, the `geodata.equal_area_crs` setting.
+    :return: array with the areas.
+    """
+    geometries = to_equal_area(geo_df, crs)
+    if isinstance(geometries, gpd.GeoDataFrame):
+        geometries = geometries.geometry
+    return shapely.area(np.asarray(geometries.values))
+
+
+def add_equal_area(geo_df: gpd.GeoDataFrame,
+                   area_column: str = 'superficie_m2',
+                   crs: str = None) -> gpd.GeoDataFrame:
+    """ Reproject a GeoDataFrame to the equal area CRS and add the area of its geometries.
+
+    :param geo_df: GeoDataFrame with the CRS defined.
+    :param area_column: column where the areas in m2 are written.
+    :param crs: equal area CRS. By default, the `geodata.equal_area_crs` setting.
+    :return: reprojected GeoDataFrame with the areas.
+    """
+    geo_df = to_equal_area(geo_df, crs).copy()
+    geo_df[area_column] = compute_areas(geo_df, crs)
+    return geo_df
+
+
+def resolve_overlaps(geo_df: gpd.GeoDataFrame,
+                     rank: np.ndarray) -> gpd.GeoDataFrame:
+    """ Remove from each polygon the parts covered by the polygons that precede it, so the
+    polygons do not overlap and their areas add up to the area of their union.
+
+    The candidates are found with a spatial index, so only the polygons that intersect
+    are compared, and a polygon is only cut when another one precedes it.
+
+    :param geo_df: GeoDataFrame with polygons that can overlap.
+    :param rank: precedence of each polygon, lower first. The ties are solved by the order
+      of the rows.
+    :return: copy of the GeoDataFrame with the resolved geometries, without the polygons
+      completely covered by the preceding ones.
+    """
+    geometries = shapely.make_valid(np.asarray(geo_df.geometry.values))
+    position = np.empty(len(geometries), dtype=np.int64)
+    position[np.lexsort((np.arange(len(geometries)), np.asarray(rank)))] = np.arange(len(geometries))
+
+    tree = shapely.STRtree(geometries)
+    query_idx, tree_idx = tree.query(geometries, predicate='intersects')
+    preceding = position[tree_idx] < position[query_idx]
+    query_idx, tree_idx = query_idx[preceding], tree_idx[preceding]
+    # The polygons that only share a border keep all their area
+    overlapping = ~shapely.touches(geometries[query_idx], geometries[tree_idx])
+    query_idx, tree_idx = query_idx[overlapping], tree_idx[overlapping]
+
+    resolved = geometries.copy()
+    order = np.argsort(query_idx, kind='stable')
+    query_idx, tree_idx = query_idx[order], tree_idx[order]
+    overlaps_per_polygon = np.bincount(query_idx, minlength=len(geometries))
+    # The polygons overlapped by a single one are cut at once
+    single = overlaps_per_polygon[query_idx] == 1
+    resolved[query_idx[single]] = shapely.difference(geometries[query_idx[single]], geometries[tree_idx[single]])
+    query_idx, tree_idx = query_idx[~single], tree_idx[~single]
+    if len(query_idx):
+        splits = np.flatnonzero(np.diff(query_idx)) + 1
+        for preceding_of_polygon, index in zip(np.split(tree_idx, splits), query_idx[np.r_[0, splits]]):
+            resolved[index] = shapely.difference(geometries[index],
+                                                 shapely.union_all(geometries[preceding_of_polygon]))
+
+    keep = shapely.area(resolved) > 0
+    resolved_df = geo_df[keep].copy()
+    resolved_df[resolved_df.geometry.name] = gpd.GeoSeries(resolved[keep], index=resolved_df.index, crs=geo_df.crs)
+    logger.debug('{} of {} polygons overlapped by the preceding ones, {} completely covered.',
+                 np.count_nonzero(overlaps_per_polygon), len(geometries), np.count_nonzero(~keep))
+    return resolved_df
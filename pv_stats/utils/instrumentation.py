@@ -0,0 +1,295 @@
+import atexit
+import functools
+import itertools
+import json
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from loguru import logger
+
+from pv_stats.config.config import settings
+
+
+def _io_counters() -> Dict[str, int]:
+    """ Bytes read and written by the process, including files and sockets. Only
+    available in Linux, elsewhere they are not reported. """
+    try:
+        with open('/proc/self/io') as io_file:
+            counters = dict(line.split(': ') for line in io_file.read().splitlines())
+    except OSError:
+        return {}
+    return {'bytes_read': int(counters['rchar']), 'bytes_written': int(counters['wchar'])}
+
+
+def _peak_rss_mb() -> float:
+    # Maximum resident set size since the process started, Linux reports it in KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rss_mb() -> float | None:
+    """ Current resident set size of the process. Only available in Linux, elsewhere it is
+    not reported. """
+    try:
+        with open('/proc/self/statm') as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * resource.getpagesize() / 2 ** 20
+
+
+class RssSampler:
+    """ Samples the resident set size of the process in a background thread while any
+    stage is running, keeping the peak of each running stage. The maximum of `getrusage`
+    is the peak of the whole process, so it does not change after the first large stage. """
+
+    def __init__(self, interval: float):
+        """
+        :param interval: seconds between samples.
+        """
+        self.interval = interval
+        self._peaks: Dict[int, float] = {}
+        self._ids = itertools.count()
+        self._running = threading.Condition()
+        self._thread = None
+
+    def start_stage(self) -> int | None:
+        """ Start sampling a stage.
+
+        :return: id of the stage, or None if the RSS is not available.
+        """
+        rss = _rss_mb()
+        if rss is None:
+            return None
+
+        with self._running:
+            stage_id = next(self._ids)
+            self._peaks[stage_id] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+                self._thread.start()
+            self._running.notify()
+        return stage_id
+
+    def end_stage(self, stage_id: int | None) -> float | None:
+        """ Stop sampling a stage.
+
+        :param stage_id: id returned by `start_stage`.
+        :return: peak RSS in MB while the stage was running.
+        """
+        if stage_id is None:
+            return None
+
+        rss = _rss_mb()
+        with self._running:
+            peak = self._peaks.pop(stage_id)
+        return max(peak, rss)
+
+    def _sample(self) -> None:
+        while True:
+            with self._running:
+                self._running.wait_for(lambda: self._peaks)
+            rss = _rss_mb()
+            with self._running:
+                for stage_id, peak in self._peaks.items():
+                    self._peaks[stage_id] = max(peak, rss)
+            time.sleep(self.interval)
+
+
+def _count_rows(value) -> int | None:
+    # DataFrames, Series and arrays, checked by their shape so pandas is not imported here
+    shape = getattr(value, 'shape', None)
+    if isinstance(shape, tuple) and shape:
+        return shape[0]
+    return None
+
+
+class MetricsRecorder:
+    """ Collects the metrics of the instrumented stages of a run and writes them as a JSON
+    report and a Chrome trace, which can be opened in `chrome://tracing` or Perfetto. """
+
+    def __init__(self):
+        self.stages: List[dict] = []
+        self.run_start = time.perf_counter()
+        self.run_name = datetime.now().strftime('%Y%m%dT%H%M%S')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiler = None
+        self.rss_sampler = RssSampler(settings.logging.metrics.rss_interval)
+
+    @property
+    def depth(self) -> int:
+        return getattr(self._local, 'depth', 0)
+
+    @depth.setter
+    def depth(self, value: int) -> None:
+        self._local.depth = value
+
+    def record(self, stage: dict) -> None:
+        with self._lock:
+            self.stages.append(stage)
+
+    def start_profiler(self, profiler: str, folder: Path) -> None:
+        """ Start the sampling profiler of the `logging.metrics.sampling_profiler` setting.
+
+        :param profiler: `pyinstrument`, in process, or `py-spy`, as a subprocess attached to this one.
+        :param folder: folder where the profile is written.
+        """
+        interval = settings.logging.metrics.sampling_interval
+        if profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning('pyinstrument is not installed, the run is not profiled.')
+                return
+            self._profiler = Profiler(interval=interval)
+            self._profiler.start()
+        elif profiler == 'py-spy':
+            os.makedirs(folder, exist_ok=True)
+            profile_path = folder / f'profile_{self.run_name}.speedscope.json'
+            try:
+                self._profiler = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()),
+                                                   '--rate', str(int(1 / interval)), '--format', 'speedscope',
+                                                   '--output', str(profile_path)])
+            except FileNotFoundError:
+                logger.warning('py-spy is not installed, the run is not profiled.')
+        else:
+            raise ValueError(f'Sampling profiler `{profiler}` not supported. Valid values are: pyinstrument, py-spy.')
+
+    def _stop_profiler(self, folder: Path) -> None:
+        if self._profiler is None:
+            return
+        if isinstance(self._profiler, subprocess.Popen):
+            # py-spy writes the profile when it is interrupted
+            self._profiler.send_signal(signal.SIGINT)
+            self._profiler.wait()
+        else:
+            self._profiler.stop()
+            profile_path = folder / f'profile_{self.run_name}.html'
+            profile_path.write_text(self._profiler.output_html())
+        self._profiler = None
+
+    def chrome_trace(self) -> dict:
+        """ Stages as complete events of the Chrome trace event format, in microseconds. """
+        events = [{'name': stage['stage'],
+                   'cat': stage['category'],
+                   'ph': 'X',
+                   'ts': stage['start_s'] * 10 ** 6,
+                   'dur': stage['wall_s'] * 10 ** 6,
+                   'pid': stage['pid'],
+                   'tid': stage['thread'],
+                   'args': {key: value for key, value in stage.items()
+                            if key not in ('stage', 'category', 'start_s', 'wall_s', 'pid', 'thread')}}
+                  for stage in self.stages]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_report(self, folder: str | Path = None) -> Path | None:
+        """ Write the JSON report and the Chrome trace of the run.
+
+        :param folder: folder of the reports. By default, the `logging.metrics.folder` setting.
+        :return: path to the JSON report, or None if nothing was recorded.
+        """
+        folder = Path(folder or settings.logging.metrics.folder)
+        os.makedirs(folder, exist_ok=True)
+        self._stop_profiler(folder)
+        if not self.stages:
+            return None
+
+        report_path = folder / f'metrics_{self.run_name}.json'
+        with open(report_path, 'w') as report_file:
+            json.dump({'run': self.run_name,
+                       'wall_s': time.perf_counter() - self.run_start,
+                       'process_peak_rss_mb': _peak_rss_mb(),
+                       'stages': self.stages}, report_file, indent=2)
+        with open(folder / f'trace_{self.run_name}.json', 'w') as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
+
+        logger.info('Metrics of {} stages saved in {}.', len(self.stages), report_path)
+        return report_path
+
+
+_recorder: MetricsRecorder | None = None
+_recorder_lock = threading.Lock()
+
+
+def get_metrics_recorder() -> MetricsRecorder:
+    """ Recorder of the current process. It is created with the first instrumented call,
+    starting the sampling profiler if configured, and writes the report when the process exits.
+
+    :return: the recorder.
+    """
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = MetricsRecorder()
+            if settings.logging.metrics.sampling_profiler:
+                _recorder.start_profiler(settings.logging.metrics.sampling_profiler,
+                                         Path(settings.logging.metrics.folder))
+            atexit.register(_recorder.write_report)
+    return _recorder
+
+
+def instrument(category: str = 'stage',
+               name: str = None) -> Callable:
+    """ Decorator that records the wall time, CPU time, peak RSS, rows in and out and
+    bytes read and written of each call to a function, when `logging.metrics.enabled` is set.
+    The peak RSS is sampled every `logging.metrics.rss_interval` seconds while the call runs.
+
+    The rows in are the rows of the DataFrames, Series and arrays received as arguments and
+    the rows out, the ones of the returned value. Nested stages are recorded too, so the
+    values of a stage include the ones of the stages it calls.
+
+    :param category: category of the stage in the report, e.g. `process`, `io` or `ree`.
+    :param name: name of the stage. By default, the module and name of the function.
+    :return: the decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        stage_name = name or f'{function.__module__.rsplit(".", 1)[-1]}.{function.__qualname__}'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not settings.logging.metrics.enabled:
+                return function(*args, **kwargs)
+
+            recorder = get_metrics_recorder()
+            rows_in = [rows for rows in map(_count_rows, [*args, *kwargs.values()]) if rows is not None]
+            io_start = _io_counters()
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            rss_stage = recorder.rss_sampler.start_stage()
+            recorder.depth += 1
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                recorder.depth -= 1
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+                io_end = _io_counters()
+                peak_rss = recorder.rss_sampler.end_stage(rss_stage)
+
+            stage = {'stage': stage_name,
+                     'category': category,
+                     'start_s': wall_start - recorder.run_start,
+                     'wall_s': wall,
+                     'cpu_s': cpu,
+                     'peak_rss_mb': peak_rss,
+                     'rows_in': sum(rows_in) if rows_in else None,
+                     'rows_out': _count_rows(result),
+                     'depth': recorder.depth,
+                     'pid': os.getpid(),
+                     'thread': threading.get_ident()}
+            stage.update({key: io_end[key] - io_start[key] for key in io_end})
+            recorder.record(stage)
+            logger.debug('Stage {} took {:.3f} s ({:.3f} s of CPU).', stage_name, wall, cpu)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -1,23 +1,43 @@
+from __future__ import annotations
+
 import os
 from pathlib import Path
 
-import geopandas as gpd
 import pandas as pd
 from loguru import logger
 
 from pv_stats.config.config import settings
+from pv_stats.utils.arrow_cache import is_processed_output, read_with_arrow_cache
+from pv_stats.utils.geometry import add_equal_area, get_resolution_tolerance, simplify_coverage
+from pv_stats.utils.instrumentation import instrument
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+pa = lazy_import('pyarrow')
+pc = lazy_import('pyarrow.compute')
+csv = lazy_import('pyarrow.csv')
 
 
+@instrument('io')
 def read_geo_dataframe(path_to_df: str | Path,
                        layer: str = None) -> gpd.GeoDataFrame:
     """
-    Read a GeoDataFrame from a specified path.
+    Read a GeoDataFrame from a specified path. The processed outputs are read through
+    their Arrow cache.
 
     :param path_to_df: The path to the GeoDataFrame.
     :param layer: name of the layer to read.
     :return: gpd.GeoDataFrame
     """
     path_to_df = Path(path_to_df)
+    if settings.arrow_cache.enabled and is_processed_output(path_to_df):
+        return read_with_arrow_cache(path_to_df, lambda: _read_geo_dataframe(path_to_df, layer), layer)
+
+    return _read_geo_dataframe(path_to_df, layer)
+
+
+def _read_geo_dataframe(path_to_df: Path,
+                        layer: str = None) -> gpd.GeoDataFrame:
     if path_to_df.suffix == '.parquet':
         df = gpd.read_parquet(path_to_df)
     elif path_to_df.suffix == '.gpkg':
@@ -30,18 +50,54 @@ def read_geo_dataframe(path_to_df: str | Path,
     return df
 
 
+@instrument('io')
+def read_projected_geo_dataframe(path_to_df: str | Path,
+                                 layer: str = None,
+                                 area_column: str = 'superficie_m2') -> gpd.GeoDataFrame:
+    """
+    Read a GeoDataFrame reprojected to the `geodata.equal_area_crs` CRS, with the area in
+    m2 of its geometries. The reprojected GeoDataFrame is kept in the Arrow cache, so the
+    source is only reprojected again when it changes.
+
+    :param path_to_df: The path to the GeoDataFrame.
+    :param layer: name of the layer to read.
+    :param area_column: column where the areas are written.
+    :return: gpd.GeoDataFrame
+    """
+    path_to_df = Path(path_to_df)
+
+    def read_and_project() -> gpd.GeoDataFrame:
+        return add_equal_area(_read_geo_dataframe(path_to_df, layer), area_column)
+
+    if settings.arrow_cache.enabled:
+        variant = f'{layer or ""}:{settings.geodata.equal_area_crs}:{area_column}'
+        return read_with_arrow_cache(path_to_df, read_and_project, variant)
+
+    return read_and_project()
+
+
+@instrument('io')
 def save_geo_dataframe(name: str,
                        geo_df: gpd.GeoDataFrame,
-                       saving_folder: str = settings.processed_data_folder) -> None:
+                       saving_folder: str = None,
+                       resolution: str = None) -> None:
     """
     Save the given GeoDataFrame to a file with the specified name and format.
 
     :param name: str: The name of the file to save.
     :param geo_df: gpd.GeoDataFrame: The GeoDataFrame to save.
-    :param saving_folder: path to the folder where to save the GeoDataFrame.
+    :param saving_folder: path to the folder where to save the GeoDataFrame. By default, the
+      `processed_data_folder` setting.
+    :param resolution: optional resolution level to simplify the polygons before saving.
+      The level is appended to the name of the file.
     :return: None
     """
+    saving_folder = saving_folder or settings.processed_data_folder
     os.makedirs(saving_folder, exist_ok=True)
+    if resolution:
+        geo_df = simplify_coverage(geo_df, get_resolution_tolerance(resolution))
+        name = f'{name}_{resolution}'
+
     saving_format = settings.geodata.saving_format
     if saving_format == 'parquet':
         geo_df.to_parquet(f'{saving_folder}/{name}.{saving_format}')
@@ -49,15 +105,47 @@ def save_geo_dataframe(name: str,
         geo_df.to_file(f'{saving_folder}/{name}.{saving_format}')
 
 
+def read_geo_dataframe_level(name: str,
+                             resolution: str = None,
+                             saving_folder: str = None) -> gpd.GeoDataFrame:
+    """
+    Read a processed GeoDataFrame at the given resolution level.
+
+    :param name: name of the processed GeoDataFrame, e.g. `administrative_divisions_with_info`.
+    :param resolution: resolution level saved by `build_resolution_levels`. If not given,
+      the full resolution GeoDataFrame is read.
+    :param saving_folder: folder where the GeoDataFrame was saved. By default, the
+      `processed_data_folder` setting.
+    :return: gpd.GeoDataFrame
+    """
+    saving_folder = saving_folder or settings.processed_data_folder
+    if resolution:
+        get_resolution_tolerance(resolution)
+        name = f'{name}_{resolution}'
+
+    return read_geo_dataframe(f'{saving_folder}/{name}.{settings.geodata.saving_format}')
+
+
+@instrument('io')
 def read_dataframe(path_to_df: str | Path,
                    sheet_name: str = None) -> pd.DataFrame:
     """
-    Read a dataframe from a specified path.
+    Read a dataframe from a specified path. The processed outputs are read through their
+    Arrow cache.
 
     :param path_to_df: The path to the dataframe.
     :return: pd.DataFrame
     """
     path_to_df = Path(path_to_df)
+    if (settings.arrow_cache.enabled and is_processed_output(path_to_df)
+            and path_to_df.suffix in ('.parquet', '.csv', '.json', '.xlsx')):
+        return read_with_arrow_cache(path_to_df, lambda: _read_dataframe(path_to_df, sheet_name), sheet_name)
+
+    return _read_dataframe(path_to_df, sheet_name)
+
+
+def _read_dataframe(path_to_df: Path,
+                    sheet_name: str = None) -> pd.DataFrame:
     if path_to_df.suffix == '.parquet':
         df = pd.read_parquet(path_to_df)
     elif path_to_df.suffix == '.csv':
@@ -75,17 +163,74 @@ def read_dataframe(path_to_df: str | Path,
     return df
 
 
+@instrument('io')
+def read_csv_with_schema(path_to_csv: str | Path,
+                         schema: dict) -> pd.DataFrame:
+    """
+    Read a CSV file with the arrow engine, applying the declared schema while parsing.
+
+    The numeric columns with thousands separator are read as text and converted with
+    arrow compute functions, so no python code runs per cell. Values that are not valid
+    numbers become nulls, and the text columns are stripped.
+
+    :param path_to_csv: path to the CSV file.
+    :param schema: schema of the file, see `pv_stats.constants.csv_schemas`.
+    :return: pd.DataFrame
+    """
+    read_options = csv.ReadOptions(encoding=schema['encoding'])
+    parse_options = csv.ParseOptions(delimiter=schema['delimiter'])
+
+    # The header is needed to apply the default type to the columns not declared
+    with csv.open_csv(path_to_csv, read_options=read_options, parse_options=parse_options) as reader:
+        column_names = reader.schema.names
+
+    column_types = {name: pa.type_for_alias(schema['column_types'].get(name, schema['default_type'] or 'string'))
+                    for name in column_names
+                    if name in schema['column_types'] or schema['default_type']}
+    thousands = schema['thousands']
+    # Numeric columns with thousands separator are converted after parsing
+    numeric_columns = {name: column_type for name, column_type in column_types.items()
+                       if thousands and (pa.types.is_integer(column_type) or pa.types.is_floating(column_type))}
+    parsing_types = {name: pa.string() if name in numeric_columns else column_type
+                     for name, column_type in column_types.items()}
+
+    convert_options = csv.ConvertOptions(column_types=parsing_types,
+                                         decimal_point=schema['decimal_point'],
+                                         strings_can_be_null=True)
+    table = csv.read_csv(path_to_csv,
+                         read_options=read_options,
+                         parse_options=parse_options,
+                         convert_options=convert_options)
+
+    for name, column_type in numeric_columns.items():
+        column = pc.utf8_trim_whitespace(table[name])
+        column = pc.replace_substring(column, pattern=thousands, replacement='')
+        column = pc.replace_substring(column, pattern=schema['decimal_point'], replacement='.')
+        number_pattern = r'^-?\d+$' if pa.types.is_integer(column_type) else r'^-?\d*\.?\d+([eE][-+]?\d+)?$'
+        column = pc.if_else(pc.match_substring_regex(column, number_pattern), column, None)
+        table = table.set_column(table.schema.get_field_index(name), name, pc.cast(column, column_type))
+
+    for index, field in enumerate(table.schema):
+        if pa.types.is_string(field.type):
+            table = table.set_column(index, field.name, pc.utf8_trim_whitespace(table[field.name]))
+
+    return table.to_pandas()
+
+
+@instrument('io')
 def save_dataframe(name: str,
                    df: pd.DataFrame,
-                   saving_folder: str = settings.processed_data_folder) -> None:
+                   saving_folder: str = None) -> None:
     """
     Saves the dataframe to a specified folder in the desired format.
 
     :param name: str: The name of the dataframe.
     :param df: pd.DataFrame: The dataframe to be saved.
-    :param saving_folder: path to the folder where to save the dataframe.
+    :param saving_folder: path to the folder where to save the dataframe. By default, the
+      `processed_data_folder` setting.
     :return: None
     """
+    saving_folder = saving_folder or settings.processed_data_folder
     os.makedirs(saving_folder, exist_ok=True)
     saving_format = settings.data.saving_format
     if saving_format == 'parquet':
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+
+# Value of the cells without land use
+NODATA = 0
+# Number of cells rasterized at once
+BLOCK_CELLS = 2 ** 22
+
+
+def _cell_centers(min_x: float, max_y: float, resolution: float,
+                  rows: slice, cols: slice) -> Tuple[np.ndarray, np.ndarray]:
+    """ Coordinates of the centers of a window of cells, flattened in row order. """
+    xs = min_x + (np.arange(cols.start, cols.stop) + 0.5) * resolution
+    ys = max_y - (np.arange(rows.start, rows.stop) + 0.5) * resolution
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    return grid_x.ravel(), grid_y.ravel()
+
+
+def burn_geometries(geometries: np.ndarray,
+                    values: np.ndarray,
+                    grid: np.ndarray,
+                    min_x: float,
+                    max_y: float,
+                    resolution: float) -> np.ndarray:
+    """ Burn the value of each polygon in the cells whose center it contains.
+
+    The grid is processed by blocks of rows, querying a STRtree of the polygons with
+    the cell centers, so the memory does not depend on the size of the grid.
+
+    :param geometries: polygons to burn, in the CRS of the grid.
+    :param values: value of each polygon.
+    :param grid: array, or memory map, where the values are written.
+    :param min_x: x coordinate of the left border of the grid.
+    :param max_y: y coordinate of the top border of the grid.
+    :param resolution: size of the cells.
+    :return: the grid.
+    """
+    tree = shapely.STRtree(geometries)
+    n_rows, n_cols = grid.shape
+    rows_per_block = max(BLOCK_CELLS // n_cols, 1)
+    for row_start in range(0, n_rows, rows_per_block):
+        rows = slice(row_start, min(row_start + rows_per_block, n_rows))
+        xs, ys = _cell_centers(min_x, max_y, resolution, rows, slice(0, n_cols))
+        cell_idx, geometry_idx = tree.query(shapely.points(xs, ys), predicate='within')
+        block = grid[rows].reshape(-1)
+        block[cell_idx] = values[geometry_idx]
+        grid[rows] = block.reshape(-1, n_cols)
+
+    return grid
+
+
+class LandUseRaster:
+    """ Land use classes burnt in a memory mapped integer grid, to compute class areas
+    with histograms instead of polygon overlays. """
+
+    def __init__(self, raster_path: str | Path):
+        raster_path = Path(raster_path)
+        self.raster_path = raster_path
+        with open(raster_path.with_suffix('.json')) as metadata_file:
+            self.metadata = json.load(metadata_file)
+
+        self.min_x, self.min_y, self.max_x, self.max_y = self.metadata['bounds']
+        self.resolution = self.metadata['resolution']
+        self.crs = self.metadata['crs']
+        self.grid = np.memmap(raster_path, dtype=self.metadata['dtype'], mode='r',
+                              shape=tuple(self.metadata['shape']))
+
+    @property
+    def cell_area(self) -> float:
+        return self.resolution ** 2
+
+    def _iter_blocks(self):
+        """ Iterate the grid by blocks of rows, so it is never fully loaded in memory. """
+        n_rows, n_cols = self.grid.shape
+        rows_per_block = max(BLOCK_CELLS // n_cols, 1)
+        for row_start in range(0, n_rows, rows_per_block):
+            yield slice(row_start, min(row_start + rows_per_block, n_rows))
+
+    def _zones_fingerprint(self, geometries: np.ndarray) -> str:
+        """ Key of the zones burnt in a grid: their geometries and the grid they are burnt in. """
+        signature = hashlib.sha1(json.dumps(self.metadata, sort_keys=True).encode('utf-8'))
+        for wkb in shapely.to_wkb(geometries):
+            signature.update(wkb)
+        return signature.hexdigest()[:16]
+
+    def zone_grid(self, zones: gpd.GeoDataFrame) -> np.ndarray:
+        """ Zones burnt in a grid aligned with the land use one, with the position of the zone
+        plus one in each cell and `NODATA` outside them. The grid is cached next to the raster,
+        keyed by the geometries of the zones, so it is only burnt once for the same zones.
+
+        :param zones: GeoDataFrame with the polygons of the zones.
+        :return: memory mapped grid with the zone of each cell.
+        """
+        geometries = np.asarray(zones.to_crs(self.crs).geometry.values)
+        dtype = np.uint16 if len(geometries) < np.iinfo(np.uint16).max else np.uint32
+        zone_path = self.raster_path.with_name(f'{self.raster_path.stem}.zones_{self._zones_fingerprint(geometries)}'
+                                               f'{self.raster_path.suffix}')
+        if not zone_path.exists():
+            # Written aside and renamed, so an interrupted burn is never reused
+            temporary_path = zone_path.with_suffix('.tmp')
+            grid = np.memmap(temporary_path, dtype=dtype, mode='w+', shape=self.grid.shape)
+            grid[:] = NODATA
+            burn_geometries(geometries, np.arange(1, len(geometries) + 1, dtype=dtype), grid, self.min_x, self.max_y,
+                            self.resolution)
+            grid.flush()
+            del grid
+            os.replace(temporary_path, zone_path)
+            logger.debug('{} zones burnt in {}.', len(geometries), zone_path)
+
+        return np.memmap(zone_path, dtype=dtype, mode='r', shape=self.grid.shape)
+
+    def zonal_areas(self,
+                    zones: gpd.GeoDataFrame,
+                    zone_column: str) -> pd.DataFrame:
+        """ Area in m2 of each land use class per zone, e.g. per municipality.
+
+        The zones are burnt in a grid aligned with the land use one, once for the same zones,
+        so each query is a histogram of the pairs of zone and class of the cells.
+
+        :param zones: GeoDataFrame with the polygons of the zones.
+        :param zone_column: column with the name or key of the zones.
+        :return: DataFrame with the zones as rows and the land use classes as columns.
+        """
+        zone_grid = self.zone_grid(zones)
+        n_classes = self.metadata['max_value'] + 1
+
+        # The first row of the histogram are the cells outside the zones
+        counts = np.zeros((len(zones) + 1) * n_classes, dtype=np.int64)
+        for rows in self._iter_blocks():
+            zone_codes = np.asarray(zone_grid[rows]).ravel().astype(np.int64)
+            pairs = zone_codes * n_classes + np.asarray(self.grid[rows]).ravel()
+            counts += np.bincount(pairs, minlength=len(counts))
+
+        areas = pd.DataFrame(counts.reshape(len(zones) + 1, n_classes)[1:] * self.cell_area,
+                             index=zones[zone_column].to_numpy())
+        # Keep only the land use classes present in the zones
+        areas = areas.loc[:, areas.sum() > 0]
+        return areas.drop(columns=NODATA, errors='ignore')
+
+    def class_areas(self, geometry: shapely.Geometry = None, crs: str = None) -> pd.Series:
+        """ Area in m2 of each land use class inside a perimeter or in the whole grid.
+
+        :param geometry: optional polygon of the perimeter.
+        :param crs: CRS of the geometry. By default, the one of the raster.
+        :return: series with the area per land use class.
+        """
+        n_classes = self.metadata['max_value'] + 1
+        if geometry is None:
+            counts = np.zeros(n_classes, dtype=np.int64)
+            for rows in self._iter_blocks():
+                counts += np.bincount(np.asarray(self.grid[rows]).ravel(), minlength=n_classes)
+        else:
+            if crs is not None:
+                geometry = gpd.GeoSeries([geometry], crs=crs).to_crs(self.crs).iloc[0]
+            # Only the window of the bounds of the perimeter is read
+            min_x, min_y, max_x, max_y = geometry.bounds
+            n_rows, n_cols = self.grid.shape
+            rows = slice(int(np.clip((self.max_y - max_y) // self.resolution, 0, n_rows)),
+                         int(np.clip(np.ceil((self.max_y - min_y) / self.resolution), 0, n_rows)))
+            cols = slice(int(np.clip((min_x - self.min_x) // self.resolution, 0, n_cols)),
+                         int(np.clip(np.ceil((max_x - self.min_x) / self.resolution), 0, n_cols)))
+            xs, ys = _cell_centers(self.min_x, self.max_y, self.resolution, rows, cols)
+            inside = shapely.contains_xy(geometry, xs, ys)
+            classes = np.asarray(self.grid[rows, cols]).ravel()[inside]
+            counts = np.bincount(classes, minlength=n_classes)
+
+        areas = pd.Series(counts * self.cell_area, name='superficie_m2')
+        areas = areas[areas > 0]
+        return areas.drop(NODATA, errors='ignore')
+
+
+def rasterize_land_use(land_use_df: gpd.GeoDataFrame,
+                       raster_path: str | Path = None,
+                       resolution: float = None,
+                       column: str = 'ID_USO_MAX') -> LandUseRaster:
+    """ Burn the land use layer in a memory mapped grid, with a JSON file next to it with
+    the bounds, resolution and CRS of the grid.
+
+    :param land_use_df: SIOSE land use GeoDataFrame.
+    :param raster_path: path to the grid file. By default, the `land_use.raster_path` setting.
+    :param resolution: size of the cells in meters. By default, the `land_use.raster_resolution` setting.
+    :param column: column with the land use class.
+    :return: the raster opened in read mode.
+    """
+    raster_path = Path(raster_path or settings.land_use.raster_path)
+    resolution = resolution or settings.land_use.raster_resolution
+    if land_use_df.crs is None or land_use_df.crs.is_geographic:
+        land_use_df = land_use_df.to_crs(settings.maps.crs)
+
+    min_x, min_y, max_x, max_y = land_use_df.total_bounds
+    shape = (int(np.ceil((max_y - min_y) / resolution)), int(np.ceil((max_x - min_x) / resolution)))
+    values = land_use_df[column].to_numpy()
+    dtype = np.uint16 if values.max() <= np.iinfo(np.uint16).max else np.uint32
+
+    os.makedirs(raster_path.parent, exist_ok=True)
+    grid = np.memmap(raster_path, dtype=dtype, mode='w+', shape=shape)
+    grid[:] = NODATA
+    burn_geometries(np.asarray(land_use_df.geometry.values), values.astype(dtype), grid, min_x, max_y, resolution)
+    grid.flush()
+    del grid
+
+    metadata: Dict = {
+        'bounds': [min_x, max_y - shape[0] * resolution, min_x + shape[1] * resolution, max_y],
+        'resolution': resolution,
+        'shape': shape,
+        'dtype': np.dtype(dtype).name,
+        'crs': land_use_df.crs.to_string(),
+        'column': column,
+        'max_value': int(values.max()),
+    }
+    with open(raster_path.with_suffix('.json'), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    logger.info('Land use rasterized in a {} grid of {} m in {}.', shape, resolution, raster_path)
+    return LandUseRaster(raster_path)
@@ -0,0 +1,27 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """ Module that is only imported when one of its attributes is used for the first time,
+    so importing the modules of the package does not load the heavy dependencies that the
+    called code does not need. """
+
+    def __getattr__(self, attribute: str):
+        # The attributes are always read from the imported module, so they can be patched in it
+        module = self.__dict__.get('_module')
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """ Import a module lazily, e.g. `gpd = lazy_import('geopandas')`.
+
+    The annotations that use the module must not be evaluated at import time, so the
+    modules that use it import `annotations` from `__future__`.
+
+    :param name: full name of the module.
+    :return: the module, loaded on first use.
+    """
+    return LazyModule(name)
@@ -0,0 +1,204 @@
+from pathlib import Path
+
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.io_utils import read_dataframe, save_dataframe
+
+# Types of alias of the municipalities. The codes are stored as text in the registry.
+CODE_ALIASES = ['municipio_codigo', 'municipio_codigo_ine', 'CD_INE']
+NAME_ALIAS = 'nombre'
+
+
+def normalize_municipality_names(names: pd.Series) -> pd.Series:
+    """ Normalize the names of the municipalities, so the variants of the sources match.
+
+    The accents, case and punctuation are removed and the articles written at the end,
+    such as `Boalo, El` or `Escorial (El)`, are moved to the beginning.
+
+    :param names: series with the names.
+    :return: series with the normalized names.
+    """
+    normalized = (names.astype('string')
+                  .str.normalize('NFKD')
+                  .str.encode('ascii', errors='ignore')
+                  .str.decode('ascii')
+                  .str.lower()
+                  .str.strip())
+    normalized = normalized.str.replace(r'^(.*?)\s*(?:,\s*|\()(el|la|los|las)\)?$', r'\2 \1', regex=True)
+    normalized = normalized.str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+    return normalized
+
+
+def _code_aliases(codes: pd.Series) -> pd.Series:
+    """ Text representation of the integer codes used in the registry. """
+    return pd.to_numeric(codes, errors='coerce').astype('Int64').astype('string')
+
+
+def _drop_ambiguous_aliases(registry: pd.DataFrame) -> pd.DataFrame:
+    """ Remove the aliases shared by several municipalities, as they cannot be used as key. """
+    registry = registry.dropna().drop_duplicates()
+    ambiguous = registry.duplicated(['alias_type', 'alias'], keep=False)
+    if ambiguous.any():
+        logger.warning('Ambiguous aliases removed from the registry: {}',
+                       registry.loc[ambiguous, 'alias'].unique().tolist())
+        registry = registry[~ambiguous]
+
+    registry = registry.astype({'alias': 'string', 'municipio_id': 'int32'})
+    return registry.reset_index(drop=True)
+
+
+def build_municipality_registry(cities_info_df: pd.DataFrame) -> pd.DataFrame:
+    """ Build the registry that maps every code and name variant of a municipality to a
+    single integer key, `municipio_id`, which is the INE code of the municipality.
+
+    :param cities_info_df: cities info, with the `municipio_codigo`, `municipio_codigo_ine`
+      and `municipio_nombre` columns.
+    :return: DataFrame with the `alias_type`, `alias` and `municipio_id` columns.
+    """
+    municipio_id = cities_info_df['municipio_codigo_ine']
+    registry = pd.concat([
+        pd.DataFrame({'alias_type': 'municipio_codigo',
+                      'alias': _code_aliases(cities_info_df['municipio_codigo']),
+                      'municipio_id': municipio_id}),
+        pd.DataFrame({'alias_type': 'municipio_codigo_ine',
+                      'alias': _code_aliases(municipio_id),
+                      'municipio_id': municipio_id}),
+        pd.DataFrame({'alias_type': NAME_ALIAS,
+                      'alias': normalize_municipality_names(cities_info_df['municipio_nombre']),
+                      'municipio_id': municipio_id}),
+    ], ignore_index=True)
+
+    return _drop_ambiguous_aliases(registry)
+
+
+def add_municipality_aliases(registry: pd.DataFrame,
+                             df: pd.DataFrame,
+                             column: str,
+                             alias_type: str) -> pd.DataFrame:
+    """ Add the codes or names of a source that already has the `municipio_id` key to
+    the registry, e.g. the `CD_INE` codes and `DS_NOMBRE` names of the administrative divisions.
+
+    :param registry: registry built with `build_municipality_registry`.
+    :param df: DataFrame with the `municipio_id` column.
+    :param column: column with the codes or names to add.
+    :param alias_type: type of the values of the column, one of `CODE_ALIASES` or `nombre`.
+    :return: registry with the new aliases.
+    """
+    aliases = normalize_municipality_names(df[column]) if alias_type == NAME_ALIAS else _code_aliases(df[column])
+    new_aliases = pd.DataFrame({'alias_type': alias_type,
+                                'alias': aliases.to_numpy(),
+                                'municipio_id': df['municipio_id'].to_numpy()})
+    return _drop_ambiguous_aliases(pd.concat([registry, new_aliases], ignore_index=True))
+
+
+def _registry_path() -> Path:
+    return Path(f'{settings.processed_data_folder}/municipality_registry.{settings.data.saving_format}')
+
+
+def municipality_registry_exists() -> bool:
+    """ Whether the registry is saved in the processed data folder. """
+    return _registry_path().exists()
+
+
+def save_municipality_registry(registry: pd.DataFrame) -> None:
+    """ Save the registry in the processed data folder.
+
+    :param registry: registry built with `build_municipality_registry`.
+    """
+    save_dataframe('municipality_registry', registry)
+
+
+def update_municipality_registry(registry: pd.DataFrame) -> pd.DataFrame:
+    """ Merge the aliases of a source into the saved registry and save it, so the aliases
+    added by the other sources are kept.
+
+    :param registry: aliases to add, with the columns of the registry.
+    :return: the merged registry.
+    """
+    if municipality_registry_exists():
+        registry = pd.concat([load_municipality_registry(), registry], ignore_index=True)
+    registry = _drop_ambiguous_aliases(registry)
+    save_municipality_registry(registry)
+    return registry
+
+
+def load_municipality_registry() -> pd.DataFrame:
+    """ Load the registry from the processed data folder.
+
+    :return: DataFrame with the `alias_type`, `alias` and `municipio_id` columns.
+    """
+    registry_path = _registry_path()
+    if not registry_path.exists():
+        raise FileNotFoundError(f'Municipality registry not found in {registry_path}. It is built with the '
+                                f'cities info by `process_cities_info_df`.')
+
+    registry = read_dataframe(registry_path)
+    return registry[['alias_type', 'alias', 'municipio_id']].astype({'alias': 'string', 'municipio_id': 'int32'})
+
+
+def attach_municipality_key(df: pd.DataFrame,
+                            column: str,
+                            alias_type: str,
+                            registry: pd.DataFrame = None) -> pd.DataFrame:
+    """ Add the `municipio_id` key to a DataFrame from one of its code or name columns.
+    The rows that do not match any municipality are reported and get a null key.
+
+    :param df: DataFrame to complete.
+    :param column: column with the code or the name of the municipality.
+    :param alias_type: type of the values of the column, one of `CODE_ALIASES` or `nombre`.
+    :param registry: registry to use. By default, the saved one is loaded.
+    :return: the DataFrame with the `municipio_id` column.
+    """
+    if alias_type not in CODE_ALIASES + [NAME_ALIAS]:
+        raise ValueError(f'Alias type must be one of {", ".join(CODE_ALIASES + [NAME_ALIAS])}.')
+
+    registry = load_municipality_registry() if registry is None else registry
+    aliases = registry[registry['alias_type'] == alias_type]
+    ids_per_alias = pd.Series(aliases['municipio_id'].to_numpy(), index=aliases['alias'].to_numpy())
+
+    if alias_type == NAME_ALIAS:
+        keys = normalize_municipality_names(df[column])
+    else:
+        keys = _code_aliases(df[column])
+    df['municipio_id'] = keys.map(ids_per_alias).astype('Int32')
+
+    unmatched = df['municipio_id'].isna()
+    if unmatched.any():
+        logger.warning('{} rows without municipality for the column `{}`: {}',
+                       unmatched.sum(), column, df.loc[unmatched, column].tolist())
+
+    return df
+
+
+def merge_municipalities(left: pd.DataFrame,
+                         right: pd.DataFrame,
+                         **kwargs) -> pd.DataFrame:
+    """ Merge two DataFrames on the `municipio_id` key, reporting the rows of each side
+    that do not have a pair.
+
+    :param left: left DataFrame, with the `municipio_id` column.
+    :param right: right DataFrame, with the `municipio_id` column.
+    :param kwargs: other arguments of the merge, such as `how` or `suffixes`.
+    :return: merged DataFrame. It is a GeoDataFrame if the left side is.
+    """
+    how = kwargs.pop('how', 'inner')
+    # The null keys do not identify a municipality, so they never pair with each other
+    null_left, null_right = left['municipio_id'].isna(), right['municipio_id'].isna()
+    left_keys, right_keys = left.loc[~null_left, 'municipio_id'], right.loc[~null_right, 'municipio_id']
+    for keys, other_keys, null_keys, name in ((left_keys, right_keys, null_left, 'left'),
+                                              (right_keys, left_keys, null_right, 'right')):
+        unmatched = keys[~keys.isin(other_keys)]
+        if null_keys.any() or len(unmatched):
+            logger.warning('{} rows of the {} side without pair, {} without municipio_id and the rest with '
+                           'municipio_id: {}', null_keys.sum() + len(unmatched), name, null_keys.sum(),
+                           unmatched.tolist())
+
+    merged = [left[~null_left].merge(right[~null_right], on='municipio_id', how=how, **kwargs)]
+    # The rows without key are kept, without pair, in the sides that keep all their rows
+    if how in ('left', 'outer') and null_left.any():
+        merged.append(left[null_left].merge(right.iloc[:0], on='municipio_id', how='left', **kwargs))
+    if how in ('right', 'outer') and null_right.any():
+        merged.append(left.iloc[:0].merge(right[null_right], on='municipio_id', how='right', **kwargs))
+    return pd.concat(merged, ignore_index=True) if len(merged) > 1 else merged[0].reset_index(drop=True)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+fiona = lazy_import('fiona')
+gpd = lazy_import('geopandas')
+pq = lazy_import('pyarrow.parquet')
+
+# Column with the position of each row in the source, to restore the original order
+ROW_COLUMN = '_row'
+
+
+def _iter_vector_batches(path: Path,
+                         layer: str | None,
+                         batch_size: int) -> Iterator[gpd.GeoDataFrame]:
+    """ Stream a file readable by fiona, such as a GeoPackage, in GeoDataFrames of
+    `batch_size` features. """
+    with fiona.open(path, layer=layer) as source:
+        columns = list(source.schema['properties']) + ['geometry']
+        crs = source.crs
+        batch = []
+        for feature in source:
+            batch.append(feature)
+            if len(batch) == batch_size:
+                yield gpd.GeoDataFrame.from_features(batch, crs=crs, columns=columns)
+                batch = []
+        if batch:
+            yield gpd.GeoDataFrame.from_features(batch, crs=crs, columns=columns)
+
+
+def _iter_parquet_batches(path: Path,
+                          batch_size: int) -> Iterator[gpd.GeoDataFrame]:
+    """ Stream a GeoParquet file in GeoDataFrames of `batch_size` rows. """
+    parquet_file = pq.ParquetFile(path)
+    geo_metadata = json.loads(parquet_file.schema_arrow.metadata[b'geo'])
+    geometry_column = geo_metadata['primary_column']
+    crs = geo_metadata['columns'][geometry_column].get('crs')
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        batch_df = batch.to_pandas()
+        batch_df[geometry_column] = gpd.GeoSeries.from_wkb(batch_df[geometry_column], crs=crs)
+        yield gpd.GeoDataFrame(batch_df, geometry=geometry_column, crs=crs)
+
+
+def _cell_labels(geo_df: gpd.GeoDataFrame,
+                 bounds: Sequence[float],
+                 cells_per_axis: int) -> np.ndarray:
+    """ Cell of a regular grid over the bounds where the center of each geometry falls. """
+    min_x, min_y, max_x, max_y = bounds
+    geometry_bounds = geo_df.geometry.bounds.to_numpy()
+    centers_x = (geometry_bounds[:, 0] + geometry_bounds[:, 2]) / 2
+    centers_y = (geometry_bounds[:, 1] + geometry_bounds[:, 3]) / 2
+    cells_x = np.clip((centers_x - min_x) / max(max_x - min_x, 1e-9) * cells_per_axis, 0, cells_per_axis - 1)
+    cells_y = np.clip((centers_y - min_y) / max(max_y - min_y, 1e-9) * cells_per_axis, 0, cells_per_axis - 1)
+    # Empty geometries have no bounds, they go to the first cell
+    return np.nan_to_num(cells_y, nan=0).astype(int) * cells_per_axis + np.nan_to_num(cells_x, nan=0).astype(int)
+
+
+def _file_bounds(path: Path, layer: str | None) -> Sequence[float]:
+    if path.suffix == '.parquet':
+        geo_metadata = json.loads(pq.read_schema(path).metadata[b'geo'])
+        return geo_metadata['columns'][geo_metadata['primary_column']]['bbox']
+
+    with fiona.open(path, layer=layer) as source:
+        return source.bounds
+
+
+def partition_geo_files(paths: str | Path | Sequence[str | Path],
+                        partition_folder: str | Path = None,
+                        layer: str | Callable[[Path], str] = None,
+                        batch_size: int = None,
+                        cells_per_axis: int = None) -> List[Path]:
+    """ Split one or several geographic files in spatial partitions stored as parquet,
+    reading them in batches so they never have to fit in memory.
+
+    Each file is divided in a grid of `cells_per_axis` x `cells_per_axis` cells over its
+    bounds and every row goes to the cell of the center of its geometry. The position of
+    the row in the concatenation of the files is kept in the `_row` column.
+
+    :param paths: path or paths to the files, GeoPackage, GeoJSON, shapefile or GeoParquet.
+    :param partition_folder: folder where the partitions are written. It is emptied first.
+      By default, a new folder of this run inside the `partitioning.folder` setting, so
+      concurrent runs never share their partitions. The caller removes it, see `map_geo_files`.
+    :param layer: layer to read, or function that returns the layer of each file.
+    :param batch_size: number of rows read at once. By default, the `partitioning.batch_size` setting.
+    :param cells_per_axis: size of the grid. By default, the `partitioning.cells_per_axis` setting.
+    :return: list with the folder of each partition.
+    """
+    paths = [Path(paths)] if isinstance(paths, (str, Path)) else [Path(path) for path in paths]
+    batch_size = batch_size or settings.partitioning.batch_size
+    cells_per_axis = cells_per_axis or settings.partitioning.cells_per_axis
+    if partition_folder:
+        partition_folder = Path(partition_folder)
+        shutil.rmtree(partition_folder, ignore_errors=True)
+    else:
+        os.makedirs(settings.partitioning.folder, exist_ok=True)
+        partition_folder = Path(tempfile.mkdtemp(dir=settings.partitioning.folder))
+
+    n_rows = 0
+    n_batches = 0
+    for file_number, path in enumerate(paths):
+        file_layer = layer(path) if callable(layer) else layer
+        bounds = _file_bounds(path, file_layer)
+        if path.suffix == '.parquet':
+            batches = _iter_parquet_batches(path, batch_size)
+        else:
+            batches = _iter_vector_batches(path, file_layer, batch_size)
+
+        for batch_df in batches:
+            batch_df[ROW_COLUMN] = np.arange(n_rows, n_rows + len(batch_df))
+            n_rows += len(batch_df)
+            for cell, cell_df in batch_df.groupby(_cell_labels(batch_df, bounds, cells_per_axis)):
+                cell_folder = partition_folder / f'file_{file_number:03d}_cell_{cell:04d}'
+                os.makedirs(cell_folder, exist_ok=True)
+                cell_df.to_parquet(cell_folder / f'part_{n_batches:06d}.parquet')
+            n_batches += 1
+
+    partitions = sorted(folder for folder in partition_folder.iterdir() if folder.is_dir())
+    logger.info('{} rows of {} files split in {} partitions.', n_rows, len(paths), len(partitions))
+    return partitions
+
+
+def read_partition(partition: str | Path) -> gpd.GeoDataFrame:
+    """ Read all the parts of a partition.
+
+    :param partition: folder of the partition.
+    :return: GeoDataFrame with the rows of the partition.
+    """
+    parts = [gpd.read_parquet(part) for part in sorted(Path(partition).glob('*.parquet'))]
+    return pd.concat(parts, ignore_index=True)
+
+
+def _process_partition(partition: Path,
+                       function: Callable[[gpd.GeoDataFrame], pd.DataFrame]) -> pd.DataFrame:
+    return function(read_partition(partition))
+
+
+def map_partitions(partitions: Sequence[Path],
+                   function: Callable[[gpd.GeoDataFrame], pd.DataFrame],
+                   workers: int = None) -> pd.DataFrame:
+    """ Apply a function to every partition in a pool of processes and gather the results
+    in the original order of the rows, with their position in the source as index.
+
+    The function receives the rows of a partition and must keep the `_row` column,
+    e.g. filters or operations per row. It must be defined at module level, so it can be
+    sent to the workers.
+
+    :param partitions: folders of the partitions, from `partition_geo_files`.
+    :param function: function to apply to each partition.
+    :param workers: number of processes. By default, the `partitioning.workers` setting.
+    :return: concatenation of the results. It is a GeoDataFrame if the results are.
+    """
+    workers = min(workers or settings.partitioning.workers or os.cpu_count(), max(len(partitions), 1))
+    logger.info('Processing {} partitions with {} workers.', len(partitions), workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_process_partition, partitions, [function] * len(partitions)))
+
+    result = pd.concat(results)
+    result = result.sort_values(ROW_COLUMN, kind='stable').set_index(ROW_COLUMN)
+    result.index.name = None
+    return result
+
+
+def map_geo_files(paths: str | Path | Sequence[str | Path],
+                  function: Callable[[gpd.GeoDataFrame], pd.DataFrame],
+                  layer: str | Callable[[Path], str] = None,
+                  workers: int = None) -> pd.DataFrame:
+    """ Split the files in spatial partitions and apply a function to every partition, see
+    `partition_geo_files` and `map_partitions`. The partitions are written in a folder of
+    this run, which is removed at the end even if the processing fails.
+
+    :param paths: path or paths to the files.
+    :param function: function to apply to each partition.
+    :param layer: layer to read, or function that returns the layer of each file.
+    :param workers: number of processes. By default, the `partitioning.workers` setting.
+    :return: concatenation of the results, in the original order of the rows.
+    """
+    os.makedirs(settings.partitioning.folder, exist_ok=True)
+    partition_folder = Path(tempfile.mkdtemp(dir=settings.partitioning.folder))
+    try:
+        return map_partitions(partition_geo_files(paths, partition_folder, layer), function, workers)
+    finally:
+        shutil.rmtree(partition_folder, ignore_errors=True)
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import json
+import os
+import pickle
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.io_utils import read_geo_dataframe_level
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+pyproj = lazy_import('pyproj')
+
+
+@lru_cache(maxsize=16)
+def _get_transformer(source_crs: str, target_crs: str) -> pyproj.Transformer:
+    """ Transformers are expensive to create, so they are reused between queries. """
+    return pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def _transform_coords(transformer: pyproj.Transformer, coords: np.ndarray) -> np.ndarray:
+    """ Transform the coordinates of all the geometries at once. pyproj takes the arrays
+    of a single coordinate for scalars, which NumPy deprecates, so it is transformed as a pair. """
+    if len(coords) == 1:
+        return _transform_coords(transformer, np.repeat(coords, 2, axis=0))[:1]
+    return np.c_[transformer.transform(coords[:, 0], coords[:, 1])]
+
+
+class SpatialIndex:
+    """ STRtree over the polygons of a layer with the attributes to return per polygon. """
+
+    def __init__(self,
+                 geometries: np.ndarray,
+                 attributes: pd.DataFrame,
+                 crs: str):
+        self.geometries = geometries
+        self.attributes = attributes.reset_index(drop=True)
+        self.crs = crs
+        self.tree = shapely.STRtree(geometries)
+        # Prepared geometries speed up the repeated predicates
+        shapely.prepare(self.geometries)
+
+    @classmethod
+    def from_geo_dataframe(cls,
+                           geo_df: gpd.GeoDataFrame,
+                           columns: Sequence[str]) -> 'SpatialIndex':
+        """ Build the index of a layer.
+
+        :param geo_df: GeoDataFrame with the polygons.
+        :param columns: columns returned by the queries.
+        :return: the index.
+        """
+        geo_df = geo_df[~geo_df.geometry.is_empty & geo_df.geometry.notna()]
+        return cls(np.asarray(geo_df.geometry.values), geo_df[list(columns)], geo_df.crs.to_string())
+
+    def save(self, index_path: str | Path) -> None:
+        """ Save the geometries, as WKB, and the attributes of the index.
+
+        :param index_path: path to the file.
+        """
+        os.makedirs(Path(index_path).parent, exist_ok=True)
+        with open(index_path, 'wb') as index_file:
+            pickle.dump({'geometries': shapely.to_wkb(self.geometries),
+                         'attributes': self.attributes,
+                         'crs': self.crs},
+                        index_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, index_path: str | Path) -> 'SpatialIndex':
+        """ Load an index saved with `save`. The tree is bulk loaded again, which is fast.
+
+        :param index_path: path to the file.
+        :return: the index.
+        """
+        with open(index_path, 'rb') as index_file:
+            content = pickle.load(index_file)
+
+        return cls(shapely.from_wkb(content['geometries']), content['attributes'], content['crs'])
+
+    def _to_index_crs(self, geometries: np.ndarray, crs: str) -> np.ndarray:
+        if crs is None or pyproj.CRS.from_user_input(crs) == pyproj.CRS.from_user_input(self.crs):
+            return geometries
+        transformer = _get_transformer(crs, self.crs)
+        return shapely.transform(geometries, lambda coords: _transform_coords(transformer, coords))
+
+    def _attributes_per_query(self, n_queries: int, query_idx: np.ndarray, tree_idx: np.ndarray) -> pd.DataFrame:
+        """ Attributes of the matched polygon of each query, null if there is no match. The
+        integer columns, such as `municipio_id`, become nullable so the misses do not turn
+        them into floats. """
+        matched = self.attributes.iloc[tree_idx].set_axis(query_idx)
+        nullable = {column: dtype.name.replace('uint', 'UInt').replace('int', 'Int')
+                    for column, dtype in matched.dtypes.items()
+                    if isinstance(dtype, np.dtype) and dtype.kind in 'iu'}
+        return matched.astype(nullable).reindex(np.arange(n_queries))
+
+    def query_points(self,
+                     x: Sequence[float],
+                     y: Sequence[float],
+                     crs: str = None) -> pd.DataFrame:
+        """ Find the polygon that contains each point.
+
+        :param x: x coordinates, or longitudes.
+        :param y: y coordinates, or latitudes.
+        :param crs: CRS of the coordinates. By default, the one of the index.
+        :return: DataFrame with the attributes of the polygon of each point.
+        """
+        points = self._to_index_crs(shapely.points(np.asarray(x, dtype=float), np.asarray(y, dtype=float)), crs)
+        query_idx, tree_idx = self.tree.query(points, predicate='intersects')
+        # Points in a shared border intersect two polygons, keep the first one
+        query_idx, first = np.unique(query_idx, return_index=True)
+        return self._attributes_per_query(len(points), query_idx, tree_idx[first])
+
+    def query_geometries(self,
+                         geometries: Sequence[shapely.Geometry],
+                         crs: str = None) -> pd.DataFrame:
+        """ Find the polygon with the largest overlap with each geometry.
+
+        :param geometries: polygons to locate, such as PV installations.
+        :param crs: CRS of the geometries. By default, the one of the index.
+        :return: DataFrame with the attributes of the polygon of each geometry.
+        """
+        geometries = self._to_index_crs(np.asarray(geometries, dtype=object), crs)
+        query_idx, tree_idx = self.tree.query(geometries, predicate='intersects')
+        areas = shapely.area(shapely.intersection(geometries[query_idx], self.geometries[tree_idx]))
+
+        # Sort by query and decreasing area, so the first pair of each query is the largest
+        order = np.lexsort((-areas, query_idx))
+        query_idx, tree_idx = query_idx[order], tree_idx[order]
+        query_idx, first = np.unique(query_idx, return_index=True)
+        return self._attributes_per_query(len(geometries), query_idx, tree_idx[first])
+
+    def overlay_geometries(self,
+                           geometries: Sequence[shapely.Geometry],
+                           crs: str = None) -> pd.DataFrame:
+        """ Split each geometry at the boundaries of the polygons of the index.
+
+        :param geometries: polygons to split, such as PV installations.
+        :param crs: CRS of the geometries. By default, the one of the index.
+        :return: DataFrame with a row per piece, with the position of its geometry in
+          `query_idx`, the attributes of the polygon that contains it and the piece, in
+          the CRS of the index, in `geometry`. The parts outside every polygon are dropped.
+        """
+        geometries = self._to_index_crs(np.asarray(geometries, dtype=object), crs)
+        query_idx, tree_idx = self.tree.query(geometries, predicate='intersects')
+
+        # Most geometries are inside a single polygon, only the rest are cut
+        pieces = geometries[query_idx]
+        crossing = ~shapely.contains(self.geometries[tree_idx], pieces)
+        pieces[crossing] = shapely.intersection(pieces[crossing], self.geometries[tree_idx[crossing]])
+        # The geometries that only touch a polygon share a line with it, without area
+        keep = shapely.area(pieces) > 0
+
+        overlay = self.attributes.iloc[tree_idx[keep]].reset_index(drop=True)
+        overlay.insert(0, 'query_idx', query_idx[keep])
+        overlay['geometry'] = pieces[keep]
+        return overlay
+
+
+class SpatialLookup:
+    """ Locate coordinates or polygons in the municipalities and the SIOSE land use layers. """
+
+    def __init__(self, municipalities: SpatialIndex, land_use: SpatialIndex):
+        self.municipalities = municipalities
+        self.land_use = land_use
+
+    @classmethod
+    def build(cls, index_folder: str | Path = None) -> 'SpatialLookup':
+        """ Build the indexes from the processed layers and save them.
+
+        :param index_folder: folder where the indexes are saved. By default, the
+          `spatial_lookup.index_folder` setting.
+        :return: the lookup.
+        """
+        index_folder = Path(index_folder or settings.spatial_lookup.index_folder)
+        municipalities = SpatialIndex.from_geo_dataframe(read_geo_dataframe_level('administrative_divisions_with_info'),
+                                                         settings.spatial_lookup.municipality_columns)
+        land_use = SpatialIndex.from_geo_dataframe(read_geo_dataframe_level('land_use'),
+                                                   settings.spatial_lookup.land_use_columns)
+        municipalities.save(index_folder / 'municipalities.idx')
+        land_use.save(index_folder / 'land_use.idx')
+        logger.info('Spatial indexes saved in {}.', index_folder)
+        return cls(municipalities, land_use)
+
+    @classmethod
+    def load(cls, index_folder: str | Path = None) -> 'SpatialLookup':
+        """ Load the saved indexes, building them if they do not exist.
+
+        :param index_folder: folder with the indexes. By default, the
+          `spatial_lookup.index_folder` setting.
+        :return: the lookup.
+        """
+        index_folder = Path(index_folder or settings.spatial_lookup.index_folder)
+        if not (index_folder / 'municipalities.idx').exists() or not (index_folder / 'land_use.idx').exists():
+            return cls.build(index_folder)
+
+        return cls(SpatialIndex.load(index_folder / 'municipalities.idx'),
+                   SpatialIndex.load(index_folder / 'land_use.idx'))
+
+    def lookup_points(self,
+                      x: Sequence[float],
+                      y: Sequence[float],
+                      crs: str = 'EPSG:4326') -> pd.DataFrame:
+        """ Municipality and land use of each point.
+
+        :param x: x coordinates, or longitudes.
+        :param y: y coordinates, or latitudes.
+        :param crs: CRS of the coordinates.
+        :return: DataFrame with the attributes of both layers per point.
+        """
+        return pd.concat([self.municipalities.query_points(x, y, crs),
+                          self.land_use.query_points(x, y, crs)], axis=1)
+
+    def lookup_geometries(self,
+                          geometries: Sequence[shapely.Geometry],
+                          crs: str = 'EPSG:4326') -> pd.DataFrame:
+        """ Municipality and land use with the largest overlap with each geometry.
+
+        :param geometries: geometries to locate.
+        :param crs: CRS of the geometries.
+        :return: DataFrame with the attributes of both layers per geometry.
+        """
+        return pd.concat([self.municipalities.query_geometries(geometries, crs),
+                          self.land_use.query_geometries(geometries, crs)], axis=1)
+
+
+def _records(df: pd.DataFrame) -> List[dict]:
+    """ Rows of the result with nulls as None, so they can be dumped to JSON. """
+    return json.loads(df.to_json(orient='records'))
+
+
+def serve_spatial_lookup(lookup: SpatialLookup,
+                         host: str = None,
+                         port: int = None) -> None:
+    """ Serve the lookup through a local HTTP endpoint.
+
+    `POST /points` expects `{"x": [...], "y": [...], "crs": "EPSG:4326"}` and
+    `POST /geometries` expects `{"wkt": [...], "crs": "EPSG:4326"}`. Both answer with
+    a list with the attributes of each input.
+
+    :param lookup: lookup with the indexes loaded.
+    :param host: host to listen. By default, the `spatial_lookup.host` setting.
+    :param port: port to listen. By default, the `spatial_lookup.port` setting.
+    """
+    host = host or settings.spatial_lookup.host
+    port = port or settings.spatial_lookup.port
+
+    class LookupHandler(BaseHTTPRequestHandler):
+
+        def _answer(self, status: int, content) -> None:
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                crs = request.get('crs', 'EPSG:4326')
+                if self.path == '/points':
+                    result = lookup.lookup_points(request['x'], request['y'], crs)
+                elif self.path == '/geometries':
+                    result = lookup.lookup_geometries(shapely.from_wkt(request['wkt']), crs)
+                else:
+                    self._answer(404, {'error': f'Unknown endpoint {self.path}.'})
+                    return
+            except (KeyError, ValueError, shapely.errors.GEOSException) as error:
+                self._answer(400, {'error': str(error)})
+                return
+
+            self._answer(200, _records(result))
+
+        def log_message(self, format: str, *args) -> None:
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    logger.info('Serving the spatial lookup in http://{}:{}.', host, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
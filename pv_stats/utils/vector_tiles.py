@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import gzip
+import json
+import math
+import os
+import sqlite3
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pv_stats.config.config import settings
+from pv_stats.utils.lazy_imports import lazy_import
+
+gpd = lazy_import('geopandas')
+shapely = lazy_import('shapely')
+
+# Half of the side of the Web Mercator square in meters
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+
+# Layers of each zoom level loaded once per worker process, see `_init_worker`
+_TILE_LAYERS = None
+
+
+def _varint(value: int) -> bytes:
+    """ Encode an unsigned integer as a protobuf varint. """
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _zigzag(value: int) -> int:
+    """ Map a signed integer to an unsigned one, as protobuf sint fields. """
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number: int, payload: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: Sequence[int]) -> bytes:
+    return _length_delimited(number, b''.join(_varint(value) for value in values))
+
+
+def _encode_value(value) -> bytes:
+    """ Encode an attribute as a `Tile.Value` message. """
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, (int, np.integer)):
+        return _field(6, 0) + _varint(_zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1) + struct.pack('<d', float(value))
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def _command(command_id: int, count: int) -> int:
+    return (command_id & 0x7) | (count << 3)
+
+
+def _ring_area(ring: np.ndarray) -> float:
+    """ Signed area of a ring with the surveyor's formula, positive if it is clockwise
+    in tile coordinates, where the y axis goes down. """
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1])) / 2
+
+
+def _encode_geometry(geometry: shapely.Geometry) -> Tuple[int, List[int]]:
+    """ Encode a geometry, already in integer tile coordinates, as MVT commands.
+
+    :param geometry: point, line or polygon geometry, single or multipart.
+    :return: MVT geometry type and list of commands, empty if nothing remains in the tile.
+    """
+    commands = list()
+    cursor = np.zeros(2, dtype=np.int64)
+
+    def add_sequence(coords: np.ndarray, close: bool) -> None:
+        nonlocal cursor
+        deltas = np.diff(np.vstack([cursor, coords]), axis=0)
+        commands.append(_command(1, 1))
+        commands.extend(_zigzag(int(delta)) for delta in deltas[0])
+        if len(coords) > 1:
+            commands.append(_command(2, len(coords) - 1))
+            commands.extend(_zigzag(int(delta)) for delta in deltas[1:].ravel())
+        if close:
+            commands.append(_command(7, 1))
+        cursor = coords[-1]
+
+    def tile_coords(part: shapely.Geometry) -> np.ndarray:
+        coords = np.rint(shapely.get_coordinates(part)).astype(np.int64)
+        # Rounding may produce repeated points, which are not valid
+        keep = np.r_[True, np.any(np.diff(coords, axis=0) != 0, axis=1)]
+        return coords[keep]
+
+    parts = shapely.get_parts(geometry)
+    type_id = shapely.get_type_id(geometry)
+    if type_id == 7:
+        # Clipping may mix types, keep the polygons or else the lines of the collection
+        part_types = shapely.get_type_id(parts)
+        dominant_type = 3 if np.any(part_types == 3) else 1
+        parts = parts[part_types == dominant_type]
+        type_id = dominant_type
+    if type_id in (0, 4):
+        points = np.rint(shapely.get_coordinates(parts)).astype(np.int64)
+        if len(points):
+            deltas = np.diff(np.vstack([cursor, points]), axis=0)
+            commands.append(_command(1, len(points)))
+            commands.extend(_zigzag(int(delta)) for delta in deltas.ravel())
+        return 1, commands
+    if type_id in (1, 5):
+        for part in parts:
+            coords = tile_coords(part)
+            if len(coords) >= 2:
+                add_sequence(coords, close=False)
+        return 2, commands
+
+    for polygon in parts:
+        rings = [polygon.exterior, *polygon.interiors]
+        for ring_number, ring in enumerate(rings):
+            coords = tile_coords(ring)
+            # A valid ring needs three different points plus the closing one
+            if len(coords) < 4:
+                if ring_number == 0:
+                    break
+                continue
+            area = _ring_area(coords)
+            if area == 0:
+                if ring_number == 0:
+                    break
+                continue
+            # Exterior rings must be clockwise and the interior ones counterclockwise
+            if (ring_number == 0) != (area > 0):
+                coords = coords[::-1]
+            add_sequence(coords[:-1], close=True)
+
+    return 3, commands
+
+
+def encode_tile_layer(layer_name: str,
+                      geometries: np.ndarray,
+                      attributes: List[Dict],
+                      feature_ids: Sequence[int],
+                      extent: int) -> bytes:
+    """ Encode a layer of a Mapbox Vector Tile (MVT).
+
+    :param layer_name: name of the layer.
+    :param geometries: geometries in integer tile coordinates.
+    :param attributes: attributes of each geometry.
+    :param feature_ids: identifier of each geometry, the same in all the tiles.
+    :param extent: size of the tile in tile coordinates.
+    :return: the encoded tile, with a single layer.
+    """
+    keys, values = dict(), dict()
+    features = list()
+    for feature_id, geometry, feature_attributes in zip(feature_ids, geometries, attributes):
+        geometry_type, commands = _encode_geometry(geometry)
+        if not commands:
+            continue
+
+        tags = list()
+        for key, value in feature_attributes.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            encoded_value = _encode_value(value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(encoded_value, len(values)))
+
+        feature = _field(1, 0) + _varint(int(feature_id))
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0) + _varint(geometry_type)
+        feature += _packed(4, commands)
+        features.append(feature)
+
+    if not features:
+        return b''
+
+    layer = _field(15, 0) + _varint(2)
+    layer += _length_delimited(1, layer_name.encode('utf-8'))
+    layer += b''.join(_length_delimited(2, feature) for feature in features)
+    layer += b''.join(_length_delimited(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_length_delimited(4, value) for value in values)
+    layer += _field(5, 0) + _varint(extent)
+    return _length_delimited(3, layer)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """ Bounds of a XYZ tile in Web Mercator meters.
+
+    :return: tuple with min x, min y, max x and max y.
+    """
+    tile_size = 2 * WEB_MERCATOR_HALF_SIZE / 2 ** zoom
+    min_x = -WEB_MERCATOR_HALF_SIZE + x * tile_size
+    max_y = WEB_MERCATOR_HALF_SIZE - y * tile_size
+    return min_x, max_y - tile_size, min_x + tile_size, max_y
+
+
+def tiles_in_bounds(zoom: int, bounds: Sequence[float]) -> List[Tuple[int, int]]:
+    """ XYZ tiles that cover the given Web Mercator bounds.
+
+    :return: list of x, y tile indexes.
+    """
+    tile_size = 2 * WEB_MERCATOR_HALF_SIZE / 2 ** zoom
+    last_tile = 2 ** zoom - 1
+    min_x, min_y, max_x, max_y = bounds
+    x_range = range(max(int((min_x + WEB_MERCATOR_HALF_SIZE) // tile_size), 0),
+                    min(int((max_x + WEB_MERCATOR_HALF_SIZE) // tile_size), last_tile) + 1)
+    y_range = range(max(int((WEB_MERCATOR_HALF_SIZE - max_y) // tile_size), 0),
+                    min(int((WEB_MERCATOR_HALF_SIZE - min_y) // tile_size), last_tile) + 1)
+    return [(x, y) for x in x_range for y in y_range]
+
+
+def _init_worker(layer_name: str,
+                 layers: Dict[int, Tuple[np.ndarray, List[Dict]]],
+                 extent: int,
+                 buffer: int) -> None:
+    """ Load the layers of every zoom level and their spatial index in the worker. """
+    global _TILE_LAYERS
+    _TILE_LAYERS = {
+        'name': layer_name,
+        'extent': extent,
+        'buffer': buffer,
+        'zooms': {zoom: (shapely.from_wkb(wkb), attributes, shapely.STRtree(shapely.from_wkb(wkb)))
+                  for zoom, (wkb, attributes) in layers.items()}
+    }
+
+
+def _render_tiles(zoom: int, tiles: List[Tuple[int, int]]) -> List[Tuple[int, int, int, bytes]]:
+    """ Clip, transform and encode a batch of tiles of a zoom level.
+
+    :return: list with the zoom, x, y and the gzipped tile of the non-empty tiles.
+    """
+    geometries, attributes, tree = _TILE_LAYERS['zooms'][zoom]
+    extent = _TILE_LAYERS['extent']
+    buffer = _TILE_LAYERS['buffer']
+
+    rendered = list()
+    for x, y in tiles:
+        min_x, min_y, max_x, max_y = tile_bounds(zoom, x, y)
+        scale = extent / (max_x - min_x)
+        margin = buffer / scale
+
+        candidates = tree.query(shapely.box(min_x - margin, min_y - margin, max_x + margin, max_y + margin),
+                                predicate='intersects')
+        if not len(candidates):
+            continue
+        candidates.sort()
+        clipped = shapely.clip_by_rect(geometries[candidates],
+                                       min_x - margin, min_y - margin, max_x + margin, max_y + margin)
+        # Move to tile coordinates, with the origin in the top left corner
+        tile_geometries = shapely.transform(clipped,
+                                            lambda coords: np.c_[(coords[:, 0] - min_x) * scale,
+                                                                 (max_y - coords[:, 1]) * scale])
+        not_empty = ~shapely.is_empty(tile_geometries)
+        tile = encode_tile_layer(_TILE_LAYERS['name'],
+                                 tile_geometries[not_empty],
+                                 [attributes[index] for index in candidates[not_empty]],
+                                 candidates[not_empty],
+                                 extent)
+        if tile:
+            rendered.append((zoom, x, y, gzip.compress(tile)))
+
+    return rendered
+
+
+def _select_columns(columns: Sequence[str] | Dict[int, Sequence[str]] | None,
+                    zoom: int,
+                    geo_df: gpd.GeoDataFrame) -> List[str]:
+    """ Columns of the GeoDataFrame included in the tiles of a zoom level. """
+    if columns is None:
+        return [column for column in geo_df.columns if column != geo_df.geometry.name]
+    if isinstance(columns, dict):
+        # Use the columns defined for the closest lower zoom
+        defined_zooms = [defined_zoom for defined_zoom in columns if defined_zoom <= zoom]
+        return list(columns[max(defined_zooms)]) if defined_zooms else list()
+    return list(columns)
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    """ Attributes of each row with python types, so they can be encoded. """
+    return [{key: value.item() if isinstance(value, np.generic) else value for key, value in record.items()}
+            for record in df.to_dict(orient='records')]
+
+
+def export_vector_tiles(geo_df: gpd.GeoDataFrame,
+                        saving_path: str | Path,
+                        layer_name: str,
+                        min_zoom: int = None,
+                        max_zoom: int = None,
+                        columns: Sequence[str] | Dict[int, Sequence[str]] = None,
+                        workers: int = None) -> Path:
+    """ Export a GeoDataFrame to a MBTiles archive of vector tiles.
+
+    The geometries are simplified once per zoom level with a tolerance of
+    `vector_tiles.simplify_pixels` pixels of that level, and the tiles are clipped and
+    encoded in parallel.
+
+    :param geo_df: GeoDataFrame to export, e.g. the coverage per municipality or the PV polygons.
+    :param saving_path: path to the `.mbtiles` file. It is overwritten if it exists.
+    :param layer_name: name of the layer in the tiles.
+    :param min_zoom: first zoom level. By default, the `vector_tiles.min_zoom` setting.
+    :param max_zoom: last zoom level. By default, the `vector_tiles.max_zoom` setting.
+    :param columns: columns to include in the tiles, all of them by default. A dictionary
+      with the columns from each zoom level can be given to keep the low zooms lighter.
+    :param workers: number of processes. By default, the `vector_tiles.workers` setting.
+    :return: path to the archive.
+    """
+    min_zoom = settings.vector_tiles.min_zoom if min_zoom is None else min_zoom
+    max_zoom = settings.vector_tiles.max_zoom if max_zoom is None else max_zoom
+    workers = workers or settings.vector_tiles.workers or os.cpu_count()
+    extent = settings.vector_tiles.extent
+    buffer = settings.vector_tiles.buffer
+
+    mercator_df = geo_df.to_crs('EPSG:3857')
+    mercator_df = mercator_df[~mercator_df.geometry.is_empty & mercator_df.geometry.notna()]
+    geometries = shapely.make_valid(np.asarray(mercator_df.geometry.values))
+    bounds = shapely.total_bounds(geometries)
+
+    # Simplify per zoom level, so the low zooms do not carry the full detail
+    layers = dict()
+    fields = dict()
+    for zoom in range(min_zoom, max_zoom + 1):
+        pixel_size = 2 * WEB_MERCATOR_HALF_SIZE / 2 ** zoom / extent
+        zoom_geometries = shapely.simplify(geometries, settings.vector_tiles.simplify_pixels * pixel_size,
+                                           preserve_topology=True)
+        zoom_columns = _select_columns(columns, zoom, mercator_df)
+        layers[zoom] = (shapely.to_wkb(zoom_geometries), _records(mercator_df[zoom_columns]))
+        fields.update({column: 'Number' if pd.api.types.is_numeric_dtype(mercator_df[column]) else 'String'
+                       for column in zoom_columns})
+
+    tasks = list()
+    for zoom in range(min_zoom, max_zoom + 1):
+        tiles = tiles_in_bounds(zoom, bounds)
+        batch_size = max(len(tiles) // (workers * 4), 1)
+        tasks.extend((zoom, tiles[start:start + batch_size]) for start in range(0, len(tiles), batch_size))
+
+    saving_path = Path(saving_path)
+    os.makedirs(saving_path.parent, exist_ok=True)
+    saving_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(saving_path)
+    connection.execute('CREATE TABLE metadata (name TEXT, value TEXT)')
+    connection.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, '
+                       'tile_row INTEGER, tile_data BLOB)')
+    connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+
+    logger.info('Generating vector tiles from zoom {} to {} with {} workers.', min_zoom, max_zoom, workers)
+    n_tiles = 0
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(layer_name, layers, extent, buffer)) as executor:
+        for rendered in executor.map(_render_tiles, *zip(*tasks)) if tasks else list():
+            # MBTiles uses the TMS scheme, where the rows start at the bottom
+            connection.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                                   [(zoom, x, 2 ** zoom - 1 - y, tile) for zoom, x, y, tile in rendered])
+            n_tiles += len(rendered)
+
+    lon_lat_bounds = gpd.GeoSeries([shapely.box(*bounds)], crs='EPSG:3857').to_crs('EPSG:4326').total_bounds
+    metadata = {
+        'name': layer_name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': ','.join(f'{value:.6f}' for value in lon_lat_bounds),
+        'center': (f'{(lon_lat_bounds[0] + lon_lat_bounds[2]) / 2:.6f},'
+                   f'{(lon_lat_bounds[1] + lon_lat_bounds[3]) / 2:.6f},{min_zoom}'),
+        'json': json.dumps({'vector_layers': [{'id': layer_name,
+                                               'fields': fields,
+                                               'minzoom': min_zoom,
+                                               'maxzoom': max_zoom}]}),
+    }
+    connection.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    connection.commit()
+    connection.close()
+
+    logger.info('{} vector tiles saved in {}.', n_tiles, saving_path)
+    return saving_path
@@ -1,14 +1,9 @@
-import os
-from pathlib import Path
-from typing import Optional, Annotated
+from typing import Annotated, Optional
 
-import pandas as pd
 import typer
-from dateutil.parser import isoparse
-from loguru import logger
-from pandas import DataFrame
 
-from pv_stats.ree.ree_api import REEDataAPI, throttle_request_dates
+from pv_stats.config.config import configure_logs
+from pv_stats.ree.retrieval import retrieve_demand
 
 
 def retrieve_demand_data(
@@ -19,36 +14,11 @@ def retrieve_demand_data(
         time_trunc: Annotated[Optional[str], typer.Argument(help='Defines the time aggregation '
                                                                  'of the requested data.')] = 'hour'
 ) -> None:
-    ree_api = REEDataAPI()
-    logger.info('Retrieving demand data from REE API from {} to {}.', start_date, end_date)
-
-    # Check the dates to throttle the request, it cannot retrieve long periods
-    request_dates = throttle_request_dates(start_date, end_date)
-    # Generate the dataframe and add the data to it
-    demand_dfs = list()
-    for start_day, end_day in request_dates:
-        data = ree_api.get_demand(
-            start_date=start_day,
-            end_date=end_day,
-            time_trunc=time_trunc,
-            geo_trunc=None,
-            geo_limit=None,
-            geo_ids=None
-        )
-
-        demand_dfs.append(data)
-
-    demand_df = pd.concat(demand_dfs)
-
-    save_path = Path(save_path)
-    if save_path.is_dir():
-        start_str = isoparse(start_date).strftime('%Y%m%d')
-        end_str = isoparse(end_date).strftime('%Y%m%d')
-        save_path = save_path / f'ree_demand_{start_str}_{end_str}.csv'
-
-    os.makedirs(save_path.parent, exist_ok=True)
-    demand_df.to_csv(save_path)
+    configure_logs()
+    retrieve_demand(save_path, start_date, end_date, time_trunc)
 
 
 if __name__ == '__main__':
+    # Kept for compatibility, with the positional arguments of the previous script. The same
+    # as `pv-stats ree-demand`, which takes the time aggregation as the `--time-trunc` option.
     typer.run(retrieve_demand_data)
@@ -0,0 +1,7 @@
+import typer
+
+from pv_stats.cli import serve_spatial_lookup
+
+if __name__ == '__main__':
+    # Kept for compatibility, the same as `pv-stats serve-spatial-lookup`
+    typer.run(serve_spatial_lookup)
@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+from benchmarks.ree_server import REEStandInServer
+from pv_stats.config.config import settings
+from pv_stats.ree.pipeline import HourlySource
+
+
+class ConstantSource(HourlySource):
+    """ Source with the same value in every hour that records the requested windows. """
+
+    def __init__(self, value: float):
+        self.value = value
+        self.requested = []
+
+    def request(self, window):
+        self.requested.append(window)
+        return pd.date_range(*window, freq='h')
+
+    def parse(self, payload, window):
+        return pd.DataFrame({'Demanda real': self.value}, index=payload)
+
+
+@pytest.fixture
+def stand_in():
+    """ REE stand-in server with the clients pointed at it, restored afterwards. """
+    with REEStandInServer() as server:
+        previous = server.configure_clients()
+        yield server
+        for key, value in previous.items():
+            settings.set(key, value)
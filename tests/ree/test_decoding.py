@@ -0,0 +1,28 @@
+import pytest
+
+from pv_stats.ree.decoding import JSON_BACKENDS, decode_json, decode_jsonp, strip_jsonp
+
+PAYLOAD = 'angular.callbacks._0({"valoresHorariosGeneracion": [{"ts": "2023-10-29 2A:00", "eol": 1.5}]});'
+
+
+def test_strip_jsonp_returns_a_view_of_the_response():
+    content = PAYLOAD.encode('utf-8')
+
+    json_view = strip_jsonp(content)
+
+    assert isinstance(json_view, memoryview)
+    assert json_view.obj is content
+    assert bytes(json_view).startswith(b'{"valores') and bytes(json_view).endswith(b'}]}')
+    with pytest.raises(ValueError, match='JSONP'):
+        strip_jsonp(b'{"valoresHorariosGeneracion": []}')
+
+
+@pytest.mark.parametrize('backend', list(JSON_BACKENDS))
+def test_backends_decode_the_same(backend):
+    if backend == 'orjson':
+        pytest.importorskip('orjson')
+
+    assert decode_jsonp(PAYLOAD.encode('utf-8'), backend) == {
+        'valoresHorariosGeneracion': [{'ts': '2023-10-29 2A:00', 'eol': 1.5}]}
+    assert decode_json(b'{"included": []}', backend) == {'included': []}
+    assert decode_json(memoryview(b'[1, 2.5]'), backend) == [1, 2.5]
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from pv_stats.ree import ree_api, ree_demanda_api
+from pv_stats.ree.frames import compact_frame, memory_report
+
+
+def test_compact_frame_keeps_the_precision():
+    df = pd.DataFrame({'Demanda': [25000.5, 31000.25], 'Acumulado': [1e9 + 0.5, 2e9 + 0.25],
+                       'Zona': ['peninsular', 'peninsular']},
+                      index=['2023-01-01T00:00:00.000+01:00', '2023-01-01T01:00:00.000+01:00'])
+
+    compact_df = compact_frame(df)
+
+    assert compact_df['Demanda'].dtype == np.float32
+    # Too large to keep the decimals as float32
+    assert compact_df['Acumulado'].dtype == np.float64
+    assert isinstance(compact_df['Zona'].dtype, pd.CategoricalDtype)
+    assert str(compact_df.index.tz) == 'Europe/Madrid'
+    assert compact_df.index[0] == pd.Timestamp('2023-01-01', tz='Europe/Madrid')
+
+    report = memory_report(compact_df)
+    assert report['rows'] == 2
+    assert report['bytes'] < memory_report(df)['bytes']
+    assert report['columns']['Demanda'] == {'bytes': 8, 'dtype': 'float32'}
+
+
+def test_ree_data_parse_response_is_typed():
+    data = {'included': [{'attributes': {'title': 'Demanda real', 'values': [
+        {'value': 25000.5, 'datetime': '2023-10-29T02:00:00.000+02:00'},
+        {'value': 24000.5, 'datetime': '2023-10-29T02:00:00.000+01:00'}]}}]}
+
+    demand_df = ree_api.parse_response(data)
+
+    assert demand_df['Demanda real'].dtype == np.float32
+    assert demand_df.index.is_unique and str(demand_df.index.tz) == 'Europe/Madrid'
+
+
+def test_ree_data_parse_response_reads_the_series_nested_in_groups():
+    data = {'included': [
+        {'attributes': {'title': 'Renovable', 'content': [
+            {'attributes': {'title': 'Eólica',
+                            'values': [{'value': 100.0, 'datetime': '2023-01-01T00:00:00.000+01:00'}]}},
+            {'attributes': {'title': 'Solar fotovoltaica',
+                            'values': [{'value': 50.0, 'datetime': '2023-01-01T00:00:00.000+01:00'}]}}]}},
+        {'attributes': {'title': 'Demanda en b.c.', 'values': [
+            {'value': 150.0, 'datetime': '2023-01-01T00:00:00.000+01:00'}]}}]}
+
+    balance_df = ree_api.parse_response(data)
+
+    assert balance_df.columns.tolist() == ['Eólica', 'Solar fotovoltaica', 'Demanda en b.c.']
+    assert balance_df.iloc[0].tolist() == [100.0, 50.0, 150.0]
+
+
+def test_ree_demanda_parse_response_uses_the_repeated_hour_labels():
+    times = ['2023-10-28 23:50'] + [f'2023-10-29 {hour}:{minute:02d}' for hour in ['01', '2A', '2B', '03']
+                                    for minute in range(0, 60, 10)]
+    data = {'valoresHorariosGeneracion': [{'ts': ts, 'eol': 6.0, 'solFot': 1.5, 'extra': 0} for ts in times]}
+
+    generation_df = ree_demanda_api.parse_response(data, datetime(2023, 10, 29))
+
+    assert list(generation_df.columns) == ['Eólica', 'Solar fotovoltaica']
+    assert (generation_df.dtypes == np.float32).all()
+    # The 2A hour is in summer time and the 2B one in winter time
+    assert generation_df.index.is_unique and len(generation_df) == 24
+    assert generation_df.index[6] == pd.Timestamp('2023-10-29T02:00+02:00')
+    assert generation_df.index[12] == pd.Timestamp('2023-10-29T02:00+01:00')
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from pv_stats.ree.gaps import backfill, request_windows, scan_gaps
+from pv_stats.ree.storage import HourlyStore
+from tests.ree.conftest import ConstantSource
+
+
+def _hours(start: str, end: str) -> pd.DatetimeIndex:
+    return pd.date_range(start, end, freq='h', tz='Europe/Madrid')
+
+
+def test_scan_gaps_finds_missing_and_duplicated_hours():
+    hours = _hours('2023-10-28', '2023-10-30 23:00')
+    index = hours.drop(hours[5:8]).append(hours[[10, 10, 20]])
+
+    gaps = scan_gaps(index, hours[0], hours[-1])
+
+    assert gaps['missing'].equals(hours[5:8])
+    assert gaps['duplicated'].equals(hours[[10, 20]])
+
+
+def test_request_windows_merge_close_gaps_and_split_long_ones():
+    hours = _hours('2023-01-01', '2023-03-31 23:00')
+    missing = hours[[0, 1, 5]].append(hours[100:110]).append(hours[1000:2000])
+
+    windows = request_windows(missing, merge_hours=6, max_hours=24 * 30)
+
+    assert windows[0] == (hours[0], hours[5])
+    assert windows[1] == (hours[100], hours[109])
+    # 1000 hours in windows of at most 30 days
+    assert [end - start + pd.Timedelta(hours=1) for start, end in windows[2:]] == \
+        [pd.Timedelta(hours=720), pd.Timedelta(hours=280)]
+
+
+def test_request_windows_whole_days_follow_changes_of_hour():
+    missing = _hours('2023-10-29 10:00', '2023-10-29 11:00')
+
+    start, end = request_windows(missing, merge_hours=0, whole_days=True)[0]
+
+    assert start == pd.Timestamp('2023-10-29', tz='Europe/Madrid')
+    assert (end - start) == pd.Timedelta(hours=24)
+
+
+def test_backfill_only_requests_gaps(tmp_path):
+    store = HourlyStore(tmp_path)
+    hours = _hours('2023-01-01', '2023-12-31 23:00')
+    stored = hours.drop(hours[1000:1003]).drop(hours[5000:5001])
+    store.write('demand', pd.DataFrame({'Demanda real': 1.0}, index=stored))
+    source = ConstantSource(2.0)
+
+    windows = backfill(store, 'demand', source)
+
+    assert sorted(source.requested) == windows == [(hours[1000], hours[1002]), (hours[5000], hours[5000])]
+    assert len(store.read_all('demand')) == len(hours)
+    assert backfill(store, 'demand', source) == []
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from pv_stats.ree.pipeline import HourlySource, run_pipeline
+
+
+def test_pipeline_overlaps_stages_and_bounds_queues():
+    in_flight = []
+    lock = threading.Lock()
+    active = [0]
+    requesting = [0]
+    concurrent_requests = []
+    requests_during_writes = []
+
+    def request(item):
+        with lock:
+            requesting[0] += 1
+            concurrent_requests.append(requesting[0])
+        time.sleep(0.05)
+        with lock:
+            requesting[0] -= 1
+            active[0] += 1
+            in_flight.append(active[0])
+        return item
+
+    def parse(payload, item):
+        return payload * 2
+
+    written = []
+
+    def write(frame):
+        with lock:
+            requests_during_writes.append(requesting[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        written.append(frame)
+
+    assert run_pipeline(range(20), request, parse, write, fetchers=4, queue_size=2) == 20
+
+    assert sorted(written) == [item * 2 for item in range(20)]
+    # The requests run in parallel and the writes while other requests wait for the API
+    assert max(concurrent_requests) > 1
+    assert max(requests_during_writes) > 0
+    # Items between the request and the write: two queues, the parser and the request threads
+    assert max(in_flight) <= 2 + 2 + 1 + 4
+
+
+def test_pipeline_raises_errors_of_any_stage():
+    def request(item):
+        if item == 3:
+            raise RuntimeError('Request error')
+        return item
+
+    with pytest.raises(RuntimeError, match='Request error'):
+        run_pipeline(range(100), request, lambda payload, item: payload, lambda frame: None, fetchers=2)
+
+    def write(frame):
+        raise ValueError('Write error')
+
+    with pytest.raises(ValueError, match='Write error'):
+        run_pipeline(range(100), lambda item: item, lambda payload, item: payload, write, fetchers=2)
+
+
+def test_source_without_parse_fails_when_created():
+    class RequestOnlySource(HourlySource):
+        def request(self, window):
+            return None
+
+    with pytest.raises(TypeError, match='parse'):
+        RequestOnlySource()
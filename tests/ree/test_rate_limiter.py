@@ -0,0 +1,38 @@
+import multiprocessing
+import time
+
+from pv_stats.ree.rate_limiter import RateLimiter
+
+
+def test_rate_limiter_allows_a_burst_and_then_the_rate(tmp_path):
+    limiter = RateLimiter('api.test', rate=20, burst=3, folder=tmp_path)
+
+    start = time.perf_counter()
+    waits = [limiter.acquire() for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    # Each request after the burst waits for a token, 1 / 20 s
+    assert all(0 < wait <= 0.05 for wait in waits[3:])
+    assert time.perf_counter() - start >= 0.09
+    assert RateLimiter('api.test', rate=0, burst=1, folder=tmp_path).acquire() == 0
+
+
+def _acquire(folder, times):
+    limiter = RateLimiter('api.test', rate=20, burst=2, folder=folder)
+    for _ in range(times):
+        limiter.acquire()
+
+
+def test_rate_limiter_is_shared_between_processes(tmp_path):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_acquire, args=(tmp_path, 4)) for _ in range(3)]
+
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # 12 requests with a burst of 2 need at least 10 / 20 s, alone each process would take 0.1 s
+    assert time.perf_counter() - start >= 0.45
+    assert all(process.exitcode == 0 for process in processes)
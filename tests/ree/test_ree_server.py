@@ -0,0 +1,31 @@
+import pandas as pd
+import requests
+
+from benchmarks.ree_server import REEStandInServer
+from pv_stats.ree.retrieval import retrieve_demand, retrieve_generation
+from pv_stats.ree.storage import HourlyStore
+
+
+def test_retrieval_from_the_stand_in_across_time_changes(stand_in, tmp_path):
+    store = HourlyStore(tmp_path / 'store')
+
+    demand_path = retrieve_demand(tmp_path / 'demand.csv', '2023-10-28', '2023-10-30T23:00', store=store)
+    generation_path = retrieve_generation(tmp_path / 'generation.csv', '2023-03-26', '2023-03-26', store=store)
+
+    demand_df = pd.read_csv(demand_path, index_col=0)
+    generation_df = pd.read_csv(generation_path, index_col=0)
+    # The change to winter time has 25 hours and the one to summer time 23
+    assert len(demand_df) == 24 + 25 + 24
+    assert len(generation_df) == 23
+    assert stand_in.stats['requests'] == 2
+
+
+def test_stand_in_fails_and_throttles_at_the_given_rates():
+    with REEStandInServer(error_rate=0.5, throttle_rate=0.5, retry_after=3) as server:
+        url = f'http://{server.address}/es/datos/demanda/demanda-tiempo-real'
+        responses = [requests.get(url, params={'start_date': '2023-01-01T00:00', 'end_date': '2023-01-01T23:00',
+                                               'time_trunc': 'hour'}) for _ in range(10)]
+
+    assert {response.status_code for response in responses} <= {429, 500}
+    assert all(response.headers['Retry-After'] == '3' for response in responses if response.status_code == 429)
+    assert server.stats['errors'] + server.stats['throttled'] == 10
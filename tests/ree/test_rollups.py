@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from pv_stats.ree.rollups import get_rollup, period_bounds, rollup
+from pv_stats.ree.storage import HourlyStore, to_hourly
+from tests.ree.conftest import ConstantSource
+
+
+def test_rollup_days_follow_changes_of_hour():
+    hours = pd.date_range('2023-03-25', '2023-10-31', freq='h', tz='Europe/Madrid', inclusive='left')
+    days = rollup(pd.DataFrame({'value': 1.0}, index=hours), 'day')['value']
+
+    assert days[pd.Timestamp('2023-03-25', tz='Europe/Madrid')] == 24
+    assert days[pd.Timestamp('2023-03-26', tz='Europe/Madrid')] == 23
+    assert days[pd.Timestamp('2023-10-29', tz='Europe/Madrid')] == 25
+    weeks = rollup(pd.DataFrame({'value': 1.0}, index=hours), 'week')
+    assert (weeks.index[1:].dayofweek == 0).all()
+
+
+def test_period_bounds_cover_whole_periods():
+    first_hour, last_hour = period_bounds('2023-10-10', '2023-10-12T15:00', 'month')
+
+    assert first_hour == pd.Timestamp('2023-10-01', tz='Europe/Madrid')
+    assert last_hour == pd.Timestamp('2023-10-31T23:00', tz='Europe/Madrid')
+    with pytest.raises(ValueError):
+        period_bounds('2023-10-10', '2023-10-12', 'quarter')
+
+
+def test_get_rollup_only_fetches_missing_hours(tmp_path):
+    store = HourlyStore(tmp_path)
+    source = ConstantSource(1.0)
+
+    months = get_rollup(store, 'demand', '2023-10-01', '2023-10-31', 'month', source)
+    assert months['Demanda real'].tolist() == [745]
+    # October has more hours than a request
+    requests = len(source.requested)
+    assert requests == 2
+
+    # Stored days are aggregated without calling the API
+    days = get_rollup(store, 'demand', '2023-10-28', '2023-10-30', 'day', source)
+    assert days['Demanda real'].tolist() == [24, 25, 24]
+    assert len(source.requested) == requests
+
+    # Only November is retrieved
+    get_rollup(store, 'demand', '2023-10-01', '2023-11-30', 'month', source)
+    assert source.requested[requests:] == [(pd.Timestamp('2023-11-01', tz='Europe/Madrid'),
+                                    pd.Timestamp('2023-11-30T23:00', tz='Europe/Madrid'))]
+    assert len(list((tmp_path / 'demand' / 'rollups').glob('month_sum_*.parquet'))) == 1
+
+
+def test_to_hourly_averages_the_ten_minutes_values():
+    times = pd.date_range('2023-10-29 01:00', '2023-10-29 03:50', freq='10min', tz='Europe/Madrid')
+    generation = pd.DataFrame({'Eólica': 6.0}, index=times)
+
+    hourly = to_hourly(generation)
+
+    # The repeated hour of the change to winter time is a different hour in UTC
+    assert len(hourly) == 4
+    assert (hourly['Eólica'] == 6.0).all()
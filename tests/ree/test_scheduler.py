@@ -0,0 +1,71 @@
+import json
+
+import pandas as pd
+import pytest
+
+from pv_stats.ree.scheduler import BackfillProgress, interleave, load_catalog, plan_windows, run_catalog_backfill
+from pv_stats.ree.storage import HourlyStore
+
+
+def _local(timestamp: str) -> pd.Timestamp:
+    return pd.Timestamp(timestamp, tz='Europe/Madrid')
+
+
+def test_plan_windows_splits_at_calendar_boundaries():
+    hour_windows = plan_windows('2023-01-10', '2023-02-20', 'hour')
+    month_windows = plan_windows('2022-05-03', '2023-02-01', 'month')
+
+    assert [window[0] for window in hour_windows] == [_local('2023-01-10'), _local('2023-01-15'),
+                                                      _local('2023-02-01'), _local('2023-02-15')]
+    assert hour_windows[0][1] == _local('2023-01-14T23:00')
+    assert hour_windows[-1][1] == _local('2023-02-20T23:00')
+    assert month_windows == [(_local('2022-05-01'), _local('2022-12-31T23:00')),
+                             (_local('2023-01-01'), _local('2023-02-28T23:00'))]
+
+
+def test_interleave_by_priority_and_turns():
+    first, second, urgent = {'priority': 0}, {'priority': 0}, {'priority': 1}
+
+    order = list(interleave([(first, [1, 2, 3]), (second, [4]), (urgent, [5, 6])]))
+
+    assert order == [(urgent, 5), (urgent, 6), (first, 1), (second, 4), (first, 2), (first, 3)]
+
+
+def test_catalog_backfill_resumes_from_the_stored_windows(stand_in, tmp_path):
+    catalog_path = tmp_path / 'catalog.json'
+    catalog_path.write_text(json.dumps([
+        {'category': 'mercados', 'widget': 'precios-mercados-tiempo-real', 'start_date': '2023-03-01',
+         'end_date': '2023-04-30'},
+        {'category': 'balance', 'widget': 'balance-electrico', 'time_trunc': 'day', 'start_date': '2022-12-01',
+         'end_date': '2023-01-31', 'priority': 1}]))
+    catalog = load_catalog(catalog_path)
+    store = HourlyStore(tmp_path / 'store')
+    state_path = tmp_path / 'progress.json'
+
+    summary = run_catalog_backfill(catalog, store, BackfillProgress(state_path), concurrency=2)
+
+    assert summary == {'mercados_precios-mercados-tiempo-real_hour': {'windows': 4, 'stored_before': 0, 'retrieved': 4},
+                       'balance_balance-electrico_day': {'windows': 2, 'stored_before': 0, 'retrieved': 2}}
+    # The days of March and April, with the change to summer time
+    assert len(store.read_all('mercados_precios-mercados-tiempo-real_hour')) == 61 * 24 - 1
+    balance_df = store.read_all('balance_balance-electrico_day')
+    # The series of the balance are nested in their groups
+    assert balance_df.shape == (62, stand_in.n_series)
+    assert stand_in.stats['requests'] == 6
+
+    # An interrupted run has some windows pending
+    state = json.loads(state_path.read_text())
+    state['balance_balance-electrico_day'].pop()
+    state_path.write_text(json.dumps(state))
+    summary = run_catalog_backfill(catalog, store, BackfillProgress(state_path))
+
+    assert summary['balance_balance-electrico_day'] == {'windows': 2, 'stored_before': 1, 'retrieved': 1}
+    assert stand_in.stats['requests'] == 7
+
+
+def test_load_catalog_rejects_invalid_jobs(tmp_path):
+    catalog_path = tmp_path / 'catalog.json'
+    catalog_path.write_text(json.dumps([{'category': 'balance', 'start_date': '2023-01-01', 'region': 'x'}]))
+
+    with pytest.raises(ValueError, match='Missing keys: widget. Unknown keys: region'):
+        load_catalog(catalog_path)
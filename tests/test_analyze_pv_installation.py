@@ -0,0 +1,42 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from pv_stats.analyze_pv_installation import get_overlap_rank, resolve_pv_overlaps
+
+
+@pytest.fixture
+def pv_df() -> gpd.GeoDataFrame:
+    # The same roof in two layers, with a different extent and category, inside a perimeter
+    geometries = [shapely.box(0, 0, 100, 100), shapely.box(50, 0, 250, 100), shapely.box(0, 0, 300, 300)]
+    pv_df = gpd.GeoDataFrame({'categoria': ['URB-SUR', 'URB-PLANA', 'EXT'], 'source': [1, 0, 0]},
+                             geometry=geometries, crs='EPSG:25830')
+    pv_df['area_m2'] = pv_df.geometry.area
+    return pv_df
+
+
+@pytest.mark.parametrize('precedence, category_order, rank', [
+    ('source', None, [1, 0, 0]),
+    ('largest', None, [-10000, -20000, -90000]),
+    ('category', ['URB-PLANA', 'URB-SUR'], [1, 0, 2]),
+])
+def test_get_overlap_rank(pv_df, precedence, category_order, rank):
+    assert get_overlap_rank(pv_df, precedence, category_order).tolist() == rank
+
+
+def test_get_overlap_rank_with_an_invalid_rule(pv_df):
+    with pytest.raises(ValueError, match='not valid'):
+        get_overlap_rank(pv_df, 'newest')
+
+
+@pytest.mark.parametrize('precedence, areas', [
+    ('source', [5000, 20000]),
+    ('category', [10000, 15000]),
+])
+def test_resolve_pv_overlaps_counts_the_shared_area_once(pv_df, precedence, areas):
+    resolved = resolve_pv_overlaps(pv_df, precedence, ['URB-SUR', 'URB-PLANA'])
+    usable = resolved[resolved['categoria'] != 'EXT']
+    # Both layers are in the equal area CRS, so the areas have a small distortion
+    assert usable['area_m2'].tolist() == pytest.approx(areas, rel=0.01)
+    # The perimeter encloses the others and is not cut
+    assert resolved.loc[2, 'area_m2'] == 90000
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+import pv_stats.cli as cli
+
+
+def _write_marker(path: str, text: str) -> None:
+    with open(path, 'w') as marker_file:
+        marker_file.write(f'{text}:{os.getpid()}')
+
+
+def _fail() -> None:
+    raise RuntimeError('Job error')
+
+
+@pytest.fixture
+def job_commands(monkeypatch):
+    # The workers are forked, so they see the patched commands
+    monkeypatch.setattr(cli, 'get_job_commands', lambda: {'write-marker': _write_marker, 'fail': _fail})
+
+
+def test_load_jobs_rejects_unknown_commands(tmp_path):
+    job_file = tmp_path / 'jobs.json'
+    job_file.write_text('[{"command": "unknown"}]')
+
+    with pytest.raises(ValueError, match='unknown'):
+        cli.load_jobs(job_file)
+
+
+def test_batch_runs_jobs_in_worker_pool(job_commands, tmp_path):
+    job_file = tmp_path / 'jobs.toml'
+    job_file.write_text('\n'.join(f'[[jobs]]\ncommand = "write-marker"\npath = "{tmp_path / f"marker_{i}"}"\n'
+                                  f'text = "{i}"\n' for i in range(4)))
+
+    result = CliRunner().invoke(cli.app, ['batch', str(job_file), '--workers', '2'])
+
+    assert result.exit_code == 0
+    markers = [(tmp_path / f'marker_{i}').read_text().split(':') for i in range(4)]
+    assert [text for text, _ in markers] == ['0', '1', '2', '3']
+    # The jobs share two long-lived workers instead of a process each
+    assert len({pid for _, pid in markers}) <= 2
+    assert all(int(pid) != os.getpid() for _, pid in markers)
+
+
+def test_batch_reports_failed_jobs(job_commands, tmp_path):
+    job_file = tmp_path / 'jobs.json'
+    job_file.write_text(f'{{"jobs": [{{"command": "fail"}}, '
+                        f'{{"command": "write-marker", "path": "{tmp_path / "marker"}", "text": "done"}}]}}')
+
+    results = cli.run_jobs(cli.load_jobs(job_file), workers=1)
+
+    assert [result['status'] for result in results] == ['failed', 'done']
+    assert 'Job error' in results[0]['error']
+    assert (tmp_path / 'marker').exists()
+    assert CliRunner().invoke(cli.app, ['batch', str(job_file)]).exit_code == 1
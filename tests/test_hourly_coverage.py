@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pv_stats.hourly_coverage import (build_hourly_profile, match_hourly_coverage, process_hourly_fv_coverage,
+                                     read_hourly_profile)
+
+
+def _flat_profile(hours: int = 8760) -> pd.Series:
+    index = pd.date_range('2022-01-01', periods=hours, freq='h', tz='UTC')
+    return pd.Series(np.full(hours, 1 / 8760, dtype=np.float32), index=index)
+
+
+def test_build_hourly_profile_sums_one_per_year():
+    times = pd.date_range('2022-01-01', periods=8760 * 6, freq='10min', tz='Europe/Madrid')
+    ree_df = pd.DataFrame({'Fecha': times, 'Demanda': np.random.default_rng(0).uniform(20000, 40000, len(times))})
+    profile = build_hourly_profile(ree_df, 'Demanda', time_column='Fecha')
+    assert len(profile) == 8760
+    assert profile.dtype == np.float32
+    assert profile.sum() == pytest.approx(1, rel=1e-4)
+
+
+def test_build_hourly_profile_raises_error_without_values():
+    ree_df = pd.DataFrame({'Demanda': [0, 0]}, index=['2022-01-01T00:00', '2022-01-01T01:00'])
+    with pytest.raises(ValueError):
+        build_hourly_profile(ree_df, 'Demanda')
+
+
+def test_match_hourly_coverage_chunks_match_single_pass():
+    rng = np.random.default_rng(1)
+    consumption = rng.uniform(100, 1000, 50)
+    generation = rng.uniform(0, 1000, 50)
+    demand_profile = rng.uniform(0.5, 1.5, 500).astype(np.float32)
+    pv_profile = rng.uniform(0, 2, 500).astype(np.float32)
+
+    chunked = match_hourly_coverage(consumption, generation, demand_profile, pv_profile,
+                                    municipalities_per_chunk=7, hours_per_chunk=33)
+    single = match_hourly_coverage(consumption, generation, demand_profile, pv_profile,
+                                   municipalities_per_chunk=50, hours_per_chunk=500)
+    pd.testing.assert_frame_equal(chunked, single, rtol=1e-5)
+
+
+def test_process_hourly_fv_coverage_flat_profiles_match_annual_balance():
+    df = pd.DataFrame({'mean_electricity_consumption': [1000.0, 1000.0],
+                       'electricity_generated_annually': [400.0, 1500.0]})
+    hourly_df = process_hourly_fv_coverage(df, _flat_profile(), _flat_profile())
+    # The input is not modified
+    assert df.columns.tolist() == ['mean_electricity_consumption', 'electricity_generated_annually']
+    df = hourly_df
+    np.testing.assert_allclose(df['hourly_self_consumption'], [400, 1000], rtol=1e-4)
+    np.testing.assert_allclose(df['hourly_surplus'], [0, 500], rtol=1e-4)
+    np.testing.assert_allclose(df['hourly_deficit'], [600, 0], rtol=1e-4)
+
+
+def test_read_hourly_profile_from_the_retrieved_file(tmp_path):
+    # As saved by `retrieve_demand`, indexed by the local time
+    times = pd.date_range('2023-01-01', periods=8760, freq='h', tz='Europe/Madrid')
+    ree_path = tmp_path / 'ree_demand.csv'
+    pd.DataFrame({'Demanda real': 30000.0, 'Demanda programada': 31000.0}, index=times).to_csv(ree_path)
+
+    profile = read_hourly_profile(ree_path, 'Demanda real')
+
+    assert len(profile) == 8760 and str(profile.index.tz) == 'UTC'
+    assert profile.sum() == pytest.approx(1, rel=1e-4)
@@ -0,0 +1,38 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from pv_stats.map_rendering import build_geometry_cache, load_geometry_paths, render_scenario_maps
+
+
+def test_geometry_cache_keeps_one_path_per_row(tmp_path):
+    geometries = [
+        shapely.box(0, 0, 1000, 1000),
+        shapely.MultiPolygon([shapely.box(2000, 0, 3000, 1000), shapely.box(4000, 0, 5000, 1000)]),
+        shapely.box(0, 2000, 1000, 3000).difference(shapely.box(250, 2250, 750, 2750)),
+    ]
+    geo_df = gpd.GeoDataFrame(geometry=geometries, crs='EPSG:25830')
+    cache_path = build_geometry_cache(geo_df, tmp_path / 'paths.npz', simplify_tolerance=0)
+
+    geometry_paths = load_geometry_paths(cache_path)
+    assert len(geometry_paths['paths']) == 3
+    # Two rings per path, for the two polygons and for the polygon with a hole
+    assert [len(path.to_polygons()) for path in geometry_paths['paths']] == [1, 2, 2]
+    np.testing.assert_allclose(geometry_paths['bounds'], [0, 0, 5000, 3000])
+
+
+def test_render_scenario_maps_rebuilds_a_stale_cache(tmp_path):
+    geo_df = gpd.GeoDataFrame(geometry=[shapely.box(0, 0, 1000, 1000), shapely.box(1000, 0, 2000, 1000)],
+                              crs='EPSG:25830')
+    scenarios = pd.DataFrame({'low': [0.1, 0.5], 'high': [0.6, 0.9]})
+    saved_paths = render_scenario_maps(geo_df, scenarios, tmp_path, workers=2, formats=['png'])
+    assert sorted(saved_paths) == sorted([f'{tmp_path}/low.png', f'{tmp_path}/high.png'])
+    assert len(load_geometry_paths(tmp_path / 'geometry_paths.npz')['paths']) == 2
+
+    # Other polygons in the same folder do not reuse the cache of the previous ones
+    geo_df = gpd.GeoDataFrame(geometry=[shapely.box(0, 0, 500, 500)], crs='EPSG:25830')
+    render_scenario_maps(geo_df, scenarios.iloc[:1], tmp_path, workers=1, formats=['png'])
+    assert len(load_geometry_paths(tmp_path / 'geometry_paths.npz')['paths']) == 1
+
+    assert render_scenario_maps(geo_df, pd.DataFrame(index=geo_df.index), tmp_path) == []
@@ -0,0 +1,60 @@
+import geopandas as gpd
+import pandas as pd
+import pytest
+import shapely
+
+from pv_stats.map_electricity_coverage import calculate_fv_coverage
+from pv_stats.pv_area_per_city import aggregate_pv_area, split_pv_polygons
+from pv_stats.utils.spatial_lookup import SpatialIndex
+
+
+def _index(attributes: dict, geometries: list) -> SpatialIndex:
+    geo_df = gpd.GeoDataFrame(attributes, geometry=geometries, crs='EPSG:25830')
+    return SpatialIndex.from_geo_dataframe(geo_df, list(attributes))
+
+
+@pytest.fixture
+def municipalities() -> SpatialIndex:
+    return _index({'municipio_id': [28014, 28079]}, [shapely.box(0, 0, 1000, 1000), shapely.box(1000, 0, 2000, 1000)])
+
+
+@pytest.fixture
+def pv_df() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame({'categoria': ['RES', 'IND-SUELO', 'EXT']},
+                            geometry=[shapely.box(900, 0, 1100, 100), shapely.box(1500, 500, 1600, 600),
+                                      shapely.box(0, 0, 2000, 1000)],
+                            crs='EPSG:25830')
+
+
+def test_split_pv_polygons_counts_each_piece_once(municipalities, pv_df):
+    pieces = split_pv_polygons(pv_df, municipalities)
+    # The perimeters are excluded and the polygon that crosses the boundary is split
+    assert pieces['pv_idx'].tolist() == [0, 0, 1]
+    assert pieces['municipio_id'].tolist() == [28014, 28079, 28079]
+    # The areas are computed in the equal area CRS, with a small distortion from the source one
+    assert pieces['area_m2'].tolist() == pytest.approx([10000, 10000, 10000], rel=0.01)
+
+
+def test_aggregate_pv_area_per_municipality_and_land_use(municipalities, pv_df):
+    land_use = _index({'ID_USO_MAX': [1, 2]}, [shapely.box(0, 0, 2000, 50), shapely.box(0, 50, 2000, 1000)])
+    pieces = split_pv_polygons(pv_df, municipalities, land_use)
+    assert pieces['area_m2'].sum() == pytest.approx(30000, rel=0.01)
+
+    area_df = aggregate_pv_area(pieces)
+    assert area_df.loc[28014, 'roof_ha'] == pytest.approx(1, rel=0.01)
+    assert area_df.loc[28079, ['roof_ha', 'floor_ha']].tolist() == pytest.approx([1, 1], rel=0.01)
+
+    area_per_use = aggregate_pv_area(pieces, ['municipio_id', 'ID_USO_MAX'])
+    assert area_per_use.loc[(28079, 1), 'RES'] == pytest.approx(0.5, rel=0.01)
+    assert area_per_use['roof_ha'].sum() == pytest.approx(area_df['roof_ha'].sum())
+
+
+def test_calculate_fv_coverage():
+    df = pd.DataFrame({'roof_ha': [1.0, 10.0], 'mean_electricity_consumption': [10000.0, 1000.0],
+                       'rural_ha': [100.0, 100.0]})
+    df = calculate_fv_coverage(df, 'roof_ha', power_per_ha_roof=1000)
+    # The first city needs floor to cover the demand, the second one is covered by its roofs
+    assert df['covered_percentage'].iloc[1] == 1
+    assert df['electricity_required_in_floor'].iloc[1] == 0
+    assert df['electricity_required_in_floor'].iloc[0] > 0
+    assert (df['used_rural_floor'] == df['floor_ha'] / 100).all()
@@ -0,0 +1,12 @@
+import pytest
+
+from pv_stats.config.config import settings
+
+
+@pytest.fixture
+def processed_data_folder(tmp_path):
+    """ Temporary `processed_data_folder`, restored afterwards. """
+    previous = settings.processed_data_folder
+    settings.set('processed_data_folder', str(tmp_path))
+    yield tmp_path
+    settings.set('processed_data_folder', previous)
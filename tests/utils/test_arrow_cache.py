@@ -0,0 +1,49 @@
+import os
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from pv_stats.utils.arrow_cache import get_arrow_cache_path, read_arrow_cache
+from pv_stats.utils.io_utils import read_dataframe, read_geo_dataframe
+
+
+def test_read_geo_dataframe_through_arrow_cache(processed_data_folder):
+    geo_df = gpd.GeoDataFrame({'municipio_id': pd.array([28014, None], dtype='Int32'),
+                               'municipio_nombre': ['Aranjuez', 'Madrid']},
+                              geometry=[shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)],
+                              crs='EPSG:25830')
+    path = processed_data_folder / 'administrative_divisions.parquet'
+    geo_df.to_parquet(path)
+
+    first = read_geo_dataframe(path)
+    assert get_arrow_cache_path(path).exists()
+    cached = read_geo_dataframe(path)
+    pd.testing.assert_frame_equal(pd.DataFrame(cached), pd.DataFrame(first))
+    assert cached.crs == geo_df.crs
+
+    # The cache is written again when the file changes
+    geo_df['municipio_nombre'] = ['Aranjuez', 'Getafe']
+    geo_df.to_parquet(path)
+    os.utime(path, ns=(0, 0))
+    assert read_geo_dataframe(path)['municipio_nombre'].tolist() == ['Aranjuez', 'Getafe']
+
+
+def test_arrow_cache_zero_copy_columns_are_read_only(processed_data_folder):
+    path = processed_data_folder / 'cities_info.parquet'
+    pd.DataFrame({'poblacion': [100, 200], 'municipio_nombre': ['Aranjuez', 'Madrid']}).to_parquet(path)
+    read_dataframe(path)
+
+    df = read_arrow_cache(get_arrow_cache_path(path), zero_copy=True)
+    assert df['poblacion'].tolist() == [100, 200]
+    assert not df['poblacion'].to_numpy().flags.writeable
+    assert read_arrow_cache(get_arrow_cache_path(path), zero_copy=False)['poblacion'].to_numpy().flags.writeable
+
+
+def test_raw_inputs_are_not_cached(processed_data_folder, tmp_path_factory):
+    path = tmp_path_factory.mktemp('raw') / 'cities_info.csv'
+    pd.DataFrame({'poblacion': [100, 200]}).to_csv(path, index=False)
+
+    assert read_dataframe(path)['poblacion'].tolist() == [100, 200]
+    assert not get_arrow_cache_path(path).exists()
+    assert not (path.parent / '.arrow_cache').exists()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from pv_stats.constants.csv_schemas import CITIES_INFO_SCHEMA, CONSUMPTION_PER_CITY_SCHEMA
+from pv_stats.utils.io_utils import read_csv_with_schema
+
+
+def test_read_csv_with_schema_cities_info(tmp_path):
+    csv_path = tmp_path / 'cities_info.csv'
+    csv_path.write_bytes(
+        'municipio_codigo;municipio_codigo_ine;municipio_nombre;nuts4_codigo;nuts4_nombre;'
+        'superficie_km2;densidad_por_km2\n'
+        '14;28014;  Aranjuez ;10;Comarca Sur;201.12;299.5\n'
+        '79;28079;Madrid;1;Madrid;604.45;5529.1\n'.encode('ISO-8859-1')
+    )
+    df = read_csv_with_schema(csv_path, CITIES_INFO_SCHEMA)
+
+    assert df['municipio_codigo'].dtype == np.int32
+    assert df['superficie_km2'].dtype == np.float64
+    assert df['municipio_nombre'].tolist() == ['Aranjuez', 'Madrid']
+
+
+def test_read_csv_with_schema_consumption_thousands(tmp_path):
+    csv_path = tmp_path / 'consumption.csv'
+    csv_path.write_bytes(
+        'Nombre,2020,2021\n'
+        'Alcalá de Henares ,"1.234.567","1.200.000"\n'
+        'Ajalvir,950,-\n'.encode('ISO-8859-1')
+    )
+    df = read_csv_with_schema(csv_path, CONSUMPTION_PER_CITY_SCHEMA)
+
+    assert df['Nombre'].tolist() == ['Alcalá de Henares', 'Ajalvir']
+    assert df['2020'].dtype == np.int64
+    assert df['2020'].tolist() == [1234567, 950]
+    # Values that are not numbers are nulls, as with `pd.to_numeric(errors='coerce')`
+    assert df['2021'].iloc[0] == 1200000
+    assert pd.isna(df['2021'].iloc[1])
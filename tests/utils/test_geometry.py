@@ -0,0 +1,78 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from pv_stats.utils.geometry import compute_areas, get_resolution_tolerance, resolve_overlaps, simplify_coverage
+
+
+@pytest.fixture
+def coverage() -> gpd.GeoDataFrame:
+    # Four squares whose shared borders are a dense zigzag
+    border = np.linspace(0, 2000, 401)
+    zigzag = np.where(np.arange(401) % 2 == 0, 1000, 1002)
+    vertical = shapely.linestrings(np.c_[zigzag, border])
+    horizontal = shapely.linestrings(np.c_[border, zigzag])
+    lines = [vertical, horizontal, shapely.box(0, 0, 2000, 2000).boundary]
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(shapely.node(shapely.union_all(lines)))))
+    return gpd.GeoDataFrame({'id': range(len(faces))}, geometry=faces, crs='EPSG:25830')
+
+
+def test_simplify_coverage_reduces_coordinates_without_gaps_or_overlaps(coverage):
+    simplified = simplify_coverage(coverage, tolerance=10, precision=1)
+    geometries = simplified.geometry.values
+
+    assert len(simplified) == 4
+    assert shapely.get_num_coordinates(geometries).sum() < shapely.get_num_coordinates(coverage.geometry.values).sum() / 10
+    assert shapely.union_all(geometries).area == pytest.approx(2000 * 2000)
+    assert sum(geometries.area) == pytest.approx(2000 * 2000)
+
+
+def test_simplify_coverage_keeps_the_geographic_crs(coverage):
+    geographic = coverage.to_crs('EPSG:4326')
+
+    simplified = simplify_coverage(geographic, tolerance=10, precision=1)
+
+    assert simplified.crs == geographic.crs
+    np.testing.assert_allclose(simplified.total_bounds, geographic.total_bounds, atol=1e-4)
+    assert sum(compute_areas(simplified)) == pytest.approx(sum(compute_areas(coverage)), rel=1e-3)
+
+
+def test_get_resolution_tolerance_raises_error_unknown_level():
+    with pytest.raises(ValueError):
+        get_resolution_tolerance('ultra')
+
+
+def test_compute_areas_in_equal_area_crs():
+    squares = gpd.GeoSeries([shapely.box(440000, 4470000, 441000, 4471000)], crs='EPSG:25830')
+    geographic = squares.to_crs('EPSG:4326')
+    # The same square gives the same area whatever the CRS of the source
+    np.testing.assert_allclose(compute_areas(geographic), compute_areas(squares), rtol=1e-6)
+    np.testing.assert_allclose(compute_areas(squares), [1_000_000], rtol=1e-3)
+
+    with pytest.raises(ValueError):
+        compute_areas(gpd.GeoSeries([shapely.box(0, 0, 1, 1)]))
+
+
+def test_resolve_overlaps_keeps_the_area_of_the_union():
+    boxes = [shapely.box(0, 0, 10, 10), shapely.box(5, 0, 15, 10), shapely.box(10, 0, 20, 10),
+             shapely.box(2, 2, 4, 4), shapely.box(20, 0, 30, 10)]
+    geo_df = gpd.GeoDataFrame({'id': range(5)}, geometry=boxes, crs='EPSG:25830')
+    resolved = resolve_overlaps(geo_df, rank=np.array([1, 0, 0, 0, 0]))
+
+    # The small box is inside the first one, but it precedes it and keeps its area, the
+    # box that only touches the third one is not cut
+    assert resolved['id'].tolist() == [0, 1, 2, 3, 4]
+    assert resolved.geometry.area.tolist() == pytest.approx([46, 100, 50, 4, 100])
+    assert resolved.geometry.area.sum() == pytest.approx(shapely.union_all(boxes).area)
+
+
+def test_resolve_overlaps_drops_the_covered_polygons():
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 1000, size=(2000, 2))
+    boxes = shapely.box(corners[:, 0], corners[:, 1], corners[:, 0] + 30, corners[:, 1] + 30)
+    geo_df = gpd.GeoDataFrame({'id': range(len(boxes))}, geometry=boxes, crs='EPSG:25830')
+    resolved = resolve_overlaps(geo_df, rank=np.zeros(len(boxes)))
+
+    assert len(resolved) < len(boxes)
+    assert resolved.geometry.area.sum() == pytest.approx(shapely.union_all(boxes).area)
@@ -0,0 +1,63 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pv_stats.utils.instrumentation as instrumentation
+from pv_stats.config.config import settings
+from pv_stats.utils.instrumentation import MetricsRecorder, instrument
+
+
+@instrument('process')
+def _filter_even(df: pd.DataFrame) -> pd.DataFrame:
+    return df[df['value'] % 2 == 0]
+
+
+@instrument('process')
+def _allocate_and_release(n_bytes: int) -> None:
+    allocated = np.ones(n_bytes // 8)
+    time.sleep(0.2)
+    del allocated
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = MetricsRecorder()
+    monkeypatch.setattr(instrumentation, '_recorder', recorder)
+    previous = settings.logging.metrics.enabled
+    settings.set('logging.metrics.enabled', True)
+    yield recorder
+    settings.set('logging.metrics.enabled', previous)
+
+
+def test_instrument_records_stage_metrics(recorder, tmp_path):
+    _filter_even(pd.DataFrame({'value': range(10)}))
+
+    stage, = recorder.stages
+    assert stage['stage'] == 'test_instrumentation._filter_even'
+    assert stage['category'] == 'process'
+    assert (stage['rows_in'], stage['rows_out']) == (10, 5)
+    assert stage['wall_s'] >= 0 and stage['cpu_s'] >= 0 and stage['peak_rss_mb'] > 0
+
+    report_path = recorder.write_report(tmp_path)
+    assert json.loads(report_path.read_text())['stages'][0]['rows_out'] == 5
+    trace = json.loads((tmp_path / f'trace_{recorder.run_name}.json').read_text())
+    assert trace['traceEvents'][0]['ph'] == 'X'
+
+
+def test_instrument_samples_the_peak_rss_of_each_stage(recorder):
+    _allocate_and_release(200 * 2 ** 20)
+    _filter_even(pd.DataFrame({'value': range(10)}))
+
+    allocating, filtering = recorder.stages
+    # The memory released before the end of the stage is counted, and not in the next stages
+    assert allocating['peak_rss_mb'] - filtering['peak_rss_mb'] > 150
+
+
+def test_instrument_disabled_does_not_record(monkeypatch):
+    recorder = MetricsRecorder()
+    monkeypatch.setattr(instrumentation, '_recorder', recorder)
+    _filter_even(pd.DataFrame({'value': range(10)}))
+    assert recorder.stages == []
@@ -0,0 +1,45 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from pv_stats.utils.land_use_raster import rasterize_land_use
+
+
+@pytest.fixture
+def raster(tmp_path):
+    land_use_df = gpd.GeoDataFrame({'ID_USO_MAX': [2110, 5000, 2110]},
+                                   geometry=[shapely.box(0, 0, 1000, 500),
+                                             shapely.box(0, 500, 1000, 1000),
+                                             shapely.box(1000, 0, 2000, 1000)],
+                                   crs='EPSG:25830')
+    return rasterize_land_use(land_use_df, tmp_path / 'land_use.grid', resolution=10)
+
+
+def test_zonal_areas_per_municipality(raster):
+    zones = gpd.GeoDataFrame({'municipio_id': [28014, 28079]},
+                             geometry=[shapely.box(0, 0, 1000, 1000), shapely.box(1000, 0, 2000, 1000)],
+                             crs='EPSG:25830')
+    areas = raster.zonal_areas(zones, 'municipio_id')
+    assert areas.loc[28014, 2110] == pytest.approx(500_000)
+    assert areas.loc[28014, 5000] == pytest.approx(500_000)
+    assert areas.loc[28079, 2110] == pytest.approx(1_000_000)
+    assert areas.loc[28079, 5000] == 0
+
+
+def test_class_areas_inside_perimeter(raster):
+    assert raster.class_areas().to_dict() == pytest.approx({2110: 1_500_000, 5000: 500_000})
+    areas = raster.class_areas(shapely.box(500, 250, 1500, 750))
+    assert areas.to_dict() == pytest.approx({2110: 375_000, 5000: 125_000})
+
+
+def test_zone_grid_is_burnt_once_per_zones(raster, tmp_path):
+    zones = gpd.GeoDataFrame({'municipio_id': [28014]}, geometry=[shapely.box(0, 0, 1000, 1000)], crs='EPSG:25830')
+    first = raster.zonal_areas(zones, 'municipio_id')
+    assert len(list(tmp_path.glob('land_use.zones_*.grid'))) == 1
+    assert raster.zonal_areas(zones, 'municipio_id').equals(first)
+    assert len(list(tmp_path.glob('land_use.zones_*.grid'))) == 1
+
+    other_zones = gpd.GeoDataFrame({'municipio_id': [28014]}, geometry=[shapely.box(0, 0, 500, 1000)],
+                                   crs='EPSG:25830')
+    assert raster.zonal_areas(other_zones, 'municipio_id').loc[28014, 2110] == pytest.approx(250_000)
+    assert len(list(tmp_path.glob('land_use.zones_*.grid'))) == 2
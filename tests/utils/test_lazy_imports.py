@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+from pv_stats.utils.lazy_imports import lazy_import
+
+
+def test_lazy_import_loads_module_on_first_use():
+    json_module = lazy_import('json')
+    assert json_module.dumps({'a': 1}) == '{"a": 1}'
+
+
+def test_package_import_does_not_load_heavy_dependencies():
+    code = ("import sys\n"
+            "import pv_stats.ree.ree_api, pv_stats.utils.io_utils, pv_stats.map_electricity_coverage\n"
+            "from pv_stats.config.config import settings\n"
+            "loaded = [name for name in ('geopandas', 'shapely', 'fiona', 'matplotlib') if name in sys.modules]\n"
+            "assert not loaded, loaded\n"
+            "assert not settings.configured\n")
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from pv_stats.utils.municipality_registry import (add_municipality_aliases, attach_municipality_key,
+                                                  build_municipality_registry, load_municipality_registry,
+                                                  merge_municipalities, normalize_municipality_names,
+                                                  update_municipality_registry)
+
+
+@pytest.fixture
+def registry() -> pd.DataFrame:
+    cities_info_df = pd.DataFrame({'municipio_codigo': [14, 79, 123],
+                                   'municipio_codigo_ine': [28014, 28079, 28127],
+                                   'municipio_nombre': ['Aranjuez', 'Madrid', 'Rozas de Madrid, Las']})
+    return build_municipality_registry(cities_info_df)
+
+
+def test_normalize_municipality_names_moves_articles_and_removes_accents():
+    names = pd.Series(['Boalo, El', 'El Boalo', ' Escorial (El)', 'Alcalá de Henares', 'San Martín de la Vega'])
+    assert normalize_municipality_names(names).tolist() == ['el boalo', 'el boalo', 'el escorial',
+                                                            'alcala de henares', 'san martin de la vega']
+
+
+def test_attach_municipality_key_by_code_and_name(registry):
+    consumption_df = pd.DataFrame({'Nombre': ['Las Rozas de Madrid', 'MADRID', 'Atlantis']})
+    attach_municipality_key(consumption_df, 'Nombre', 'nombre', registry)
+    assert consumption_df['municipio_id'].tolist() == [28127, 28079, pd.NA]
+
+    divisions_df = pd.DataFrame({'CD_MUNICIPIO': [79, 14]})
+    attach_municipality_key(divisions_df, 'CD_MUNICIPIO', 'municipio_codigo', registry)
+    assert divisions_df['municipio_id'].tolist() == [28079, 28014]
+
+
+def test_merge_municipalities_keeps_requested_rows(registry):
+    left = pd.DataFrame({'municipio_id': pd.array([28014, 28079], dtype='Int32'), 'a': [1, 2]})
+    right = pd.DataFrame({'municipio_id': pd.array([28079, 28127], dtype='Int32'), 'b': [3, 4]})
+    assert merge_municipalities(left, right)['municipio_id'].tolist() == [28079]
+    assert len(merge_municipalities(left, right, how='left')) == 2
+    assert len(merge_municipalities(left, right, how='outer')) == 3
+
+
+def test_merge_municipalities_never_pairs_null_keys():
+    left = pd.DataFrame({'municipio_id': pd.array([28014, None], dtype='Int32'), 'a': [1, 2]})
+    right = pd.DataFrame({'municipio_id': pd.array([28014, None, None], dtype='Int32'), 'b': [3, 4, 5]})
+    assert merge_municipalities(left, right)[['a', 'b']].values.tolist() == [[1, 3]]
+    assert merge_municipalities(left, right, how='left')['a'].tolist() == [1, 2]
+    assert merge_municipalities(left, right, how='right')['b'].tolist() == [3, 4, 5]
+    outer = merge_municipalities(left, right, how='outer')
+    assert len(outer) == 4
+    assert outer['a'].isna().sum() == 2 and outer['b'].isna().sum() == 1
+
+
+def test_update_municipality_registry_keeps_the_aliases_of_other_sources(registry, processed_data_folder):
+    update_municipality_registry(registry)
+    divisions_df = pd.DataFrame({'municipio_id': [28079], 'DS_NOMBRE': ['Madrid (Villa)']})
+    update_municipality_registry(add_municipality_aliases(load_municipality_registry(), divisions_df,
+                                                          'DS_NOMBRE', 'nombre'))
+
+    # Processing the cities info again does not remove the aliases of the divisions
+    update_municipality_registry(registry)
+    consumption_df = pd.DataFrame({'Nombre': ['Madrid Villa']})
+    attach_municipality_key(consumption_df, 'Nombre', 'nombre', load_municipality_registry())
+    assert consumption_df['municipio_id'].tolist() == [28079]
@@ -0,0 +1,74 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+import pv_stats.land_use as land_use
+import pv_stats.utils.df_processing as df_processing
+import pv_stats.utils.municipality_registry as municipality_registry
+from pv_stats.config.config import settings
+
+
+@pytest.fixture
+def partition_settings(tmp_path):
+    previous = dict(settings.partitioning)
+    settings.set('partitioning', {'enabled': False, 'folder': str(tmp_path / 'partitions'),
+                                  'batch_size': 7, 'cells_per_axis': 3, 'workers': 2})
+    yield
+    settings.set('partitioning', previous)
+
+
+@pytest.fixture
+def land_use_path(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    n_rows = 60
+    x, y = rng.uniform(400000, 460000, n_rows), rng.uniform(4440000, 4500000, n_rows)
+    land_use_df = gpd.GeoDataFrame({'ID_USO_MAX': rng.choice([2110, 3110, 5000, 1100], n_rows),
+                                    'MUNICIPIO': rng.choice([28014, 28079], n_rows),
+                                    'MUNICIPIO_NOMBRE': 'Madrid',
+                                    'SUPERF_M2': rng.uniform(100, 10000, n_rows)},
+                                   geometry=shapely.box(x, y, x + 50, y + 50), crs='EPSG:25830')
+    land_use_df.loc[land_use_df['MUNICIPIO'] == 28014, 'MUNICIPIO_NOMBRE'] = 'Aranjuez'
+    path = tmp_path / '28_MADRID.gpkg'
+    land_use_df.to_file(path, layer='SAR_28_T_USOS')
+
+    registry = pd.DataFrame({'alias_type': 'municipio_codigo_ine', 'alias': ['28014', '28079'],
+                             'municipio_id': [28014, 28079]}).astype({'alias': 'string', 'municipio_id': 'int32'})
+    monkeypatch.setattr(municipality_registry, 'load_municipality_registry', lambda: registry)
+    monkeypatch.setattr(df_processing, 'save_geo_dataframe', lambda *args, **kwargs: None)
+    monkeypatch.setattr(land_use, 'save_dataframe', lambda *args, **kwargs: None)
+    return path
+
+
+def test_partitioned_land_use_matches_in_memory(partition_settings, land_use_path):
+    in_memory = df_processing.process_land_use_df(land_use_path, partitioned=False)
+    partitioned = df_processing.process_land_use_df([land_use_path], partitioned=True)
+    pd.testing.assert_frame_equal(partitioned, in_memory, check_like=False)
+
+
+def test_partitioned_filter_land_use_matches_in_memory(partition_settings, land_use_path, tmp_path):
+    parquet_path = tmp_path / 'land_use_full.parquet'
+    gpd.read_file(land_use_path).to_parquet(parquet_path)
+    in_memory = land_use.filter_land_use(parquet_path, partitioned=False)
+    partitioned = land_use.filter_land_use(parquet_path, partitioned=True)
+    pd.testing.assert_frame_equal(partitioned, in_memory)
+    # The zones are joined on the municipality key, with the names of the land use
+    assert in_memory['municipio_id'].tolist() == [28014, 28079]
+    assert in_memory['MUNICIPIO_NOMBRE'].tolist() == ['Aranjuez', 'Madrid']
+
+
+def test_partitioned_urban_zones_match_in_memory(partition_settings, processed_data_folder, tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    x, y = rng.uniform(400000, 460000, 40), rng.uniform(4440000, 4500000, 40)
+    urban_zones_df = gpd.GeoDataFrame({'zona': rng.choice(['A', 'B'], 40)},
+                                      geometry=shapely.box(x, y, x + 100, y + 100), crs='EPSG:25830')
+    urban_zones_path = tmp_path / 'urban_zones.gpkg'
+    urban_zones_df.to_file(urban_zones_path)
+    monkeypatch.setattr(df_processing, 'save_geo_dataframe', lambda *args, **kwargs: None)
+
+    in_memory = df_processing.process_urban_zones_df(urban_zones_path, partitioned=False)
+    partitioned = df_processing.process_urban_zones_df(urban_zones_path, partitioned=True)
+    pd.testing.assert_frame_equal(partitioned, in_memory, check_index_type=False)
+    # The partitions of the run are removed
+    assert list((tmp_path / 'partitions').iterdir()) == []
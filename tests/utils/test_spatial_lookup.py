@@ -0,0 +1,45 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+
+from pv_stats.utils.spatial_lookup import SpatialIndex
+
+
+def _municipalities_index() -> SpatialIndex:
+    geo_df = gpd.GeoDataFrame({'municipio_id': [28014, 28079], 'municipio_nombre': ['Aranjuez', 'Madrid']},
+                              geometry=[shapely.box(0, 0, 1000, 1000), shapely.box(1000, 0, 2000, 1000)],
+                              crs='EPSG:25830')
+    return SpatialIndex.from_geo_dataframe(geo_df, ['municipio_id', 'municipio_nombre'])
+
+
+def test_query_points_returns_polygon_per_point():
+    result = _municipalities_index().query_points([1500, 10, 5000], [500, 10, 5000])
+    assert result['municipio_nombre'].tolist()[:2] == ['Madrid', 'Aranjuez']
+    # The ids stay integers when a point is outside every polygon
+    assert result['municipio_id'].dtype == 'Int64'
+    assert result['municipio_id'].tolist()[:2] == [28079, 28014]
+    assert pd.isna(result['municipio_id'].iloc[2])
+
+
+def test_query_geometries_returns_largest_overlap():
+    result = _municipalities_index().query_geometries([shapely.box(900, 0, 1500, 100)])
+    assert result['municipio_id'].tolist() == [28079]
+
+
+def test_spatial_index_save_and_load(tmp_path):
+    index = _municipalities_index()
+    index.save(tmp_path / 'municipalities.idx')
+    loaded = SpatialIndex.load(tmp_path / 'municipalities.idx')
+    # The coordinates are reprojected to the CRS of the index
+    lon, lat = pyproj.Transformer.from_crs('EPSG:25830', 'EPSG:4326', always_xy=True).transform(500, 500)
+    assert loaded.query_points([lon], [lat], crs='EPSG:4326')['municipio_id'].tolist() == [28014]
+    np.testing.assert_array_equal(shapely.area(loaded.geometries), shapely.area(index.geometries))
+
+
+def test_overlay_geometries_splits_at_the_boundaries():
+    result = _municipalities_index().overlay_geometries([shapely.box(900, 0, 1500, 100), shapely.box(10, 10, 20, 20)])
+    assert result['query_idx'].tolist() == [0, 0, 1]
+    assert result['municipio_id'].tolist() == [28014, 28079, 28014]
+    np.testing.assert_allclose(shapely.area(result['geometry'].to_numpy()), [10000, 50000, 100])
@@ -0,0 +1,183 @@
+import gzip
+import sqlite3
+import struct
+
+import geopandas as gpd
+import pytest
+import shapely
+
+from pv_stats.utils.vector_tiles import encode_tile_layer, export_vector_tiles, tile_bounds, tiles_in_bounds
+
+
+def _read_varint(data: bytes, position: int):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def _read_message(data: bytes) -> list:
+    """ Fields of a protobuf message as (number, value) pairs, the length delimited ones as bytes. """
+    fields, position = [], 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, position = _read_varint(data, position)
+        elif wire_type == 1:
+            value, position = struct.unpack('<d', data[position:position + 8])[0], position + 8
+        else:
+            length, position = _read_varint(data, position)
+            value, position = data[position:position + length], position + length
+        fields.append((number, value))
+    return fields
+
+
+def _read_packed(data: bytes) -> list:
+    values, position = [], 0
+    while position < len(data):
+        value, position = _read_varint(data, position)
+        values.append(value)
+    return values
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _decode_value(data: bytes):
+    (number, value), = _read_message(data)
+    return {1: lambda: value.decode('utf-8'), 3: lambda: value, 6: lambda: _unzigzag(value),
+            7: lambda: bool(value)}[number]()
+
+
+def _decode_layer(tile: bytes) -> dict:
+    """ Decode the single layer of a tile, with the attributes and commands of each feature. """
+    (number, layer), = _read_message(tile)
+    assert number == 3
+    fields = _read_message(layer)
+    keys = [value.decode('utf-8') for number, value in fields if number == 3]
+    values = [_decode_value(value) for number, value in fields if number == 4]
+    features = []
+    for number, feature in fields:
+        if number != 2:
+            continue
+        feature = dict(_read_message(feature))
+        tags = _read_packed(feature.get(2, b''))
+        features.append({'id': feature[1], 'type': feature[3], 'commands': _read_packed(feature[4]),
+                         'attributes': {keys[key]: values[value] for key, value in zip(tags[::2], tags[1::2])}})
+    return {'name': dict(fields)[1].decode('utf-8'), 'extent': dict(fields)[5], 'version': dict(fields)[15],
+            'keys': keys, 'values': values, 'features': features}
+
+
+def _decode_rings(commands: list) -> list:
+    """ Absolute coordinates of the rings of the MVT commands, closed by their ClosePath. """
+    rings, x, y, position = [], 0, 0, 0
+    while position < len(commands):
+        command_id, count = commands[position] & 0x7, commands[position] >> 3
+        position += 1
+        if command_id == 7:
+            rings[-1].append(rings[-1][0])
+            continue
+        if command_id == 1:
+            rings.append([])
+        for _ in range(count):
+            x, y = x + _unzigzag(commands[position]), y + _unzigzag(commands[position + 1])
+            rings[-1].append((x, y))
+            position += 2
+    return rings
+
+
+def _area_in_tile(ring: list) -> float:
+    # Positive if clockwise with the y axis down, as the exterior rings of the MVT
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:])) / 2
+
+
+def test_tiles_in_bounds_covers_tile_bounds():
+    bounds = tile_bounds(10, 501, 386)
+    inner_bounds = (bounds[0] + 1, bounds[1] + 1, bounds[2] - 1, bounds[3] - 1)
+    assert tiles_in_bounds(10, inner_bounds) == [(501, 386)]
+    # Half a tile more to the right and below touches the neighbours
+    tile_size = bounds[2] - bounds[0]
+    wider_bounds = (bounds[0] + 1, bounds[1] - tile_size / 2, bounds[2] + tile_size / 2, bounds[3] - 1)
+    assert tiles_in_bounds(10, wider_bounds) == [(501, 386), (501, 387), (502, 386), (502, 387)]
+
+
+def test_export_vector_tiles_writes_every_zoom(tmp_path):
+    polygons = [shapely.box(-3.8, 40.3, -3.7, 40.4), shapely.box(-3.7, 40.3, -3.6, 40.4)]
+    geo_df = gpd.GeoDataFrame({'municipio': ['A', 'B'], 'covered_percentage': [0.25, 0.5]},
+                              geometry=polygons, crs='EPSG:4326')
+    saving_path = export_vector_tiles(geo_df, tmp_path / 'coverage.mbtiles', 'coverage',
+                                      min_zoom=5, max_zoom=8, columns=['municipio'], workers=1)
+
+    connection = sqlite3.connect(saving_path)
+    zooms = [zoom for zoom, in connection.execute('SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level')]
+    metadata = dict(connection.execute('SELECT name, value FROM metadata'))
+    # Madrid is in the tile x=15, y=12 at zoom 5, stored with the TMS row
+    tile = connection.execute('SELECT tile_column, tile_row FROM tiles WHERE zoom_level = 5').fetchone()
+    connection.close()
+
+    assert zooms == [5, 6, 7, 8]
+    assert metadata['format'] == 'pbf'
+    assert '"municipio"' in metadata['json'] and 'covered_percentage' not in metadata['json']
+    assert tile == (15, 2 ** 5 - 1 - 12)
+
+
+def test_encode_tile_layer_commands_and_attributes():
+    # Rings in the winding of shapely, which the tiles need the other way round
+    polygon = shapely.Polygon([(10, 10), (20, 10), (20, 20), (10, 20)],
+                              holes=[[(12, 12), (12, 14), (14, 14), (14, 12)]])
+    square = shapely.box(30, 30, 31, 31)
+    tile = encode_tile_layer('coverage', [polygon, square],
+                             [{'municipio': 'A', 'poblacion': -5, 'covered': 0.25, 'urbano': True},
+                              {'municipio': 'A', 'poblacion': None}],
+                             feature_ids=[7, 8], extent=4096)
+
+    layer = _decode_layer(tile)
+    assert (layer['name'], layer['extent'], layer['version']) == ('coverage', 4096, 2)
+    # The repeated keys and values are stored once
+    assert layer['keys'] == ['municipio', 'poblacion', 'covered', 'urbano']
+    assert layer['values'] == ['A', -5, 0.25, True]
+    polygon_feature, square_feature = layer['features']
+    assert polygon_feature['attributes'] == {'municipio': 'A', 'poblacion': -5, 'covered': 0.25, 'urbano': True}
+    assert square_feature['attributes'] == {'municipio': 'A'}
+    assert (polygon_feature['id'], polygon_feature['type']) == (7, 3)
+
+    # MoveTo of one point, LineTo of three and ClosePath, for each ring
+    commands = polygon_feature['commands']
+    assert commands[0] == 9 and commands[3] == 26 and commands[10] == 15
+    assert commands[11] == 9 and commands[14] == 26 and commands[21] == 15
+    assert commands[1:3] == [20, 20]
+    exterior, interior = _decode_rings(commands)
+    assert set(exterior) == set(polygon.exterior.coords)
+    assert set(interior) == set(polygon.interiors[0].coords)
+    assert _area_in_tile(exterior) > 0 > _area_in_tile(interior)
+    # The cursor starts again at the origin in each feature
+    assert set(_decode_rings(square_feature['commands'])[0]) == set(square.exterior.coords)
+
+
+def test_export_vector_tiles_decodes_the_polygons(tmp_path):
+    geo_df = gpd.GeoDataFrame({'municipio': ['A'], 'covered_percentage': [0.25]},
+                              geometry=[shapely.box(-3.8, 40.3, -3.7, 40.4)], crs='EPSG:4326')
+    saving_path = export_vector_tiles(geo_df, tmp_path / 'coverage.mbtiles', 'coverage',
+                                      min_zoom=5, max_zoom=5, workers=1)
+
+    connection = sqlite3.connect(saving_path)
+    tile, = connection.execute('SELECT tile_data FROM tiles').fetchone()
+    connection.close()
+
+    feature, = _decode_layer(gzip.decompress(tile))['features']
+    assert feature['type'] == 3
+    assert feature['attributes'] == {'municipio': 'A', 'covered_percentage': 0.25}
+    exterior, = _decode_rings(feature['commands'])
+    assert _area_in_tile(exterior) > 0
+
+
+@pytest.mark.parametrize('zoom', [0, 3, 12])
+def test_tile_bounds_size(zoom):
+    min_x, min_y, max_x, max_y = tile_bounds(zoom, 0, 0)
+    assert max_x - min_x == pytest.approx(max_y - min_y)